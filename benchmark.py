@@ -0,0 +1,417 @@
+"""
+Load benchmark for the reservation API.
+
+    python3 benchmark.py seed --scale 100k
+    python3 benchmark.py run --scenario host-polling --concurrency 16 --duration 30 --output before.json
+    python3 benchmark.py compare before.json after.json
+
+`seed` bulk-inserts synthetic customers, tables, reservations and waitlist entries
+into --database (a scratch benchmark.db by default, never the app's database
+unless asked). `run` drives a live server (--url, or one it starts itself with
+uvicorn on --database) with a scenario mix and writes per-route latency
+percentiles and throughput as JSON. `compare` diffs two result files and exits
+non-zero when a route's p95 regressed past the threshold.
+"""
+import argparse
+import datetime as dt
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import urllib.error
+import urllib.request
+from time import monotonic, sleep
+
+ADMIN_KEY = "admin-secret-key-2024"
+PUBLIC_KEY = "public-booking-key"
+
+BENCH_DATABASE_URL = "sqlite:///./benchmark.db"
+SCALES = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000, "10m": 10_000_000}
+SEED_BATCH_ROWS = 10_000
+BENCH_TABLES = [("Indoor", 2)] * 8 + [("Indoor", 4)] * 10 + [("Indoor", 6)] * 4 + [("Indoor", 8)] * 2 + \
+    [("Outdoor", 2)] * 6 + [("Outdoor", 4)] * 6 + [("Outdoor", 6)] * 4
+RESERVATION_STATUSES = [("Completed", 70), ("Cancelled", 8), ("No-show", 5), ("Seated", 4), ("Queued", 13)]
+RESERVATION_TYPES = [("walk-in", 50), ("phone", 30), ("online", 20)]
+WAITLIST_STATUSES = [("Seated", 60), ("Cancelled", 25), ("Waiting", 10), ("Called", 5)]
+FIRST_NAMES = ["Aisha", "Ben", "Chen", "Dara", "Elif", "Farid", "Grace", "Hiro", "Ines", "Jonas", "Kemi", "Luca"]
+LAST_NAMES = ["Ng", "Okafor", "Patel", "Quinn", "Rossi", "Silva", "Tanaka", "Umar", "Vogel", "Wong"]
+
+def parse_scale(value: str) -> int:
+    value = value.lower()
+    if value in SCALES:
+        return SCALES[value]
+    try:
+        return int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"scale must be one of {', '.join(SCALES)} or a row count")
+
+def _weighted(rng, choices):
+    return rng.choices([value for value, _ in choices], weights=[weight for _, weight in choices])[0]
+
+def _insert_batches(engine, table, rows):
+    from sqlalchemy import insert
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= SEED_BATCH_ROWS:
+            with engine.begin() as connection:
+                connection.execute(insert(table), batch)
+            batch = []
+    if batch:
+        with engine.begin() as connection:
+            connection.execute(insert(table), batch)
+
+def seed(args):
+    # models reads its settings at import time
+    os.environ["DATABASE_URL"] = args.database
+    os.environ.setdefault("DEV_MODE", "1")
+    from sqlalchemy import func, select
+    from models import Customer, Reservation, Table, WaitlistEntry, engine, rebuild_rollups
+
+    rng = random.Random(args.seed)
+    reservations = args.scale
+    customers = max(reservations // 4, 1)
+    waitlist = max(reservations // 10, 1)
+    now = dt.datetime.now()
+    first_day = now - dt.timedelta(days=args.days)
+    started = monotonic()
+
+    with engine.begin() as connection:
+        customer_base = connection.execute(select(func.max(Customer.id))).scalar() or 0
+        existing_tables = connection.execute(
+            select(Table.id, Table.location).where(Table.table_number.like("BT%"))
+        ).all()
+    if not existing_tables:
+        _insert_batches(engine, Table.__table__, (
+            {"table_number": f"BT{i + 1}", "location": location, "size": size, "is_occupied": False}
+            for i, (location, size) in enumerate(BENCH_TABLES)
+        ))
+        with engine.begin() as connection:
+            existing_tables = connection.execute(
+                select(Table.id, Table.location).where(Table.table_number.like("BT%"))
+            ).all()
+
+    def random_created_at():
+        moment = first_day + dt.timedelta(seconds=rng.randrange(args.days * 86400))
+        # Bias towards service hours
+        return moment.replace(hour=rng.choice([11, 12, 12, 13, 13, 18, 19, 19, 20, 20, 21]))
+
+    _insert_batches(engine, Customer.__table__, (
+        {
+            "id": customer_base + i + 1,
+            "name": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+            "phone_number": f"+bench{args.seed}-{customer_base + i + 1}",
+            "email": f"guest{customer_base + i + 1}@example.com" if rng.random() < 0.6 else None,
+            "created_at": random_created_at(),
+        }
+        for i in range(customers)
+    ))
+
+    def reservation_rows():
+        for _ in range(reservations):
+            created_at = random_created_at()
+            status = _weighted(rng, RESERVATION_STATUSES)
+            table_id, location = rng.choice(existing_tables)
+            scheduled = rng.random() < 0.2
+            adults = rng.choice([1, 2, 2, 2, 3, 4, 4, 6])
+            yield {
+                "customer_id": customer_base + rng.randint(1, customers),
+                "table_id": table_id if status in ("Seated", "Completed") else None,
+                "adults": adults,
+                "children": rng.choice([0, 0, 0, 1, 2]),
+                "child_seat_required": rng.random() < 0.1,
+                "status": status,
+                "queue_number": rng.randint(1, 400),
+                "created_at": created_at,
+                "seated_at": created_at + dt.timedelta(minutes=rng.randint(0, 45)) if status in ("Seated", "Completed") else None,
+                "reservation_type": _weighted(rng, RESERVATION_TYPES),
+                "location": location,
+                "reservation_date": (created_at + dt.timedelta(days=rng.randint(1, 14))).date() if scheduled else None,
+                "reservation_time": f"{rng.choice([12, 13, 18, 19, 20]):02d}:{rng.choice([0, 30]):02d}" if scheduled else None,
+                "is_scheduled": scheduled,
+            }
+
+    def waitlist_rows():
+        for _ in range(waitlist):
+            created_at = random_created_at()
+            status = _weighted(rng, WAITLIST_STATUSES)
+            table_id, location = rng.choice(existing_tables)
+            yield {
+                "customer_id": customer_base + rng.randint(1, customers),
+                "table_id": table_id if status == "Seated" else None,
+                "adults": rng.choice([1, 2, 2, 3, 4]),
+                "children": rng.choice([0, 0, 1]),
+                "child_seat_required": False,
+                "location": location,
+                "status": status,
+                "created_at": created_at,
+                "seated_at": created_at + dt.timedelta(minutes=rng.randint(5, 60)) if status == "Seated" else None,
+                "estimated_wait_time": rng.choice([10, 15, 20, 30]),
+            }
+
+    if engine.dialect.name == "postgresql":
+        # Customers were inserted with explicit ids; move the serial past them
+        with engine.begin() as connection:
+            connection.exec_driver_sql(
+                "SELECT setval(pg_get_serial_sequence('customers', 'id'), (SELECT MAX(id) FROM customers))"
+            )
+    _insert_batches(engine, Reservation.__table__, reservation_rows())
+    _insert_batches(engine, WaitlistEntry.__table__, waitlist_rows())
+    # Bulk inserts bypass the ORM listeners that maintain rollups
+    with engine.begin() as connection:
+        buckets = rebuild_rollups(connection)
+    print(json.dumps({
+        "customers": customers,
+        "reservations": reservations,
+        "waitlist_entries": waitlist,
+        "rollup_buckets": buckets,
+        "seconds": round(monotonic() - started, 1),
+    }))
+
+# Scenario mixes: (weight, method, path, body factory or None, api key)
+def _walk_in_body(worker, sequence):
+    return {
+        "name": "Bench Walk-in",
+        "phone_number": f"+walkin-{os.getpid()}-{worker}-{sequence}",
+        "adults": random.choice([1, 2, 2, 3, 4]),
+        "children": random.choice([0, 0, 1]),
+        "location": random.choice(["Indoor", "Outdoor"]),
+        "reservation_type": "walk-in",
+    }
+
+SCENARIOS = {
+    "walk-in-surge": [
+        (6, "POST", "/reservations", _walk_in_body, PUBLIC_KEY),
+        (2, "GET", "/admin/queue", None, ADMIN_KEY),
+        (2, "GET", "/admin/waitlist", None, ADMIN_KEY),
+    ],
+    "host-polling": [
+        (3, "GET", "/admin/queue", None, ADMIN_KEY),
+        (3, "GET", "/admin/waitlist", None, ADMIN_KEY),
+        (2, "GET", "/admin/tables", None, ADMIN_KEY),
+        (1, "GET", "/admin/status", None, ADMIN_KEY),
+        (1, "GET", "/admin/reservations?limit=50", None, ADMIN_KEY),
+    ],
+    "dashboard-refresh": [
+        (2, "GET", "/admin/dashboard/analytics", None, ADMIN_KEY),
+        (1, "GET", "/admin/analytics/reservations?range=30d", None, ADMIN_KEY),
+        (1, "GET", "/admin/analytics/peak-hours", None, ADMIN_KEY),
+        (1, "GET", "/admin/analytics/no-show-rate", None, ADMIN_KEY),
+        (1, "GET", "/admin/analytics/group-size-over-time", None, ADMIN_KEY),
+        (1, "GET", "/admin/analytics/customer-frequency", None, ADMIN_KEY),
+        (1, "GET", "/admin/analytics/table-utilization", None, ADMIN_KEY),
+        (1, "GET", "/admin/analytics/waitlist", None, ADMIN_KEY),
+        (1, "GET", "/admin/reports/daily", None, ADMIN_KEY),
+    ],
+}
+SCENARIOS["mixed"] = SCENARIOS["walk-in-surge"] + SCENARIOS["host-polling"] + SCENARIOS["dashboard-refresh"]
+
+def _request(base_url, method, path, body, api_key, timeout):
+    data = json.dumps(body).encode() if body is not None else None
+    request = urllib.request.Request(base_url + path, data=data, method=method, headers={
+        "x-api-key": api_key,
+        "Content-Type": "application/json",
+    })
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as exc:
+        return exc.code
+    except (urllib.error.URLError, OSError):
+        return 0
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def _start_server(port, database):
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "models:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        # The scenarios authenticate with the static admin key; the session secret is throwaway
+        env=dict({"SECRET_KEY": "benchmark-session-secret"}, **os.environ, DATABASE_URL=database, ALLOW_STATIC_API_KEYS="1"),
+        # Keep the app's console output out of the JSON on stdout
+        stdout=sys.stderr
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = monotonic() + 60
+    while monotonic() < deadline:
+        if server.poll() is not None:
+            raise SystemExit("uvicorn exited before the server came up")
+        if _request(base_url, "GET", "/tables", None, PUBLIC_KEY, 2) == 200:
+            return server, base_url
+        sleep(0.2)
+    server.terminate()
+    raise SystemExit("Timed out waiting for the server to start")
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip() or None
+    except OSError:
+        return None
+
+def run(args):
+    mix = SCENARIOS[args.scenario]
+    weights = [entry[0] for entry in mix]
+    server = None
+    base_url = args.url.rstrip("/") if args.url else None
+    if base_url is None:
+        server, base_url = _start_server(_free_port(), args.database)
+
+    samples = {}
+    samples_lock = threading.Lock()
+    stop_at = [None]
+
+    def worker(worker_id):
+        rng = random.Random(args.seed + worker_id)
+        local = {}
+        sequence = 0
+        while monotonic() < stop_at[0]:
+            _, method, path, body_factory, api_key = rng.choices(mix, weights=weights)[0]
+            sequence += 1
+            body = body_factory(worker_id, sequence) if body_factory else None
+            started = monotonic()
+            status = _request(base_url, method, path, body, api_key, args.timeout)
+            elapsed_ms = (monotonic() - started) * 1000
+            route = f"{method} {path.split('?')[0]}"
+            latencies, errors = local.setdefault(route, ([], [0]))
+            latencies.append(elapsed_ms)
+            if not 200 <= status < 400:
+                errors[0] += 1
+        with samples_lock:
+            for route, (latencies, errors) in local.items():
+                merged = samples.setdefault(route, ([], [0]))
+                merged[0].extend(latencies)
+                merged[1][0] += errors[0]
+
+    try:
+        if args.warmup:
+            stop_at[0] = monotonic() + args.warmup
+            warmers = [threading.Thread(target=worker, args=(i,)) for i in range(args.concurrency)]
+            for thread in warmers:
+                thread.start()
+            for thread in warmers:
+                thread.join()
+            samples.clear()
+        started = monotonic()
+        stop_at[0] = started + args.duration
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = monotonic() - started
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    routes = {}
+    all_latencies = []
+    total_errors = 0
+    for route, (latencies, errors) in sorted(samples.items()):
+        latencies.sort()
+        all_latencies.extend(latencies)
+        total_errors += errors[0]
+        routes[route] = {
+            "requests": len(latencies),
+            "errors": errors[0],
+            "throughput_rps": round(len(latencies) / elapsed, 2),
+            "p50_ms": round(percentile(latencies, 0.50), 2),
+            "p95_ms": round(percentile(latencies, 0.95), 2),
+            "p99_ms": round(percentile(latencies, 0.99), 2),
+            "max_ms": round(latencies[-1], 2),
+        }
+    all_latencies.sort()
+    result = {
+        "revision": _git_revision(),
+        "scenario": args.scenario,
+        "concurrency": args.concurrency,
+        "duration_s": round(elapsed, 2),
+        "started_at": dt.datetime.now().isoformat(timespec="seconds"),
+        "total": {
+            "requests": len(all_latencies),
+            "errors": total_errors,
+            "throughput_rps": round(len(all_latencies) / elapsed, 2),
+            "p50_ms": round(percentile(all_latencies, 0.50), 2) if all_latencies else None,
+            "p95_ms": round(percentile(all_latencies, 0.95), 2) if all_latencies else None,
+            "p99_ms": round(percentile(all_latencies, 0.99), 2) if all_latencies else None,
+        },
+        "routes": routes,
+    }
+    output = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    print(output)
+
+def compare(args):
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+    regressions = []
+    for route, current in sorted(candidate["routes"].items()):
+        previous = baseline["routes"].get(route)
+        if not previous or not previous["p95_ms"]:
+            print(f"{route:50} new")
+            continue
+        change = (current["p95_ms"] - previous["p95_ms"]) / previous["p95_ms"] * 100
+        flag = ""
+        if change > args.threshold:
+            regressions.append(route)
+            flag = "  REGRESSION"
+        print(f"{route:50} p95 {previous['p95_ms']:>9.2f} -> {current['p95_ms']:>9.2f} ms ({change:+.1f}%){flag}")
+    if regressions:
+        sys.exit(1)
+
+def main():
+    parser = argparse.ArgumentParser(description="Restaurant reservation API load benchmark")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    seed_parser = commands.add_parser("seed", help="Bulk-insert synthetic data into a benchmark database")
+    seed_parser.add_argument("--scale", type=parse_scale, default="10k", help="Reservations to generate: 10k, 100k, 1m, 10m or a number")
+    seed_parser.add_argument("--days", type=int, default=365, help="Spread history over this many past days")
+    seed_parser.add_argument("--seed", type=int, default=1)
+    seed_parser.add_argument("--database", default=BENCH_DATABASE_URL, help=f"Database URL to fill (default {BENCH_DATABASE_URL})")
+    seed_parser.set_defaults(func=seed)
+
+    run_parser = commands.add_parser("run", help="Drive the API with a scenario mix and report latency percentiles")
+    run_parser.add_argument("--scenario", choices=sorted(SCENARIOS), default="mixed")
+    run_parser.add_argument("--concurrency", type=int, default=8)
+    run_parser.add_argument("--duration", type=float, default=30, help="Measured seconds")
+    run_parser.add_argument("--warmup", type=float, default=3, help="Unmeasured seconds before the run")
+    run_parser.add_argument("--timeout", type=float, default=30, help="Per-request timeout in seconds")
+    run_parser.add_argument("--url", help="Base URL of a running server; by default one is started with uvicorn")
+    run_parser.add_argument("--output", help="Also write the JSON result to this file")
+    run_parser.add_argument("--seed", type=int, default=1)
+    run_parser.add_argument("--database", default=BENCH_DATABASE_URL, help="Database URL for the server started without --url")
+    run_parser.set_defaults(func=run)
+
+    compare_parser = commands.add_parser("compare", help="Compare two result files route by route")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("candidate")
+    compare_parser.add_argument("--threshold", type=float, default=10, help="Fail when p95 grows by more than this percent")
+    compare_parser.set_defaults(func=compare)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
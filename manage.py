@@ -0,0 +1,143 @@
+import argparse
+import asyncio
+import signal
+import threading
+
+def rebuild_rollups_command(args):
+    from models import engine, rebuild_rollups
+    with engine.begin() as connection:
+        buckets = rebuild_rollups(connection)
+    print(f"Rebuilt analytics rollups: {buckets} buckets")
+
+def refresh_snapshots_command(args):
+    from models import refresh_snapshots
+    for name, status in refresh_snapshots(rebuild=args.rebuild).items():
+        print(f"{name}: {status['rows']} rows, exported up to {status['watermark'] or 'nothing yet'}")
+
+def import_command(args):
+    import json
+    from models import import_format, import_records
+    with open(args.file, "rb") as stream:
+        summary = import_records(args.dataset, stream, import_format(args.file, args.format))
+    print(json.dumps(summary, indent=2, default=str))
+
+def create_admin_command(args):
+    import getpass
+    from models import AdminUser, SessionLocal, hash_password
+    password = getpass.getpass(f"Password for {args.username}: ")
+    if not password or password != getpass.getpass("Repeat password: "):
+        raise SystemExit("Passwords are empty or do not match")
+    db = SessionLocal()
+    try:
+        if db.query(AdminUser).filter(AdminUser.username == args.username).first():
+            raise SystemExit(f"User {args.username} already exists")
+        db.add(AdminUser(username=args.username, password_hash=hash_password(password), role=args.role, is_active=True))
+        db.commit()
+    finally:
+        db.close()
+    print(f"Created {args.role} user {args.username}")
+
+def dispatch_notifications_command(args):
+    from models import notification_dispatcher
+    if args.once:
+        total = 0
+        while True:
+            handled = notification_dispatcher.dispatch_once()
+            if not handled:
+                break
+            total += handled
+        print(f"Dispatched {total} notifications")
+        return
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.set())
+    notification_dispatcher.start()
+    print(f"Dispatching notifications with {notification_dispatcher.workers} workers (Ctrl+C to stop)")
+    try:
+        stopping.wait()
+    except KeyboardInterrupt:
+        pass
+    notification_dispatcher.stop()
+
+async def _smtp_sink_session(reader, writer, stats):
+    writer.write(b"220 smtp-sink ready\r\n")
+    in_data = False
+    while True:
+        line = await reader.readline()
+        if not line:
+            break
+        if in_data:
+            if line in (b".\r\n", b".\n"):
+                in_data = False
+                stats["messages"] += 1
+                writer.write(b"250 OK\r\n")
+                await writer.drain()
+            continue
+        command = line[:4].upper()
+        if command in (b"HELO", b"EHLO"):
+            writer.write(b"250 smtp-sink\r\n")
+        elif command == b"DATA":
+            in_data = True
+            writer.write(b"354 End data with <CR><LF>.<CR><LF>\r\n")
+        elif command == b"QUIT":
+            writer.write(b"221 Bye\r\n")
+            await writer.drain()
+            break
+        else:
+            writer.write(b"250 OK\r\n")  # MAIL, RCPT, RSET, NOOP
+        await writer.drain()
+    writer.close()
+
+async def _run_smtp_sink(host, port):
+    stats = {"messages": 0}
+    server = await asyncio.start_server(lambda r, w: _smtp_sink_session(r, w, stats), host, port)
+    print(f"SMTP sink listening on {host}:{port} (accepts and discards all mail)")
+    reported = 0
+    async with server:
+        while True:
+            await asyncio.sleep(5)
+            if stats["messages"] != reported:
+                reported = stats["messages"]
+                print(f"Received {reported} messages")
+
+def smtp_sink_command(args):
+    try:
+        asyncio.run(_run_smtp_sink(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+def main():
+    parser = argparse.ArgumentParser(description="Restaurant backend maintenance commands")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    rebuild = commands.add_parser("rebuild-rollups", help="Recompute analytics rollups from raw reservations and waitlist entries")
+    rebuild.set_defaults(handler=rebuild_rollups_command)
+
+    snapshots = commands.add_parser("refresh-snapshots", help="Export closed days into the analytics column snapshots")
+    snapshots.add_argument("--rebuild", action="store_true", help="Discard the snapshots and export everything again")
+    snapshots.set_defaults(handler=refresh_snapshots_command)
+
+    load = commands.add_parser("import", help="Bulk-load customers, reservations or waitlist entries from CSV or NDJSON")
+    load.add_argument("dataset", choices=["customers", "reservations", "waitlist"])
+    load.add_argument("file")
+    load.add_argument("--format", choices=["csv", "ndjson"], help="Defaults to the file extension")
+    load.set_defaults(handler=import_command)
+
+    admin = commands.add_parser("create-admin", help="Create a login user (the first admin has to be created this way)")
+    admin.add_argument("username")
+    admin.add_argument("--role", choices=["admin", "sub_admin", "staff"], default="admin")
+    admin.set_defaults(handler=create_admin_command)
+
+    dispatch = commands.add_parser("dispatch-notifications", help="Deliver queued notifications from the outbox")
+    dispatch.add_argument("--once", action="store_true", help="Drain the outbox and exit instead of running workers")
+    dispatch.set_defaults(handler=dispatch_notifications_command)
+
+    sink = commands.add_parser("smtp-sink", help="Run a local SMTP server that discards mail, for offline load tests")
+    sink.add_argument("--host", default="127.0.0.1")
+    sink.add_argument("--port", type=int, default=1025)
+    sink.set_defaults(handler=smtp_sink_command)
+
+    args = parser.parse_args()
+    args.handler(args)
+
+if __name__ == "__main__":
+    main()
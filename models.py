@@ -1,18 +1,30 @@
-from fastapi import FastAPI, HTTPException, Depends, Header, Query, Request, File, UploadFile
+from fastapi import FastAPI, HTTPException, Depends, Header, Query, Request, File, UploadFile, Response, WebSocket, WebSocketDisconnect
+import asyncio
 from sqlalchemy.orm import Session
-from pydantic import BaseModel
+from pydantic import BaseModel, ValidationError
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Text, Date
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Text, Date, Index, Float, UniqueConstraint
 from sqlalchemy.orm import relationship
 from sqlalchemy.orm import declarative_base
 import datetime as dt
-from sqlalchemy import create_engine
+from database import DATABASE_URL, create_configured_engine, create_configured_async_engine, pool_status, async_pool_metrics
+from snapshots import ColumnStore
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from fastapi import params
+from functools import wraps
+from inspect import Parameter, iscoroutinefunction, signature
+from collections import OrderedDict, deque
 from sqlalchemy.orm import sessionmaker
 from typing import List, Optional
-from sqlalchemy import func
+from sqlalchemy import func, select, case, insert, update, delete, and_, or_, event, inspect, bindparam, false, literal, literal_column
+from sqlalchemy.sql import table as table_clause, column as column_clause
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import attributes
 from fastapi.responses import StreamingResponse, FileResponse
 import csv
-from io import StringIO
+from io import StringIO, TextIOWrapper
 import smtplib
 from email.message import EmailMessage
 from sqlalchemy import extract
@@ -20,10 +32,22 @@ from datetime import date, datetime, timedelta
 from datetime import time
 import os
 import shutil
+import bisect
+import re
+import threading
+from time import monotonic, sleep
+import random
+import uuid
+import base64
+from contextlib import contextmanager
+from contextvars import ContextVar
 from pathlib import Path
 
 # Role-based access control helpers
 import hashlib
+import hmac
+import json
+import zlib
 
 def hash_password(password: str) -> str:
     return hashlib.sha256(password.encode()).hexdigest()
@@ -31,30 +55,39 @@ def hash_password(password: str) -> str:
 def verify_password(password: str, hashed: str) -> bool:
     return hash_password(password) == hashed
 
+# Permissions are bits and every role's permission set is compiled once into a
+# mask, so a check is a single AND instead of a dict and list rebuild per call
+PERMISSIONS = ("dashboard", "reservations", "tables", "customers", "reports", "settings", "user_management", "booking")
+PERMISSION_BITS = {name: 1 << i for i, name in enumerate(PERMISSIONS)}
+ALL_PERMISSIONS = (1 << len(PERMISSIONS)) - 1
+
+def permission_mask(*names: str) -> int:
+    mask = 0
+    for name in names:
+        mask |= PERMISSION_BITS[name]
+    return mask
+
+ROLE_PERMISSIONS = {
+    "admin": ALL_PERMISSIONS,
+    "sub_admin": permission_mask("dashboard", "reservations", "tables", "customers", "booking"),
+    "staff": permission_mask("reservations", "tables", "customers", "booking"),
+    # The public booking site's static key
+    "public": permission_mask("booking"),
+}
+
 def has_permission(user_role: str, required_permission: str) -> bool:
     """Check if user role has required permission"""
-    permissions = {
-        "admin": ["dashboard", "reservations", "tables", "customers", "reports", "settings", "user_management"],
-        "sub_admin": ["dashboard", "reservations", "tables", "customers"],
-        "staff": ["reservations", "tables", "customers"]
-    }
-    return required_permission in permissions.get(user_role, [])
+    return bool(ROLE_PERMISSIONS.get(user_role, 0) & PERMISSION_BITS.get(required_permission, 0))
 
 # API Keys
+# The public booking site's key only grants the booking permission and ships to
+# browsers anyway, so it is always accepted. The static admin key from before
+# per-user session tokens is only accepted with ALLOW_STATIC_API_KEYS=1.
 ADMIN_API_KEY = "admin-secret-key-2024"
-PUBLIC_BOOKING_KEY = "public-booking-key"
-
-def verify_admin_api_key(x_api_key: str = Header(...)):
-    """Updated to be compatible with role-based auth and public bookings"""
-    if x_api_key not in [ADMIN_API_KEY, PUBLIC_BOOKING_KEY]:
-        raise HTTPException(status_code=401, detail="Invalid API key")
-    return x_api_key
-
-def verify_admin_only_api_key(x_api_key: str = Header(...)):
-    """Verify admin-only API key (excludes public booking key)"""
-    if x_api_key != ADMIN_API_KEY:
-        raise HTTPException(status_code=401, detail="Invalid API key")
-    return x_api_key
+PUBLIC_BOOKING_KEY = os.getenv("PUBLIC_BOOKING_KEY", "public-booking-key")
+ALLOW_STATIC_API_KEYS = os.getenv("ALLOW_STATIC_API_KEYS", "0").lower() in ("1", "true", "yes")
+# Development conveniences (a throwaway session secret); never set in production
+DEV_MODE = os.getenv("DEV_MODE", "0").lower() in ("1", "true", "yes")
 
 Base = declarative_base()
 
@@ -82,6 +115,7 @@ class Reservation(Base):
     seated_at = Column(DateTime, nullable=True)
     notes = Column(Text, nullable=True)
     reservation_type = Column(String, default="phone")  # walk-in, phone, online
+    location = Column(String, nullable=True)  # 'Indoor' or 'Outdoor' as requested at booking
     # New fields for scheduled reservations
     reservation_date = Column(Date, nullable=True)  # Date of reservation
     reservation_time = Column(String, nullable=True)  # Time of reservation (HH:MM format)
@@ -89,6 +123,17 @@ class Reservation(Base):
     customer = relationship("Customer", back_populates="reservations")
     table = relationship("Table", back_populates="reservations")
 
+    __table_args__ = (
+        # Analytics range scans and the admin listing (ordered by created_at)
+        Index("ix_reservations_created_at", "created_at"),
+        Index("ix_reservations_status_created_at", "status", "created_at"),
+        # Customer history, frequency counts and table utilization
+        Index("ix_reservations_customer_id_created_at", "customer_id", "created_at"),
+        Index("ix_reservations_table_id_status", "table_id", "status"),
+        # Scheduled-conflict check in admin_create_reservation
+        Index("ix_reservations_schedule", "reservation_date", "reservation_time"),
+    )
+
 class Table(Base):
     __tablename__ = "tables"
     id = Column(Integer, primary_key=True, index=True)
@@ -107,6 +152,7 @@ class AdminUser(Base):
     email = Column(String, nullable=True)
     full_name = Column(String, nullable=True)
     is_active = Column(Boolean, default=True)
+    tokens_valid_after = Column(DateTime, nullable=True)  # Session tokens issued earlier are revoked
     created_at = Column(DateTime, default=dt.datetime.now)
     created_by_admin_id = Column(Integer, ForeignKey("admin_users.id"), nullable=True)
 
@@ -132,6 +178,7 @@ class WaitlistEntry(Base):
     __tablename__ = "waitlist_entries"
     id = Column(Integer, primary_key=True, index=True)
     customer_id = Column(Integer, ForeignKey("customers.id"))
+    table_id = Column(Integer, ForeignKey("tables.id"), nullable=True)  # Set when the party is seated
     adults = Column(Integer, nullable=False)
     children = Column(Integer, nullable=False)
     child_seat_required = Column(Boolean, default=False)
@@ -144,6 +191,11 @@ class WaitlistEntry(Base):
     estimated_wait_time = Column(Integer, nullable=True)  # Estimated wait time in minutes
     customer = relationship("Customer")
 
+    __table_args__ = (
+        Index("ix_waitlist_entries_created_at", "created_at"),
+        Index("ix_waitlist_entries_status_created_at", "status", "created_at"),
+    )
+
 class Note(Base):
     __tablename__ = "notes"
     id = Column(Integer, primary_key=True, index=True)
@@ -160,6 +212,99 @@ class Report(Base):
     data = Column(Text, nullable=False)    # JSON or CSV as text
     generated_at = Column(DateTime, default=dt.datetime.now)
 
+    __table_args__ = (
+        # One snapshot per closed period
+        Index("uq_reports_date_type", "date", "type", unique=True),
+    )
+
+class AnalyticsRollup(Base):
+    """Hourly fact table maintained on every reservation/waitlist write"""
+    __tablename__ = "analytics_rollups"
+    id = Column(Integer, primary_key=True, index=True)
+    day = Column(Date, nullable=False)
+    hour = Column(Integer, nullable=False)  # 0-23, from created_at
+    location = Column(String, nullable=False, default="")
+    status = Column(String, nullable=False, default="")
+    reservation_type = Column(String, nullable=False, default="")  # 'waitlist' for waitlist entries
+    reservation_count = Column(Integer, nullable=False, default=0)
+    guest_count = Column(Integer, nullable=False, default=0)
+    seated_wait_sum = Column(Float, nullable=False, default=0)  # minutes
+    seated_wait_count = Column(Integer, nullable=False, default=0)
+    waitlist_count = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        UniqueConstraint("day", "hour", "location", "status", "reservation_type", name="uq_analytics_rollups_key"),
+    )
+
+class SnapshotInvalidation(Base):
+    """A closed day whose reservation or waitlist rows changed after the analytics snapshots may have exported it"""
+    __tablename__ = "snapshot_invalidations"
+    id = Column(Integer, primary_key=True, index=True)
+    dataset = Column(String, nullable=False)  # reservations, waitlist
+    day = Column(Date, nullable=False)
+
+    __table_args__ = (
+        Index("ix_snapshot_invalidations_dataset_day", "dataset", "day"),
+    )
+
+class QueueSequence(Base):
+    """Per-day queue number counter; next_value is the next number to hand out"""
+    __tablename__ = "queue_sequences"
+    sequence_date = Column(Date, primary_key=True)
+    next_value = Column(Integer, nullable=False)
+
+class NotificationOutbox(Base):
+    __tablename__ = "notification_outbox"
+    id = Column(Integer, primary_key=True, index=True)
+    channel = Column(String, nullable=False)  # email, sms, whatsapp
+    recipient = Column(String, nullable=False)
+    subject = Column(String, nullable=True)
+    body = Column(Text, nullable=False)
+    status = Column(String, nullable=False, default="pending")  # pending, sending, sent, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, nullable=False, default=dt.datetime.now)
+    claim_token = Column(String, nullable=True)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=dt.datetime.now)
+    sent_at = Column(DateTime, nullable=True)
+    campaign_id = Column(Integer, ForeignKey("campaigns.id"), nullable=True)  # Marketing sends; NULL for booking notifications
+
+    __table_args__ = (
+        Index("ix_notification_outbox_due", "channel", "status", "next_attempt_at"),
+        Index("ix_notification_outbox_claim_token", "claim_token"),
+        Index("ix_notification_outbox_campaign", "campaign_id", "status"),
+    )
+
+class NotificationRateLimit(Base):
+    """Sends granted in the current window of a rate-limited channel, shared by every dispatcher"""
+    __tablename__ = "notification_rate_limits"
+    channel = Column(String, primary_key=True)
+    window_start = Column(Float, nullable=False, default=0)  # epoch seconds
+    used = Column(Integer, nullable=False, default=0)
+
+class Campaign(Base):
+    __tablename__ = "campaigns"
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, nullable=False)
+    channel = Column(String, nullable=False)  # email, sms, whatsapp
+    subject = Column(String, nullable=True)
+    body = Column(Text, nullable=False)  # {name} is replaced with the customer's name
+    segment = Column(Text, nullable=False, default="{}")  # JSON filters
+    status = Column(String, nullable=False, default="running")  # running, paused, completed, cancelled
+    cursor = Column(Integer, nullable=False, default=0)  # Last customer id examined
+    scanned = Column(Integer, nullable=False, default=0)
+    enqueued = Column(Integer, nullable=False, default=0)
+    total_customers = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=dt.datetime.now)
+    updated_at = Column(DateTime, default=dt.datetime.now)
+    completed_at = Column(DateTime, nullable=True)
+
+class SchemaMigration(Base):
+    __tablename__ = "schema_migrations"
+    version = Column(Integer, primary_key=True)
+    name = Column(String, nullable=False)
+    applied_at = Column(DateTime, default=dt.datetime.now)
+
 app = FastAPI()
 
 app.add_middleware(
@@ -168,21 +313,1229 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Total-Count", "ETag"],  # Pagination and cache headers readable by the frontend
 )
 
 # Database connection setup
-DATABASE_URL = "sqlite:///./restaurant.db"  # Change to your production DB URL as needed
-engine = create_engine(
-    DATABASE_URL,
-    connect_args={"check_same_thread": False},
-    pool_size=20,  # Increased pool size
-    max_overflow=40
-)
+# Connection settings (URL, pool, SQLite pragmas) come from the environment; see database.py
+engine = create_configured_engine(DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 # Create all tables
 Base.metadata.create_all(bind=engine)
 
+# Analytics rollups
+# Every reservation and waitlist write adjusts the matching AnalyticsRollup
+# bucket inside the same flush, so analytics read a few rows per hour instead
+# of re-scanning history. rebuild_rollups() recomputes everything from scratch.
+WAITLIST_ROLLUP_TYPE = "waitlist"
+ROLLUP_MEASURES = ("reservation_count", "guest_count", "seated_wait_sum", "seated_wait_count", "waitlist_count")
+
+def _rollup_fact(is_waitlist, created_at, location, status, reservation_type, adults, children, seated_at):
+    """Return (key, measures) for one reservation or waitlist row, or None if it has no timestamp"""
+    if created_at is None:
+        return None
+    key = (
+        created_at.date(),
+        created_at.hour,
+        location or "",
+        status or "",
+        WAITLIST_ROLLUP_TYPE if is_waitlist else (reservation_type or "")
+    )
+    wait = (seated_at - created_at).total_seconds() / 60 if seated_at else None
+    measures = {
+        "reservation_count": 0 if is_waitlist else 1,
+        "guest_count": (adults or 0) + (children or 0),
+        "seated_wait_sum": wait or 0,
+        "seated_wait_count": 0 if wait is None else 1,
+        "waitlist_count": 1 if is_waitlist else 0
+    }
+    return key, measures
+
+def _keep_previous_value(target, value, oldvalue, initiator):
+    pass
+
+# Load the old value when a rolled-up column is assigned on an expired instance
+# (e.g. after a commit); otherwise the flush has no history to say which bucket
+# the row leaves and the rollup never moves
+for _model in (Reservation, WaitlistEntry):
+    for _name in ("created_at", "location", "status", "reservation_type", "adults", "children", "seated_at"):
+        if hasattr(_model, _name):
+            event.listen(getattr(_model, _name), "set", _keep_previous_value, active_history=True)
+
+def _instance_fact(obj, previous=False):
+    def value(name):
+        if previous:
+            history = attributes.get_history(obj, name)
+            if history.deleted:
+                return history.deleted[0]
+        return getattr(obj, name)
+    is_waitlist = isinstance(obj, WaitlistEntry)
+    return _rollup_fact(
+        is_waitlist,
+        value("created_at"),
+        value("location"),
+        value("status"),
+        None if is_waitlist else value("reservation_type"),
+        value("adults"),
+        value("children"),
+        value("seated_at")
+    )
+
+def upsert_insert(connection):
+    """The dialect's INSERT construct with ON CONFLICT support, or None"""
+    if connection.dialect.name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    elif connection.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        return None
+    return dialect_insert
+
+ROLLUP_KEY_COLUMNS = ("day", "hour", "location", "status", "reservation_type")
+
+def _bump_rollup(connection, key, measures, sign):
+    table = AnalyticsRollup.__table__
+    deltas = {name: sign * measures[name] for name in ROLLUP_MEASURES}
+    values = dict(zip(ROLLUP_KEY_COLUMNS, key), **deltas)
+    dialect_insert = upsert_insert(connection)
+    if dialect_insert is not None:
+        # One statement, and concurrent writers on a server database cannot both insert the bucket
+        statement = dialect_insert(table).values(**values)
+        connection.execute(statement.on_conflict_do_update(
+            index_elements=list(ROLLUP_KEY_COLUMNS),
+            set_={name: table.c[name] + statement.excluded[name] for name in ROLLUP_MEASURES}
+        ))
+        return
+    match = and_(*(table.c[name] == value for name, value in zip(ROLLUP_KEY_COLUMNS, key)))
+    result = connection.execute(
+        update(table).where(match).values({table.c[name]: table.c[name] + delta for name, delta in deltas.items()})
+    )
+    if result.rowcount == 0:
+        connection.execute(insert(table).values(**values))
+
+@event.listens_for(SessionLocal, "after_flush")
+def _maintain_rollups(session, flush_context):
+    changes = []
+    for obj in session.new:
+        if isinstance(obj, (Reservation, WaitlistEntry)):
+            changes.append((None, _instance_fact(obj)))
+    for obj in session.dirty:
+        if isinstance(obj, (Reservation, WaitlistEntry)) and session.is_modified(obj):
+            before, after = _instance_fact(obj, previous=True), _instance_fact(obj)
+            if before != after:
+                changes.append((before, after))
+    for obj in session.deleted:
+        if isinstance(obj, (Reservation, WaitlistEntry)):
+            changes.append((_instance_fact(obj, previous=True), None))
+    if not changes:
+        return
+    connection = session.connection()
+    for before, after in changes:
+        if before:
+            _bump_rollup(connection, *before, -1)
+        if after:
+            _bump_rollup(connection, *after, 1)
+    # Report snapshots of closed days this changed are rebuilt by the next scheduler run
+    today = dt.date.today()
+    closed_days = {fact[0][0] for pair in changes for fact in pair if fact and fact[0][0] < today}
+    if closed_days:
+        invalidate_reports(connection, closed_days)
+
+def rebuild_rollups(connection):
+    """Recompute the rollup table from the raw reservation and waitlist rows"""
+    buckets = {}
+    def add(fact):
+        if fact is None:
+            return
+        key, measures = fact
+        bucket = buckets.setdefault(key, dict.fromkeys(ROLLUP_MEASURES, 0))
+        for name in ROLLUP_MEASURES:
+            bucket[name] += measures[name]
+    r = Reservation.__table__.c
+    for row in connection.execution_options(yield_per=10000).execute(select(
+        r.created_at, r.location, r.status, r.reservation_type, r.adults, r.children, r.seated_at
+    )):
+        add(_rollup_fact(False, *row))
+    w = WaitlistEntry.__table__.c
+    for row in connection.execution_options(yield_per=10000).execute(select(
+        w.created_at, w.location, w.status, w.adults, w.children, w.seated_at
+    )):
+        add(_rollup_fact(True, row[0], row[1], row[2], None, row[3], row[4], row[5]))
+    connection.execute(delete(AnalyticsRollup.__table__))
+    connection.execute(delete(Report.__table__))
+    rows = [
+        dict(day=key[0], hour=key[1], location=key[2], status=key[3], reservation_type=key[4], **measures)
+        for key, measures in buckets.items()
+    ]
+    if rows:
+        connection.execute(insert(AnalyticsRollup.__table__), rows)
+    return len(rows)
+
+def rollup_filter(query, start_date=None, end_date=None, waitlist=False):
+    """Restrict a query on AnalyticsRollup to reservation (or waitlist, or with
+    waitlist=None both) buckets within [start, end]"""
+    if waitlist:
+        query = query.filter(AnalyticsRollup.reservation_type == WAITLIST_ROLLUP_TYPE)
+    elif waitlist is not None:
+        query = query.filter(AnalyticsRollup.reservation_type != WAITLIST_ROLLUP_TYPE)
+    if start_date:
+        query = query.filter(or_(
+            AnalyticsRollup.day > start_date.date(),
+            and_(AnalyticsRollup.day == start_date.date(), AnalyticsRollup.hour >= start_date.hour)
+        ))
+    if end_date:
+        query = query.filter(or_(
+            AnalyticsRollup.day < end_date.date(),
+            and_(AnalyticsRollup.day == end_date.date(), AnalyticsRollup.hour <= end_date.hour)
+        ))
+    return query
+
+# Peak-hour engine
+# The hourly rollups are read as flat arrays and binned into a 7x24 (weekday x hour)
+# grid with NumPy, so a year of history is ~9k buckets rather than every reservation.
+# NumPy is imported on first use (pip install numpy).
+PEAK_WINDOW_HOURS = int(os.getenv("PEAK_WINDOW_HOURS", "2"))
+WEEKDAY_NAMES = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+def format_hour(hour: int) -> str:
+    """24h hour -> '6:00 PM'"""
+    return f"{(hour % 12) or 12}:00 {'AM' if hour % 24 < 12 else 'PM'}"
+
+def peak_hour_profile(db: Session, start_date: dt.datetime = None, end_date: dt.datetime = None,
+                      window_hours: int = PEAK_WINDOW_HOURS) -> dict:
+    """Arrival and wait heatmaps ([weekday][hour], Monday first), the peak day and hour,
+    the busiest `window_hours` stretch of the day and the average wait in minutes"""
+    import numpy as np
+
+    buckets = rollup_filter(db.query(
+        AnalyticsRollup.day,
+        AnalyticsRollup.hour,
+        func.sum(AnalyticsRollup.reservation_count),
+        func.sum(AnalyticsRollup.seated_wait_sum),
+        func.sum(AnalyticsRollup.seated_wait_count)
+    ), start_date, end_date).group_by(AnalyticsRollup.day, AnalyticsRollup.hour).all()
+
+    arrivals = np.zeros((7, 24))
+    wait_sums = np.zeros((7, 24))
+    wait_counts = np.zeros((7, 24))
+    if buckets:
+        days, hours, counts, sums, waits = zip(*buckets)
+        # 1970-01-01 was a Thursday, so (days since epoch + 3) % 7 is the Monday-first weekday
+        weekdays = (np.array(days, dtype="datetime64[D]").astype(np.int64) + 3) % 7
+        cells = weekdays * 24 + np.array(hours, dtype=np.int64)
+
+        def binned(values):
+            weights = np.nan_to_num(np.array(values, dtype=float))
+            return np.bincount(cells, weights=weights, minlength=7 * 24).reshape(7, 24)
+
+        arrivals, wait_sums, wait_counts = binned(counts), binned(sums), binned(waits)
+
+    avg_waits = np.divide(wait_sums, wait_counts, out=np.zeros_like(wait_sums), where=wait_counts > 0)
+    by_hour = arrivals.sum(axis=0)
+    by_day = arrivals.sum(axis=1)
+    window_hours = max(1, min(window_hours, 24))
+    window_totals = np.convolve(by_hour, np.ones(window_hours), mode="valid")
+    busiest_start = int(window_totals.argmax())
+    has_arrivals = bool(by_hour.any())
+    total_waits = wait_counts.sum()
+
+    return {
+        "arrivals": arrivals.astype(int).tolist(),
+        "avg_waits": avg_waits.tolist(),
+        "by_hour": by_hour.astype(int).tolist(),
+        "by_day": by_day.astype(int).tolist(),
+        "peak_hour": f"{int(by_hour.argmax()):02d}" if has_arrivals else "N/A",
+        "peak_day": WEEKDAY_NAMES[int(by_day.argmax())] if has_arrivals else "N/A",
+        "busiest_period": (
+            f"{format_hour(busiest_start)} - {format_hour(busiest_start + window_hours)}" if has_arrivals else "N/A"
+        ),
+        "average_wait_time": round(float(wait_sums.sum() / total_waits), 1) if total_waits else 0
+    }
+
+# Metrics
+# A metric series is one GROUP BY over the hourly rollups (by day, or by day and
+# hour), folded into weeks or months and gap-filled in Python. Ratio metrics are
+# kept as numerator and denominator sums until the end, so they fold correctly.
+AVERAGE_CHECK_PER_GUEST = 25  # dollars, for the revenue estimate
+SERVED_STATUSES = ("Seated", "Completed")
+WAITLIST_SERVED_STATUSES = ("Seated",)  # A waitlist entry is converted once seated
+METRIC_BUCKETS = ("hour", "day", "week", "month")
+MAX_METRIC_BUCKETS = 5000
+
+_rollup_rows = AnalyticsRollup.reservation_count + AnalyticsRollup.waitlist_count
+METRICS = {
+    # name: (numerator, denominator or None, scale)
+    "count": (_rollup_rows, None, 1),
+    "guests": (AnalyticsRollup.guest_count, None, 1),
+    "avg_group_size": (AnalyticsRollup.guest_count, _rollup_rows, 1),
+    "wait": (AnalyticsRollup.seated_wait_sum, AnalyticsRollup.seated_wait_count, 1),
+    "served": (case(
+        (AnalyticsRollup.reservation_type == WAITLIST_ROLLUP_TYPE,
+         case((AnalyticsRollup.status.in_(WAITLIST_SERVED_STATUSES), _rollup_rows), else_=0)),
+        (AnalyticsRollup.status.in_(SERVED_STATUSES), _rollup_rows),
+        else_=0
+    ), None, 1),
+    "no_shows": (case((AnalyticsRollup.status == "No-show", _rollup_rows), else_=0), None, 1),
+    "revenue": (case((AnalyticsRollup.status.in_(SERVED_STATUSES), AnalyticsRollup.guest_count), else_=0), None, AVERAGE_CHECK_PER_GUEST),
+}
+
+def bucket_start(moment: dt.datetime, bucket: str) -> dt.datetime:
+    """Start of the hour/day/week (Monday)/month containing `moment`"""
+    if bucket == "hour":
+        return moment.replace(minute=0, second=0, microsecond=0)
+    day = dt.datetime.combine(moment.date(), dt.time.min)
+    if bucket == "week":
+        return day - timedelta(days=day.weekday())
+    if bucket == "month":
+        return day.replace(day=1)
+    return day
+
+def next_bucket(start: dt.datetime, bucket: str) -> dt.datetime:
+    if bucket == "hour":
+        return start + timedelta(hours=1)
+    if bucket == "week":
+        return start + timedelta(days=7)
+    if bucket == "month":
+        return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return start + timedelta(days=1)
+
+def metric_series(db: Session, metrics: List[str], bucket: str, start_date: dt.datetime, end_date: dt.datetime,
+                  waitlist: bool = False) -> dict:
+    """{"series": [{"start": bucket start, <metric>: value}], "totals": {<metric>: value}} for every
+    bucket touching [start, end], empty buckets included. Raises ValueError for bad arguments."""
+    unknown = [name for name in metrics if name not in METRICS]
+    if unknown:
+        raise ValueError(f"Unknown metric '{unknown[0]}'. Available: {', '.join(METRICS)}")
+    if bucket not in METRIC_BUCKETS:
+        raise ValueError(f"Unknown bucket '{bucket}'. Available: {', '.join(METRIC_BUCKETS)}")
+    if start_date > end_date:
+        raise ValueError("start must not be after end")
+    starts = [bucket_start(start_date, bucket)]
+    while next_bucket(starts[-1], bucket) <= end_date:
+        if len(starts) >= MAX_METRIC_BUCKETS:
+            raise ValueError(f"More than {MAX_METRIC_BUCKETS} buckets; use a larger bucket or a shorter range")
+        starts.append(next_bucket(starts[-1], bucket))
+
+    sums = []
+    for name in metrics:
+        numerator, denominator, _ = METRICS[name]
+        sums.append(func.sum(numerator))
+        if denominator is not None:
+            sums.append(func.sum(denominator))
+    keys = [AnalyticsRollup.day, AnalyticsRollup.hour] if bucket == "hour" else [AnalyticsRollup.day]
+    rows = rollup_filter(db.query(*keys, *sums), start_date, end_date, waitlist).group_by(*keys).all()
+
+    totals = {}
+    grand_total = [0] * len(sums)
+    for row in rows:
+        moment = dt.datetime.combine(row[0], dt.time(row[1] if bucket == "hour" else 0))
+        bucket_totals = totals.setdefault(bucket_start(moment, bucket), [0] * len(sums))
+        for i, value in enumerate(row[len(keys):]):
+            bucket_totals[i] += value or 0
+            grand_total[i] += value or 0
+
+    def values(bucket_sums):
+        result = {}
+        i = 0
+        for name in metrics:
+            _, denominator, scale = METRICS[name]
+            if denominator is None:
+                result[name] = bucket_sums[i] * scale
+                i += 1
+            else:
+                result[name] = bucket_sums[i] / bucket_sums[i + 1] * scale if bucket_sums[i + 1] else 0
+                i += 2
+        return result
+
+    empty = [0] * len(sums)
+    return {
+        "series": [{"start": start, **values(totals.get(start, empty))} for start in starts],
+        "totals": values(grand_total)
+    }
+
+# Report snapshots
+# Closed days and months are summarized once into the reports table (zlib-compressed
+# JSON) by an in-process scheduler; reports are served from those rows and only the
+# open period (today, this month) and any period not materialized yet are computed
+# from the rollups. Changes to a closed day mark its snapshots stale (empty data,
+# new generated_at) in the same transaction, and the next scheduler run rebuilds
+# them. A summary is only stored over the exact marker it saw before reading the
+# rollups, so one computed before a concurrent change can never replace that
+# change's marker.
+REPORT_SCHEDULER_SECONDS = int(os.getenv("REPORT_SCHEDULER_SECONDS", "3600"))
+REPORT_TYPES = {"Daily": "day", "Monthly": "month"}
+REPORT_BATCH_PERIODS = 366  # periods summarized per query while backfilling
+
+def pack_report(data: dict) -> str:
+    return base64.b64encode(zlib.compress(json.dumps(data).encode())).decode()
+
+def unpack_report(text: str) -> dict:
+    return json.loads(zlib.decompress(base64.b64decode(text)))
+
+def invalidate_reports(connection, days):
+    """Mark the Daily and Monthly snapshots covering `days` stale"""
+    now = dt.datetime.now()
+    periods = [("Daily", day) for day in days] + [("Monthly", month) for month in {day.replace(day=1) for day in days}]
+    table = Report.__table__
+    dialect_insert = upsert_insert(connection)
+    if dialect_insert is not None:
+        statement = dialect_insert(table)
+        connection.execute(statement.on_conflict_do_update(
+            index_elements=["date", "type"],
+            set_={"data": statement.excluded.data, "generated_at": statement.excluded.generated_at}
+        ), [{"date": period, "type": report_type, "data": "", "generated_at": now} for report_type, period in periods])
+        return
+    for report_type, period in periods:
+        match = and_(table.c.date == period, table.c.type == report_type)
+        if connection.execute(update(table).where(match).values(data="", generated_at=now)).rowcount == 0:
+            connection.execute(insert(table).values(date=period, type=report_type, data="", generated_at=now))
+
+def period_summaries(db: Session, bucket: str, start_date: dt.datetime, end_date: dt.datetime) -> dict:
+    """{period start date: summary} for every day or month touching [start, end]"""
+    reservations = metric_series(db, ["count", "guests", "served", "no_shows", "wait", "revenue"], bucket, start_date, end_date)
+    waitlist = metric_series(db, ["count", "wait"], bucket, start_date, end_date, waitlist=True)
+    return {
+        point["start"].date(): {
+            "reservation_count": point["count"],
+            "guests": point["guests"],
+            "served": point["served"],
+            "no_shows": point["no_shows"],
+            "avg_wait": round(point["wait"], 1),
+            "revenue_estimate": point["revenue"],
+            "waitlist_entries": entries["count"],
+            "waitlist_avg_wait": round(entries["wait"], 1)
+        }
+        for point, entries in zip(reservations["series"], waitlist["series"])
+    }
+
+def _period_starts(bucket: str, first: date, last: date) -> List[date]:
+    starts = []
+    current = bucket_start(dt.datetime.combine(first, dt.time.min), bucket)
+    while current.date() <= last:
+        starts.append(current.date())
+        current = next_bucket(current, bucket)
+    return starts
+
+def _summarize_periods(db: Session, bucket: str, periods: List[date]) -> dict:
+    summaries = {}
+    for i in range(0, len(periods), REPORT_BATCH_PERIODS):
+        batch = periods[i:i + REPORT_BATCH_PERIODS]
+        end = next_bucket(dt.datetime.combine(batch[-1], dt.time.min), bucket) - timedelta(microseconds=1)
+        found = period_summaries(db, bucket, dt.datetime.combine(batch[0], dt.time.min), end)
+        summaries.update((period, found[period]) for period in batch)
+    return summaries
+
+def materialize_reports(db: Session) -> dict:
+    """Write a snapshot for every closed day and month that lacks one; returns {type: snapshots written}"""
+    written = dict.fromkeys(REPORT_TYPES, 0)
+    first = db.query(func.min(AnalyticsRollup.day)).scalar()
+    if first is None:
+        return written
+    today = dt.date.today()
+    for report_type, bucket in REPORT_TYPES.items():
+        open_period = bucket_start(dt.datetime.combine(today, dt.time.min), bucket).date()
+        # Read before the rollups: the stale markers seen here are the only ones a summary may replace
+        existing = {
+            period: (data, generated_at)
+            for period, data, generated_at in db.query(Report.date, Report.data, Report.generated_at).filter(Report.type == report_type)
+        }
+        missing = [
+            p for p in _period_starts(bucket, first, open_period - timedelta(days=1))
+            if p not in existing or not existing[p][0]
+        ]
+        connection = db.connection()
+        table = Report.__table__
+        for period, summary in _summarize_periods(db, bucket, missing).items():
+            values = {"data": pack_report(summary), "generated_at": dt.datetime.now()}
+            if period in existing:
+                result = connection.execute(update(table).where(
+                    table.c.date == period, table.c.type == report_type,
+                    table.c.data == "", table.c.generated_at == existing[period][1]
+                ).values(**values))
+            else:
+                # Another worker (or a change to this period) may have written the row meanwhile
+                result = _insert_ignoring_conflicts(connection, table, dict(values, date=period, type=report_type))
+            written[report_type] += result.rowcount
+        db.commit()
+    return written
+
+def report_summaries(db: Session, report_type: str, start_date: date = None, end_date: date = None):
+    """[(period start, summary)] oldest first, from the snapshots plus a live read of the
+    open period and anything not materialized yet"""
+    bucket = REPORT_TYPES[report_type]
+    query = db.query(Report.date, Report.data).filter(Report.type == report_type)
+    if start_date:
+        query = query.filter(Report.date >= bucket_start(dt.datetime.combine(start_date, dt.time.min), bucket).date())
+    if end_date:
+        query = query.filter(Report.date <= end_date)
+    stored = {period: unpack_report(data) for period, data in query.all() if data}
+    first = start_date or db.query(func.min(AnalyticsRollup.day)).scalar()
+    if first is None:
+        return []
+    periods = _period_starts(bucket, first, end_date or dt.date.today())
+    live = _summarize_periods(db, bucket, [p for p in periods if p not in stored])
+    return [(period, stored.get(period) or live[period]) for period in periods]
+
+def daily_reservation_counts(db: Session, start_date: date = None, end_date: date = None):
+    """[(date, reservation_count)] for every day with reservations, oldest first"""
+    return [
+        (day, summary["reservation_count"])
+        for day, summary in report_summaries(db, "Daily", start_date, end_date)
+        if summary["reservation_count"] > 0
+    ]
+
+def monthly_reservation_counts(db: Session, start_date: date = None, end_date: date = None):
+    """[('YYYY-MM', reservation_count)], oldest first"""
+    return [
+        (month.strftime("%Y-%m"), summary["reservation_count"])
+        for month, summary in report_summaries(db, "Monthly", start_date, end_date)
+        if summary["reservation_count"] > 0
+    ]
+
+# Table allocation
+# Free tables are kept in memory, bucketed by location and sorted by size, so
+# the table a policy wants is found with a binary search. Claims are confirmed
+# with a conditional UPDATE, so a stale bucket only costs a retry and can never
+# seat two parties at the same table.
+TABLE_ALLOCATOR_REFRESH_SECONDS = 30  # Picks up changes made by other processes
+# preserve_large_tables: the last LARGE_TABLES_HELD free tables of LARGE_TABLE_MIN_SIZE
+# seats or more are kept for parties leaving at most LARGE_TABLE_MAX_EMPTY_SEATS empty
+LARGE_TABLE_MIN_SIZE = int(os.getenv("LARGE_TABLE_MIN_SIZE", "6"))
+LARGE_TABLE_MAX_EMPTY_SEATS = int(os.getenv("LARGE_TABLE_MAX_EMPTY_SEATS", "2"))
+LARGE_TABLES_HELD = int(os.getenv("LARGE_TABLES_HELD", "1"))
+
+def best_fit_policy(candidates, party_size, child_seat_required):
+    """Smallest table that seats the party"""
+    index = bisect.bisect_left(candidates, (party_size,))
+    return index if index < len(candidates) else None
+
+def preserve_large_tables_policy(candidates, party_size, child_seat_required):
+    """Best fit, but a party that would leave a large table mostly empty may not take
+    one of the last LARGE_TABLES_HELD free large tables; it waits for a smaller one"""
+    index = best_fit_policy(candidates, party_size, child_seat_required)
+    if index is None:
+        return None
+    size = candidates[index][0]
+    if size < LARGE_TABLE_MIN_SIZE or size - party_size <= LARGE_TABLE_MAX_EMPTY_SEATS:
+        return index
+    free_large = len(candidates) - bisect.bisect_left(candidates, (LARGE_TABLE_MIN_SIZE,))
+    return index if free_large > LARGE_TABLES_HELD else None
+
+def child_seat_aware_policy(candidates, party_size, child_seat_required):
+    """Best fit, keeping a spare place for the child seat when one is required. Tables
+    have no child-seat attribute: the seat takes one place, so a party that needs one
+    gets the smallest table with a spare place, or an exact fit when none is free."""
+    if child_seat_required:
+        index = best_fit_policy(candidates, party_size + 1, child_seat_required)
+        if index is not None:
+            return index
+    return best_fit_policy(candidates, party_size, child_seat_required)
+
+TABLE_ALLOCATION_POLICIES = {
+    "best_fit": best_fit_policy,
+    "preserve_large_tables": preserve_large_tables_policy,
+    "child_seat_aware": child_seat_aware_policy,
+}
+TABLE_ALLOCATION_POLICY = os.getenv("TABLE_ALLOCATION_POLICY", "best_fit")
+
+class TableAllocator:
+    """Per-process index of free tables: {location: sorted [(size, table_id)]}"""
+
+    def __init__(self, policy: str = TABLE_ALLOCATION_POLICY):
+        self.policy = policy
+        self._free = {}
+        self._entries = {}  # table_id: (location, (size, table_id)) for every free table
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+
+    def _ensure_loaded(self, db: Session):
+        if self._loaded_at is not None and monotonic() - self._loaded_at < TABLE_ALLOCATOR_REFRESH_SECONDS:
+            return
+        free = {}
+        entries = {}
+        for table_id, location, size in db.query(Table.id, Table.location, Table.size).filter(Table.is_occupied == False):
+            free.setdefault(location, []).append((size, table_id))
+            entries[table_id] = (location, (size, table_id))
+        for candidates in free.values():
+            candidates.sort()
+        self._free = free
+        self._entries = entries
+        self._loaded_at = monotonic()
+
+    def _choose(self, location, party_size, child_seat_required, policy):
+        candidates = self._free.get(location, [])
+        index = TABLE_ALLOCATION_POLICIES[policy or self.policy](candidates, party_size, child_seat_required)
+        return None if index is None else candidates[index]
+
+    def _discard(self, table_id):
+        known = self._entries.pop(table_id, None)
+        if known:
+            location, entry = known
+            candidates = self._free[location]
+            del candidates[bisect.bisect_left(candidates, entry)]
+
+    def _add(self, table_id, location, size):
+        self._discard(table_id)
+        self._entries[table_id] = (location, (size, table_id))
+        bisect.insort(self._free.setdefault(location, []), (size, table_id))
+
+    def apply(self, table_id, location, size, is_free):
+        """Record a committed table change"""
+        with self._lock:
+            if self._loaded_at is None:
+                return
+            self._discard(table_id)
+            if is_free:
+                self._add(table_id, location, size)
+
+    def release(self, claims):
+        """Put back tables claimed by a transaction that did not commit: [(table_id, location, size)]"""
+        with self._lock:
+            if self._loaded_at is None:
+                return
+            for table_id, location, size in claims:
+                self._add(table_id, location, size)
+
+    def find(self, db: Session, location: str, party_size: int, child_seat_required: bool = False, policy: str = None):
+        """Best free table for the party, without claiming it"""
+        with self._lock:
+            self._ensure_loaded(db)
+            entry = self._choose(location, party_size, child_seat_required, policy)
+        return db.get(Table, entry[1]) if entry else None
+
+    def count_free(self, db: Session, location: str, party_size: int) -> int:
+        """Number of free tables at the location that can seat the party"""
+        with self._lock:
+            self._ensure_loaded(db)
+            candidates = self._free.get(location, [])
+            return len(candidates) - bisect.bisect_left(candidates, (party_size,))
+
+    def allocate(self, db: Session, location: str, party_size: int, child_seat_required: bool = False, policy: str = None):
+        """Claim the best free table for the party inside the caller's transaction"""
+        while True:
+            with self._lock:
+                self._ensure_loaded(db)
+                entry = self._choose(location, party_size, child_seat_required, policy)
+                if entry is None:
+                    return None
+                self._discard(entry[1])
+            claimed = db.query(Table).filter(
+                Table.id == entry[1],
+                Table.is_occupied == False
+            ).update({Table.is_occupied: True}, synchronize_session="evaluate")
+            if claimed:
+                # Returned to the free list if the transaction ends without committing
+                db.info.setdefault("table_allocator_claims", []).append((entry[1], location, entry[0]))
+                return db.get(Table, entry[1])
+
+table_allocator = TableAllocator()
+
+@event.listens_for(SessionLocal, "after_flush")
+def _track_table_changes(session, flush_context):
+    changes = session.info.setdefault("table_allocator_changes", [])
+    for obj in session.new.union(session.dirty):
+        if isinstance(obj, Table):
+            changes.append((obj.id, obj.location, obj.size, not obj.is_occupied))
+    for obj in session.deleted:
+        if isinstance(obj, Table):
+            changes.append((obj.id, obj.location, obj.size, False))
+
+@event.listens_for(SessionLocal, "after_commit")
+def _apply_table_changes(session):
+    session.info.pop("table_allocator_claims", None)
+    for change in session.info.pop("table_allocator_changes", []):
+        table_allocator.apply(*change)
+
+@event.listens_for(SessionLocal, "after_transaction_end")
+def _release_table_claims(session, transaction):
+    # Fires on rollback and also on close() of an uncommitted session, which
+    # after_rollback does not; after a commit the claims were already popped
+    if transaction.parent is None:
+        session.info.pop("table_allocator_changes", None)
+        claims = session.info.pop("table_allocator_claims", None)
+        if claims:
+            table_allocator.release(claims)
+
+# Queue numbers
+# Queue numbers restart every day. Each allocation is one atomic UPDATE on that
+# day's QueueSequence row, so concurrent walk-ins never share a number and the
+# cost does not depend on how many reservations exist. By default the number is
+# taken inside the caller's transaction (a rolled-back booking leaves no gap).
+# With QUEUE_NUMBER_BLOCK_SIZE above 1 each worker process reserves a block of
+# numbers (hi/lo) on its own connection and hands them out from memory; numbers
+# stay unique but are not strictly in arrival order across processes. Blocks are
+# for server databases only: on SQLite the refill would wait on the write lock
+# held by the caller's own transaction, so the block size is ignored there.
+QUEUE_NUMBER_BLOCK_SIZE = int(os.getenv("QUEUE_NUMBER_BLOCK_SIZE", "1"))
+
+def _insert_ignoring_conflicts(connection, table, values):
+    dialect_insert = upsert_insert(connection)
+    if dialect_insert is None:
+        return connection.execute(insert(table).values(**values))
+    return connection.execute(dialect_insert(table).values(**values).on_conflict_do_nothing())
+
+def _bump_queue_sequence(connection, day, count):
+    table = QueueSequence.__table__
+    bump = update(table).where(table.c.sequence_date == day).values(next_value=table.c.next_value + count)
+    if connection.dialect.update_returning:
+        return connection.execute(bump.returning(table.c.next_value)).scalar()
+    if connection.execute(bump).rowcount:
+        return connection.execute(select(table.c.next_value).where(table.c.sequence_date == day)).scalar()
+    return None
+
+def reserve_queue_numbers(connection, day: date, count: int = 1) -> int:
+    """Atomically reserve `count` consecutive queue numbers for `day`; returns the first"""
+    end = _bump_queue_sequence(connection, day, count)
+    if end is None:
+        # First number of the day: continue after anything issued before the counter existed
+        issued = connection.execute(select(func.max(Reservation.queue_number)).where(
+            Reservation.created_at >= dt.datetime.combine(day, dt.time.min),
+            Reservation.created_at <= dt.datetime.combine(day, dt.time.max)
+        )).scalar() or 0
+        _insert_ignoring_conflicts(connection, QueueSequence.__table__, {"sequence_date": day, "next_value": issued + 1})
+        end = _bump_queue_sequence(connection, day, count)
+    return end - count
+
+class QueueNumberAllocator:
+    """Hands out per-day queue numbers, optionally reserving them in blocks"""
+
+    def __init__(self, bind, block_size: int = QUEUE_NUMBER_BLOCK_SIZE):
+        self.bind = bind
+        if block_size > 1 and bind.dialect.name == "sqlite":
+            print(f"[WARNING] QUEUE_NUMBER_BLOCK_SIZE={block_size} ignored on SQLite; queue numbers are taken one at a time")
+            block_size = 1
+        self.block_size = max(block_size, 1)
+        self._lock = threading.Lock()
+        self._day = None
+        self._next = 0
+        self._end = 0
+
+    def next(self, db: Session, day: date = None) -> int:
+        day = day or dt.datetime.now().date()
+        if self.block_size == 1:
+            return reserve_queue_numbers(db.connection(), day)
+        with self._lock:
+            if day != self._day or self._next >= self._end:
+                with self.bind.begin() as connection:
+                    self._next = reserve_queue_numbers(connection, day, self.block_size)
+                self._end = self._next + self.block_size
+                self._day = day
+            number = self._next
+            self._next += 1
+            return number
+
+queue_numbers = QueueNumberAllocator(engine)
+
+# Slot capacity
+# A scheduled reservation holds its table from reservation_time for a turn
+# time; seated walk-ins hold theirs from when they sat down. For every date the
+# bookings are kept per table as a sorted list of non-overlapping [start, end)
+# intervals in minutes since midnight, so "is this table free from 19:30 for
+# 90 minutes" is one bisect: O(log n) in that table's bookings, and "can we fit
+# this party" is that check over the location's tables, whose free subset is
+# then ranked by the table allocation policy. The cache only proposes a table:
+# book() locks that table's row and re-reads its bookings from the database
+# before holding it, so processes with stale caches cannot double-book a slot.
+RESERVATION_TURN_MINUTES = int(os.getenv("RESERVATION_TURN_MINUTES", "90"))
+RESERVATION_LARGE_PARTY_SIZE = int(os.getenv("RESERVATION_LARGE_PARTY_SIZE", "6"))
+RESERVATION_LARGE_PARTY_TURN_MINUTES = int(os.getenv("RESERVATION_LARGE_PARTY_TURN_MINUTES", "120"))
+SLOT_HOLDING_STATUSES = ("Queued", "Seated")
+SLOT_BOOK_REFRESH_SECONDS = 30  # Picks up bookings made by other processes
+
+def turn_minutes(party_size: int) -> int:
+    if party_size >= RESERVATION_LARGE_PARTY_SIZE:
+        return RESERVATION_LARGE_PARTY_TURN_MINUTES
+    return RESERVATION_TURN_MINUTES
+
+def parse_slot_time(value: str) -> int:
+    """'HH:MM' -> minutes since midnight"""
+    try:
+        hours, minutes = value.split(":")[:2]
+        hours, minutes = int(hours), int(minutes)
+    except (AttributeError, ValueError):
+        raise ValueError(f"Invalid reservation time {value!r}, expected HH:MM")
+    if not (0 <= hours < 24 and 0 <= minutes < 60):
+        raise ValueError(f"Invalid reservation time {value!r}, expected HH:MM")
+    return hours * 60 + minutes
+
+class TableSchedule:
+    """Non-overlapping bookings on one table: parallel sorted starts/ends"""
+
+    def __init__(self):
+        self.starts = []
+        self.ends = []
+        self.reservation_ids = []
+
+    def is_free(self, start: int, end: int) -> bool:
+        # Only the last booking starting before `end` can overlap [start, end)
+        i = bisect.bisect_left(self.starts, end)
+        return i == 0 or self.ends[i - 1] <= start
+
+    def add(self, start: int, end: int, reservation_id=None):
+        i = bisect.bisect_left(self.starts, start)
+        self.starts.insert(i, start)
+        self.ends.insert(i, end)
+        self.reservation_ids.insert(i, reservation_id)
+
+class SlotBook:
+    """Per-process cache of {reservation_date: ({table_id: TableSchedule}, loaded_at)}"""
+
+    def __init__(self):
+        self._days = {}
+        self._lock = threading.Lock()
+
+    def invalidate(self, day: date = None):
+        with self._lock:
+            if day is None:
+                self._days.clear()
+            else:
+                self._days.pop(day, None)
+
+    def _load(self, db: Session, day: date):
+        cached = self._days.get(day)
+        if cached is not None and monotonic() - cached[1] < SLOT_BOOK_REFRESH_SECONDS:
+            return cached[0]
+        schedules = self._read_schedules(db, day)
+        self._days[day] = (schedules, monotonic())
+        return schedules
+
+    @staticmethod
+    def _read_schedules(db: Session, day: date, table_id: int = None) -> dict:
+        """{table_id: TableSchedule} for `day` from the database, optionally for one table"""
+        schedules = {}
+        scheduled = db.query(
+            Reservation.id, Reservation.table_id, Reservation.reservation_time,
+            Reservation.adults, Reservation.children
+        ).filter(
+            Reservation.reservation_date == day,
+            Reservation.is_scheduled == True,
+            Reservation.table_id.isnot(None),
+            Reservation.status.in_(SLOT_HOLDING_STATUSES)
+        )
+        if table_id is not None:
+            scheduled = scheduled.filter(Reservation.table_id == table_id)
+        for reservation_id, booked_table_id, reservation_time, adults, children in scheduled:
+            try:
+                start = parse_slot_time(reservation_time)
+            except ValueError:
+                continue
+            schedules.setdefault(booked_table_id, TableSchedule()).add(
+                start, start + turn_minutes(adults + children), reservation_id
+            )
+        if day == dt.datetime.now().date():
+            # Walk-ins already at a table hold it for a turn from when they sat down
+            walk_ins = db.query(
+                Reservation.id, Reservation.table_id, Reservation.seated_at, Reservation.created_at,
+                Reservation.adults, Reservation.children
+            ).filter(
+                or_(Reservation.is_scheduled == False, Reservation.is_scheduled.is_(None)),
+                Reservation.table_id.isnot(None),
+                Reservation.status == "Seated",
+                Reservation.created_at >= dt.datetime.combine(day, dt.time.min)
+            )
+            if table_id is not None:
+                walk_ins = walk_ins.filter(Reservation.table_id == table_id)
+            for reservation_id, seated_table_id, seated_at, created_at, adults, children in walk_ins:
+                since = seated_at or created_at
+                start = since.hour * 60 + since.minute
+                schedule = schedules.setdefault(seated_table_id, TableSchedule())
+                end = start + turn_minutes(adults + children)
+                if schedule.is_free(start, end):
+                    schedule.add(start, end, reservation_id)
+        return schedules
+
+    def _free_candidates(self, db: Session, schedules, location: str, party_size: int, start: int, end: int):
+        candidates = []
+        for table_id, size in db.query(Table.id, Table.size).filter(Table.location == location, Table.size >= party_size):
+            schedule = schedules.get(table_id)
+            if schedule is None or schedule.is_free(start, end):
+                candidates.append((size, table_id))
+        candidates.sort()
+        return candidates
+
+    def availability(self, db: Session, day: date, reservation_time: str, location: str, party_size: int,
+                     child_seat_required: bool = False, policy: str = None):
+        """(best table id or None, number of tables free for the whole turn)"""
+        start = parse_slot_time(reservation_time)
+        end = start + turn_minutes(party_size)
+        with self._lock:
+            schedules = self._load(db, day)
+            candidates = self._free_candidates(db, schedules, location, party_size, start, end)
+        index = TABLE_ALLOCATION_POLICIES[policy or table_allocator.policy](candidates, party_size, child_seat_required)
+        return (None if index is None else candidates[index][1]), len(candidates)
+
+    def starts_between(self, db: Session, day: date, start: int, end: int) -> int:
+        """Number of bookings on `day` starting in [start, end) minutes since midnight"""
+        with self._lock:
+            schedules = self._load(db, day)
+            return sum(
+                bisect.bisect_left(schedule.starts, end) - bisect.bisect_left(schedule.starts, start)
+                for schedule in schedules.values()
+            )
+
+    def book(self, db: Session, day: date, reservation_time: str, location: str, party_size: int,
+             child_seat_required: bool = False, policy: str = None):
+        """Pick and hold the best table for the slot inside the caller's transaction"""
+        start = parse_slot_time(reservation_time)
+        end = start + turn_minutes(party_size)
+        tables = Table.__table__
+        while True:
+            with self._lock:
+                schedules = self._load(db, day)
+                candidates = self._free_candidates(db, schedules, location, party_size, start, end)
+                index = TABLE_ALLOCATION_POLICIES[policy or table_allocator.policy](candidates, party_size, child_seat_required)
+                if index is None:
+                    return None
+                table_id = candidates[index][1]
+            # A no-op write locks the table's row until the caller commits (and takes
+            # SQLite's write lock), so the bookings read next cannot change under us
+            db.connection().execute(update(tables).where(tables.c.id == table_id).values(size=tables.c.size))
+            booked = self._read_schedules(db, day, table_id).get(table_id)
+            db.info.setdefault("slot_book_days", set()).add(day)
+            with self._lock:
+                if booked is None or booked.is_free(start, end):
+                    schedules.setdefault(table_id, TableSchedule()).add(start, end)
+                    return db.get(Table, table_id)
+                # Booked by another process since the cache was loaded
+                self._days.pop(day, None)
+
+slot_book = SlotBook()
+
+@event.listens_for(SessionLocal, "after_flush")
+def _track_slot_changes(session, flush_context):
+    days = session.info.setdefault("slot_book_days", set())
+    for obj in session.new.union(session.dirty).union(session.deleted):
+        if isinstance(obj, Reservation):
+            days.add(obj.reservation_date or (obj.created_at or dt.datetime.now()).date())
+            history = attributes.get_history(obj, "reservation_date")
+            days.update(d for d in history.deleted if d)
+
+@event.listens_for(SessionLocal, "after_commit")
+def _apply_slot_changes(session):
+    for day in session.info.pop("slot_book_days", ()):
+        slot_book.invalidate(day)
+
+@event.listens_for(SessionLocal, "after_transaction_end")
+def _discard_slot_changes(session, transaction):
+    # Rollback, or close() without a commit: tentative holds from book() were never written
+    if transaction.parent is None:
+        for day in session.info.pop("slot_book_days", ()):
+            slot_book.invalidate(day)
+
+# Schema migrations
+# create_all only creates missing tables; it never alters an existing database
+# (new indexes, new columns). Changes like that are registered here as numbered
+# migrations and applied once, in order, at startup.
+def _create_indexes(connection, table, names):
+    for index in table.indexes:
+        if index.name in names:
+            index.create(connection, checkfirst=True)
+
+def migration_0001_reservation_waitlist_indexes(connection):
+    _create_indexes(connection, Reservation.__table__, {
+        "ix_reservations_created_at",
+        "ix_reservations_status_created_at",
+        "ix_reservations_customer_id_created_at",
+        "ix_reservations_table_id_status",
+        "ix_reservations_schedule",
+    })
+    _create_indexes(connection, WaitlistEntry.__table__, {
+        "ix_waitlist_entries_created_at",
+        "ix_waitlist_entries_status_created_at",
+    })
+
+def _add_column(connection, table, column):
+    existing = {c["name"] for c in inspect(connection).get_columns(table.name)}
+    if column.name not in existing:
+        column_type = column.type.compile(dialect=connection.dialect)
+        connection.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}")
+
+def migration_0002_reservation_location(connection):
+    _add_column(connection, Reservation.__table__, Reservation.__table__.c.location)
+    # Older rows only know their location through the assigned table
+    connection.exec_driver_sql(
+        "UPDATE reservations SET location = (SELECT tables.location FROM tables WHERE tables.id = reservations.table_id) "
+        "WHERE location IS NULL AND table_id IS NOT NULL"
+    )
+
+def migration_0003_analytics_rollups(connection):
+    rebuild_rollups(connection)
+
+def migration_0004_waitlist_table(connection):
+    _add_column(connection, WaitlistEntry.__table__, WaitlistEntry.__table__.c.table_id)
+
+def migration_0005_admin_user_token_revocation(connection):
+    _add_column(connection, AdminUser.__table__, AdminUser.__table__.c.tokens_valid_after)
+
+def migration_0006_report_snapshots(connection):
+    _create_indexes(connection, Report.__table__, {"uq_reports_date_type"})
+
+def migration_0007_notification_campaigns(connection):
+    _add_column(connection, NotificationOutbox.__table__, NotificationOutbox.__table__.c.campaign_id)
+    _create_indexes(connection, NotificationOutbox.__table__, {"ix_notification_outbox_campaign"})
+
+# Characters dropped from phone numbers for search; the query side is in Customer search
+PHONE_PUNCTUATION_CHARS = " ()+.-"
+
+def phone_digits_sql(column: str) -> str:
+    expression = column
+    for char in PHONE_PUNCTUATION_CHARS:
+        expression = f"replace({expression}, '{char}', '')"
+    return expression
+
+def migration_0008_customer_search(connection):
+    # Substring search over names, emails and phone digits (see Customer search)
+    dialect = connection.dialect.name
+    if dialect == "sqlite":
+        try:
+            connection.exec_driver_sql(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS customer_search USING fts5(name, email, phone, tokenize='trigram')"
+            )
+        except SQLAlchemyError as e:
+            print(f"[MIGRATION] No FTS5 trigram tokenizer (SQLite 3.34+); customer search scans the table: {e}")
+            return
+        connection.exec_driver_sql("DELETE FROM customer_search")
+        connection.exec_driver_sql(
+            "INSERT INTO customer_search (rowid, name, email, phone) "
+            f"SELECT id, name, email, {phone_digits_sql('phone_number')} FROM customers"
+        )
+        # Triggers keep it in step with every write: ORM, bulk import or another process
+        connection.exec_driver_sql(
+            "CREATE TRIGGER IF NOT EXISTS customers_search_insert AFTER INSERT ON customers BEGIN "
+            "INSERT INTO customer_search (rowid, name, email, phone) "
+            f"VALUES (new.id, new.name, new.email, {phone_digits_sql('new.phone_number')}); END"
+        )
+        connection.exec_driver_sql(
+            "CREATE TRIGGER IF NOT EXISTS customers_search_update AFTER UPDATE OF name, email, phone_number ON customers BEGIN "
+            "UPDATE customer_search SET name = new.name, email = new.email, "
+            f"phone = {phone_digits_sql('new.phone_number')} WHERE rowid = old.id; END"
+        )
+        connection.exec_driver_sql(
+            "CREATE TRIGGER IF NOT EXISTS customers_search_delete AFTER DELETE ON customers BEGIN "
+            "DELETE FROM customer_search WHERE rowid = old.id; END"
+        )
+    elif dialect == "postgresql":
+        try:
+            with connection.begin_nested():
+                connection.exec_driver_sql("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+                for name, expression in (
+                    ("ix_customers_name_trgm", "lower(name)"),
+                    ("ix_customers_email_trgm", "lower(coalesce(email, ''))"),
+                    ("ix_customers_phone_trgm", phone_digits_sql("phone_number")),
+                ):
+                    connection.exec_driver_sql(
+                        f"CREATE INDEX IF NOT EXISTS {name} ON customers USING gin (({expression}) gin_trgm_ops)"
+                    )
+        except SQLAlchemyError as e:
+            print(f"[MIGRATION] pg_trgm unavailable; customer search scans the table: {e}")
+
+MIGRATIONS = [
+    (1, "reservation_waitlist_indexes", migration_0001_reservation_waitlist_indexes),
+    (2, "reservation_location", migration_0002_reservation_location),
+    (3, "analytics_rollups", migration_0003_analytics_rollups),
+    (4, "waitlist_table", migration_0004_waitlist_table),
+    (5, "admin_user_token_revocation", migration_0005_admin_user_token_revocation),
+    (6, "report_snapshots", migration_0006_report_snapshots),
+    (7, "notification_campaigns", migration_0007_notification_campaigns),
+    (8, "customer_search", migration_0008_customer_search),
+]
+
+MIGRATION_LOCK_KEY = 0x5107_0000_0001  # pg_advisory_lock key held while migrating
+
+def run_migrations(bind=engine):
+    """Apply pending migrations in version order. Instances starting together take
+    turns: PostgreSQL holds an advisory lock (each migration commits on its own),
+    SQLite runs the whole pass in one BEGIN IMMEDIATE transaction. The applied
+    versions are read only once the lock is held."""
+    applied = []
+    with bind.connect() as connection:
+        dialect = connection.dialect.name
+        if dialect == "postgresql":
+            connection.execute(select(func.pg_advisory_lock(MIGRATION_LOCK_KEY)))
+            connection.commit()
+        elif dialect == "sqlite":
+            connection.exec_driver_sql("BEGIN IMMEDIATE")
+        try:
+            done = set(connection.execute(select(SchemaMigration.version)).scalars())
+            for version, name, migrate in sorted(MIGRATIONS, key=lambda m: m[0]):
+                if version in done:
+                    continue
+                migrate(connection)
+                connection.execute(SchemaMigration.__table__.insert().values(
+                    version=version, name=name, applied_at=dt.datetime.now()
+                ))
+                if dialect != "sqlite":
+                    connection.commit()
+                applied.append(version)
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            if dialect == "postgresql":
+                connection.execute(select(func.pg_advisory_unlock(MIGRATION_LOCK_KEY)))
+                connection.commit()
+    return applied
+
+run_migrations(engine)
+
+# Session tokens
+# admin_login issues a signed, expiring token per user: base64url(JSON claims)
+# "." base64url(HMAC-SHA256). The claims carry the user's permission mask, so a
+# request is authorized without touching the database. Deactivating, deleting
+# or changing the role or password of a user stamps tokens_valid_after; each
+# process keeps those stamps in memory (applied on commit, reloaded every
+# SESSION_REVOCATION_REFRESH_SECONDS to pick up other workers' changes).
+SESSION_SECRET = os.getenv("SECRET_KEY")
+SESSION_TOKEN_TTL_SECONDS = int(os.getenv("SESSION_TOKEN_TTL_SECONDS", str(12 * 3600)))
+SESSION_REVOCATION_REFRESH_SECONDS = float(os.getenv("SESSION_REVOCATION_REFRESH_SECONDS", "30"))
+
+if not SESSION_SECRET:
+    if not DEV_MODE:
+        raise RuntimeError(
+            "SECRET_KEY is not set. Set it to a long random value shared by every worker "
+            "(or DEV_MODE=1 for a per-process development key)"
+        )
+    SESSION_SECRET = base64.b64encode(os.urandom(32)).decode()
+    print("[WARNING] DEV_MODE: SECRET_KEY is not set; session tokens will not survive a restart or work across workers")
+
+class SessionPrincipal(BaseModel):
+    user_id: Optional[int] = None
+    username: Optional[str] = None
+    role: str
+    permissions: int
+
+def _b64encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+def _sign(payload: str) -> str:
+    return _b64encode(hmac.new(SESSION_SECRET.encode(), payload.encode(), hashlib.sha256).digest())
+
+def issue_session_token(user_id: int, username: str, role: str, now: float = None):
+    """Returns (token, expires_at timestamp)"""
+    now = now or dt.datetime.now().timestamp()
+    expires_at = now + SESSION_TOKEN_TTL_SECONDS
+    payload = _b64encode(json.dumps({
+        "sub": user_id,
+        "usr": username,
+        "role": role,
+        "perm": ROLE_PERMISSIONS.get(role, 0),
+        "iat": now,
+        "exp": expires_at,
+    }, separators=(",", ":")).encode())
+    return f"{payload}.{_sign(payload)}", expires_at
+
+def decode_session_token(token: str) -> dict:
+    """Verified claims of a token; ValueError if forged, malformed or expired"""
+    payload, _, signature = token.partition(".")
+    if not signature or not hmac.compare_digest(signature, _sign(payload)):
+        raise ValueError("Invalid session token")
+    try:
+        claims = json.loads(_b64decode(payload))
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("Invalid session token")
+    if claims.get("exp", 0) < dt.datetime.now().timestamp():
+        raise ValueError("Session token expired")
+    return claims
+
+class SessionRevocations:
+    """Per-process {user_id: timestamp before which that user's tokens are invalid}"""
+
+    def __init__(self, refresh_seconds: float = SESSION_REVOCATION_REFRESH_SECONDS):
+        self.refresh_seconds = refresh_seconds
+        self._valid_after = {}
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        valid_after = {}
+        db = SessionLocal()
+        try:
+            for user_id, is_active, stamp in db.query(AdminUser.id, AdminUser.is_active, AdminUser.tokens_valid_after):
+                if not is_active:
+                    valid_after[user_id] = float("inf")
+                elif stamp:
+                    valid_after[user_id] = stamp.timestamp()
+        finally:
+            db.close()
+        self._valid_after = valid_after
+        self._loaded_at = monotonic()
+
+    def is_revoked(self, user_id: int, issued_at: float) -> bool:
+        with self._lock:
+            if self._loaded_at is None or monotonic() - self._loaded_at >= self.refresh_seconds:
+                self._refresh()
+            return issued_at < self._valid_after.get(user_id, 0)
+
+    def apply(self, user_id: int, is_active: bool, tokens_valid_after: dt.datetime = None):
+        """Record a committed AdminUser change"""
+        with self._lock:
+            if not is_active:
+                self._valid_after[user_id] = float("inf")
+            elif tokens_valid_after:
+                self._valid_after[user_id] = tokens_valid_after.timestamp()
+
+session_revocations = SessionRevocations()
+
+@event.listens_for(SessionLocal, "after_flush")
+def _track_admin_user_changes(session, flush_context):
+    changes = session.info.setdefault("session_revocation_changes", [])
+    for obj in session.dirty:
+        if isinstance(obj, AdminUser):
+            changes.append((obj.id, obj.is_active, obj.tokens_valid_after))
+    for obj in session.deleted:
+        if isinstance(obj, AdminUser):
+            changes.append((obj.id, False, None))
+
+@event.listens_for(SessionLocal, "after_commit")
+def _apply_admin_user_changes(session):
+    for change in session.info.pop("session_revocation_changes", []):
+        session_revocations.apply(*change)
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _discard_admin_user_changes(session):
+    session.info.pop("session_revocation_changes", None)
+
+def authenticate(x_api_key: str = None, authorization: str = None) -> SessionPrincipal:
+    """Resolve a bearer token or x-api-key header to the calling principal"""
+    if authorization and authorization[:7].lower() == "bearer ":
+        credential = authorization[7:].strip()
+    else:
+        credential = x_api_key
+    if not credential:
+        raise HTTPException(status_code=401, detail="Missing credentials")
+    if ALLOW_STATIC_API_KEYS and credential == ADMIN_API_KEY:
+        return SessionPrincipal(role="admin", permissions=ROLE_PERMISSIONS["admin"])
+    if credential == PUBLIC_BOOKING_KEY:
+        return SessionPrincipal(role="public", permissions=ROLE_PERMISSIONS["public"])
+    try:
+        claims = decode_session_token(credential)
+    except ValueError as exc:
+        raise HTTPException(status_code=401, detail=str(exc))
+    if session_revocations.is_revoked(claims["sub"], claims["iat"]):
+        raise HTTPException(status_code=401, detail="Session revoked")
+    return SessionPrincipal(user_id=claims["sub"], username=claims["usr"], role=claims["role"], permissions=claims["perm"])
+
+def require_permission(permission: str):
+    """Route dependency: authenticate the caller and check one permission bit"""
+    bit = PERMISSION_BITS[permission]
+
+    def dependency(x_api_key: str = Header(None), authorization: str = Header(None)) -> SessionPrincipal:
+        principal = authenticate(x_api_key, authorization)
+        if not principal.permissions & bit:
+            raise HTTPException(status_code=403, detail=f"Missing permission: {permission}")
+        return principal
+
+    return dependency
+
 # Authentication Models (defined early to avoid import order issues)
 class LoginRequest(BaseModel):
     username: str
@@ -191,10 +1544,11 @@ class LoginRequest(BaseModel):
 class LoginResponse(BaseModel):
     success: bool
     message: str
-    api_key: Optional[str] = None
+    api_key: Optional[str] = None  # Session token; send as x-api-key or Authorization: Bearer
     user_role: Optional[str] = None
     user_id: Optional[int] = None
     username: Optional[str] = None
+    expires_at: Optional[datetime] = None
 
 class CapacityUpdate(BaseModel):
     new_capacity: int
@@ -269,6 +1623,7 @@ class WaitlistOut(BaseModel):
     estimated_wait_time: Optional[int] = None
     notes: Optional[str] = None
     wait_time_minutes: Optional[int] = None  # Calculated wait time
+    table_id: Optional[int] = None
 
     class Config:
         from_attributes = True
@@ -301,7 +1656,7 @@ class ReservationOut(BaseModel):
     children: int
     child_seat_required: bool
     status: str
-    queue_number: int
+    queue_number: Optional[int] = None  # None when a walk-in was moved to the waitlist
     created_at: dt.datetime
     notes: Optional[str] = None
     table_id: Optional[int] = None
@@ -314,6 +1669,270 @@ class ReservationOut(BaseModel):
     class Config:
         from_attributes = True
 
+# Read projections
+# List endpoints select exactly the columns ReservationOut/WaitlistOut need,
+# joined with the customer, so a whole list is one round trip instead of one
+# lazy r.customer load (or explicit customer query) per row.
+RESERVATION_OUT_COLUMNS = (
+    Reservation.id,
+    Customer.name.label("customer_name"),
+    Customer.phone_number,
+    Reservation.adults,
+    Reservation.children,
+    Reservation.child_seat_required,
+    Reservation.status,
+    Reservation.queue_number,
+    Reservation.created_at,
+    Reservation.notes,
+    Reservation.table_id,
+    Reservation.reservation_type,
+    Reservation.reservation_date,
+    Reservation.reservation_time,
+    Reservation.is_scheduled,
+)
+
+def reservation_out_select():
+    """SELECT of ReservationOut columns; run with Session.execute or AsyncSession.execute"""
+    return select(*RESERVATION_OUT_COLUMNS).select_from(Reservation).outerjoin(Customer, Reservation.customer_id == Customer.id)
+
+def reservation_out_from_row(row) -> ReservationOut:
+    return ReservationOut(
+        id=row.id,
+        customer_name=row.customer_name,
+        phone_number=row.phone_number,
+        adults=row.adults,
+        children=row.children,
+        child_seat_required=bool(row.child_seat_required),
+        status=row.status,
+        queue_number=row.queue_number,
+        created_at=row.created_at,
+        notes=row.notes,
+        table_id=row.table_id,
+        reservation_type=row.reservation_type,
+        reservation_date=row.reservation_date,
+        reservation_time=row.reservation_time,
+        is_scheduled=bool(row.is_scheduled)
+    )
+
+WAITLIST_OUT_COLUMNS = (
+    WaitlistEntry.id,
+    Customer.name.label("customer_name"),
+    Customer.phone_number,
+    WaitlistEntry.adults,
+    WaitlistEntry.children,
+    WaitlistEntry.child_seat_required,
+    WaitlistEntry.location,
+    WaitlistEntry.status,
+    WaitlistEntry.created_at,
+    WaitlistEntry.called_at,
+    WaitlistEntry.seated_at,
+    WaitlistEntry.estimated_wait_time,
+    WaitlistEntry.notes,
+    WaitlistEntry.table_id,
+)
+
+def waitlist_out_select():
+    return select(*WAITLIST_OUT_COLUMNS).select_from(WaitlistEntry).outerjoin(Customer, WaitlistEntry.customer_id == Customer.id)
+
+def waitlist_out_from_row(row, now: dt.datetime = None) -> WaitlistOut:
+    now = now or dt.datetime.now()
+    return WaitlistOut(
+        id=row.id,
+        customer_name=row.customer_name,
+        phone_number=row.phone_number,
+        adults=row.adults,
+        children=row.children,
+        child_seat_required=bool(row.child_seat_required),
+        location=row.location,
+        status=row.status,
+        created_at=row.created_at,
+        called_at=row.called_at,
+        seated_at=row.seated_at,
+        estimated_wait_time=row.estimated_wait_time,
+        notes=row.notes,
+        wait_time_minutes=int((now - row.created_at).total_seconds() / 60) if row.created_at else None,
+        table_id=row.table_id
+    )
+
+# Query counting
+# count_queries() counts the SQL statements issued in the current context (the
+# request, including its threadpool and async-engine work). tests/ uses it to pin
+# how many statements the polled read paths issue, so an N+1 fails the suite.
+_active_query_counter = ContextVar("active_query_counter", default=None)
+
+@event.listens_for(engine, "before_cursor_execute")
+def _count_query(connection, cursor, statement, parameters, context, executemany):
+    counter = _active_query_counter.get()
+    if counter is not None:
+        counter["count"] += 1
+
+@contextmanager
+def count_queries():
+    """Count SQL statements executed in the current context"""
+    counter = {"count": 0}
+    token = _active_query_counter.set(counter)
+    try:
+        yield counter
+    finally:
+        _active_query_counter.reset(token)
+
+# Async sessions
+# async def routes must not call SessionLocal(): every query would block the
+# event loop and stall all other connections. They use async_session(), backed
+# by an async engine on the same database. Async routes only read: every write
+# goes through a sync route (FastAPI runs those in its threadpool), because the
+# commit listeners (rollups, table allocator, slot book, floor status, search
+# index) take threading locks that must not be taken on the event loop thread,
+# and so SQLite keeps a single pool of writers.
+async_engine = None
+_async_session_factory = None
+
+def async_session() -> AsyncSession:
+    global async_engine, _async_session_factory
+    if _async_session_factory is None:
+        async_engine = create_configured_async_engine(DATABASE_URL)
+        event.listen(async_engine.sync_engine, "before_cursor_execute", _count_query)
+        track_response_cache_writes(async_engine.sync_engine)
+        _async_session_factory = async_sessionmaker(
+            async_engine, expire_on_commit=False, sync_session_class=SessionLocal.class_
+        )
+    return _async_session_factory()
+
+# Response cache
+# Dashboard and analytics polls are served from an in-process LRU keyed by
+# endpoint and parameters. Any committed write to reservations, waitlist
+# entries, tables, customers or the rollups clears it. Writes are seen at the
+# engine level, so ORM flushes, bulk Query.update() and Core statements (bulk
+# import, rollup maintenance) are all covered; the TTL bounds staleness from
+# other processes and from "now"-relative figures. Responses carry an ETag: a matching If-None-Match is
+# answered with 304 straight from the cache, without touching the database.
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "30"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "256"))
+RESPONSE_CACHE_TABLES = frozenset(
+    model.__tablename__ for model in (Reservation, WaitlistEntry, Table, Customer, AnalyticsRollup)
+)
+
+class ResponseCache:
+    """LRU of {key: (expires_at, etag, body)} cleared as a whole on writes"""
+
+    def __init__(self, ttl: float = RESPONSE_CACHE_TTL_SECONDS, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.generation = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.not_modified = self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= monotonic():
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, etag: str, body: bytes, generation: int):
+        with self._lock:
+            if generation != self.generation:
+                return  # A write committed while this response was computed
+            self._entries[key] = (monotonic() + self.ttl, etag, body)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def count_not_modified(self):
+        with self._lock:
+            self.not_modified += 1
+
+    def invalidate(self):
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "generation": self.generation,
+                "hits": self.hits,
+                "misses": self.misses,
+                "not_modified": self.not_modified,
+                "evictions": self.evictions,
+                "ttl_seconds": self.ttl,
+                "max_entries": self.max_entries,
+            }
+
+response_cache = ResponseCache()
+
+def _track_cached_table_writes(connection, cursor, statement, parameters, context, executemany):
+    if context is None or not (context.isinsert or context.isupdate or context.isdelete):
+        return
+    table = getattr(getattr(context.compiled, "statement", None), "table", None)
+    if table is not None and table.name in RESPONSE_CACHE_TABLES:
+        connection.info["response_cache_dirty"] = True
+
+def _invalidate_response_cache(connection):
+    if connection.info.pop("response_cache_dirty", None):
+        response_cache.invalidate()
+
+def _discard_cached_table_writes(connection):
+    connection.info.pop("response_cache_dirty", None)
+
+def track_response_cache_writes(bind):
+    """Clear the response cache when a transaction that wrote a cached source commits on `bind`"""
+    event.listen(bind, "after_cursor_execute", _track_cached_table_writes)
+    event.listen(bind, "commit", _invalidate_response_cache)
+    event.listen(bind, "rollback", _discard_cached_table_writes)
+
+track_response_cache_writes(engine)
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    return any(tag.strip() in (etag, "*", "W/" + etag) for tag in if_none_match.split(","))
+
+def cached_response(endpoint):
+    """Serve a GET endpoint through response_cache. Dependencies (auth) still run
+    on every request; the endpoint itself runs in the threadpool on a miss, so it
+    must be a plain (sync) function."""
+    if iscoroutinefunction(endpoint):
+        raise TypeError(f"cached_response needs a sync endpoint; {endpoint.__name__} is a coroutine function")
+    endpoint_signature = signature(endpoint)
+    dependency_names = {
+        name for name, parameter in endpoint_signature.parameters.items()
+        if isinstance(parameter.default, params.Depends)
+    }
+
+    @wraps(endpoint)
+    async def wrapper(_cache_request: Request, **kwargs):
+        key = (id(endpoint),) + tuple(
+            (name, str(value)) for name, value in sorted(kwargs.items()) if name not in dependency_names
+        )
+        if_none_match = _cache_request.headers.get("if-none-match")
+        entry = response_cache.get(key)
+        if entry is None:
+            generation = response_cache.generation
+            result = await run_in_threadpool(endpoint, **kwargs)
+            body = json.dumps(jsonable_encoder(result), separators=(",", ":")).encode()
+            etag = '"' + hashlib.sha1(body).hexdigest()[:20] + '"'
+            response_cache.put(key, etag, body, generation)
+        else:
+            _, etag, body = entry
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+        if _etag_matches(if_none_match, etag):
+            response_cache.count_not_modified()
+            return Response(status_code=304, headers=headers)
+        return Response(content=body, media_type="application/json", headers=headers)
+
+    wrapper.__signature__ = endpoint_signature.replace(parameters=[
+        Parameter("_cache_request", Parameter.KEYWORD_ONLY, annotation=Request),
+        *(parameter.replace(kind=Parameter.KEYWORD_ONLY) for parameter in endpoint_signature.parameters.values())
+    ])
+    return wrapper
+
 # Twilio placeholders (fill in when ready)
 TWILIO_ACCOUNT_SID = "your_twilio_account_sid"
 TWILIO_AUTH_TOKEN = "your_twilio_auth_token"
@@ -355,11 +1974,8 @@ def send_email_notification(to_email: str, subject: str, body: str):
         print(f"Failed to send email: {e}")
         return False
 
-def send_reservation_confirmation_email(customer_name: str, customer_email: str, reservation_data: dict):
-    """Send reservation confirmation email"""
-    if not customer_email:
-        return False
-    
+def reservation_confirmation_email_content(customer_name: str, reservation_data: dict):
+    """Subject and body of the reservation confirmation email"""
     subject = f"Reservation Confirmed - {reservation_data.get('restaurant_name', 'Barrana Restaurant')}"
     
     body = f"""
@@ -382,6 +1998,14 @@ Best regards,
 {reservation_data.get('restaurant_name', 'Barrana Restaurant')}
     """
     
+    return subject, body
+
+def send_reservation_confirmation_email(customer_name: str, customer_email: str, reservation_data: dict):
+    """Send reservation confirmation email"""
+    if not customer_email:
+        return False
+    
+    subject, body = reservation_confirmation_email_content(customer_name, reservation_data)
     return send_email_notification(customer_email, subject, body)
 
 def send_waitlist_notification_email(customer_name: str, customer_email: str, waitlist_data: dict):
@@ -449,8 +2073,8 @@ def send_sms_notification(phone_number: str, message: str):
         print(f"Failed to send SMS: {e}")
         return False
 
-def send_reservation_confirmation_sms(phone_number: str, reservation_data: dict):
-    """Send reservation confirmation SMS"""
+def reservation_confirmation_sms_content(reservation_data: dict) -> str:
+    """Text of the reservation confirmation SMS"""
     message = f"""
 Barrana Restaurant - Reservation Confirmed
 Date: {reservation_data.get('reservation_date', 'Today')}
@@ -460,7 +2084,408 @@ Party: {reservation_data.get('adults', 0)}A {reservation_data.get('children', 0)
 Location: {reservation_data.get('location', 'Indoor')}
     """
     
-    return send_sms_notification(phone_number, message.strip())
+    return message.strip()
+
+def send_reservation_confirmation_sms(phone_number: str, reservation_data: dict):
+    """Send reservation confirmation SMS"""
+    return send_sms_notification(phone_number, reservation_confirmation_sms_content(reservation_data))
+
+# Notification outbox
+# Notifications are written to the notification_outbox table in the same
+# transaction as the booking and delivered by background worker threads, so a
+# slow provider never adds to booking latency. Workers claim due messages per
+# channel in batches, reuse provider clients/SMTP connections across batches and
+# retry failures with exponential backoff.
+NOTIFICATION_PROVIDER = os.getenv("NOTIFICATION_PROVIDER", "console")  # console, fake, live
+NOTIFICATION_WORKERS = int(os.getenv("NOTIFICATION_WORKERS", "2"))
+# Web processes only enqueue; delivery runs in `manage.py dispatch-notifications`
+# unless this is set (handy for a single-process development server)
+NOTIFICATION_DISPATCH_IN_WEB = os.getenv("NOTIFICATION_DISPATCH_IN_WEB", "0").lower() in ("1", "true", "yes")
+NOTIFICATION_FAKE_KEEP = 1000  # Messages the fake provider keeps for inspection
+NOTIFICATION_BATCH_SIZE = int(os.getenv("NOTIFICATION_BATCH_SIZE", "50"))
+NOTIFICATION_MAX_ATTEMPTS = int(os.getenv("NOTIFICATION_MAX_ATTEMPTS", "5"))
+NOTIFICATION_RETRY_BASE_SECONDS = float(os.getenv("NOTIFICATION_RETRY_BASE_SECONDS", "5"))
+NOTIFICATION_RETRY_MAX_SECONDS = float(os.getenv("NOTIFICATION_RETRY_MAX_SECONDS", "600"))
+NOTIFICATION_LEASE_SECONDS = 120  # A claimed batch not finished by then is retried
+NOTIFICATION_POLL_SECONDS = 2
+NOTIFICATION_THROTTLE_POLL_SECONDS = 0.2
+# Send rates per channel, e.g. "sms=10,whatsapp=20" (messages/second); unset channels are unlimited.
+# The budget lives in notification_rate_limits, so it holds across every dispatcher process.
+NOTIFICATION_RATE_LIMITS = os.getenv("NOTIFICATION_RATE_LIMITS", "")
+
+SMTP_HOST = os.getenv("SMTP_HOST", "smtp.gmail.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
+SMTP_USER = os.getenv("SMTP_USER")
+SMTP_PASS = os.getenv("SMTP_PASS")
+SMTP_FROM = os.getenv("SMTP_FROM", SMTP_USER or "reservations@localhost")
+TWILIO_SMS_FROM = os.getenv("TWILIO_SMS_FROM")
+
+def enqueue_notification(db: Session, channel: str, recipient: str, body: str, subject: str = None):
+    """Add a message to the outbox; it is sent once the caller's transaction commits"""
+    db.add(NotificationOutbox(channel=channel, recipient=recipient, subject=subject, body=body))
+    db.info["notifications_enqueued"] = True
+
+def enqueue_reservation_notifications(db: Session, customer: Customer, reservation_data: dict):
+    if customer.email:
+        subject, body = reservation_confirmation_email_content(customer.name, reservation_data)
+        enqueue_notification(db, "email", customer.email, body, subject)
+    enqueue_notification(db, "sms", customer.phone_number, reservation_confirmation_sms_content(reservation_data))
+
+class ConsoleNotificationProvider:
+    """Prints messages, like the original mocked senders"""
+
+    def send_batch(self, channel, messages):
+        for message in messages:
+            if channel == "email":
+                send_email_notification(message.recipient, message.subject, message.body)
+            elif channel == "sms":
+                send_sms_notification(message.recipient, message.body)
+            else:
+                print(f"[MOCK] WhatsApp notification to {message.recipient}: {message.body}")
+        return [None] * len(messages)
+
+class FakeNotificationProvider:
+    """In-memory sink for offline load tests, with optional latency and failure rate"""
+
+    def __init__(self, latency_ms: float = 0, failure_rate: float = 0, keep: int = NOTIFICATION_FAKE_KEEP):
+        self.latency_ms = latency_ms
+        self.failure_rate = failure_rate
+        self.sent = deque(maxlen=keep)  # The most recent messages only
+        self.sent_count = 0
+        self._lock = threading.Lock()
+
+    def send_batch(self, channel, messages):
+        if self.latency_ms:
+            sleep(self.latency_ms / 1000)
+        errors = []
+        for message in messages:
+            if self.failure_rate and random.random() < self.failure_rate:
+                errors.append("Simulated provider failure")
+                continue
+            with self._lock:
+                self.sent.append((channel, message.recipient, message.subject, message.body))
+                self.sent_count += 1
+            errors.append(None)
+        return errors
+
+class SMTPEmailProvider:
+    """Sends email over one SMTP connection per worker thread, kept open between batches"""
+
+    def __init__(self, host: str, port: int, username: str = None, password: str = None, sender: str = SMTP_FROM):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.sender = sender
+        self._local = threading.local()
+
+    def _connect(self):
+        if self.port == 465:
+            smtp = smtplib.SMTP_SSL(self.host, self.port, timeout=30)
+        else:
+            smtp = smtplib.SMTP(self.host, self.port, timeout=30)
+            if self.username:
+                smtp.starttls()
+        if self.username:
+            smtp.login(self.username, self.password)
+        self._local.smtp = smtp
+        return smtp
+
+    def _connection(self):
+        smtp = getattr(self._local, "smtp", None)
+        return smtp if smtp is not None else self._connect()
+
+    def send_batch(self, channel, messages):
+        errors = []
+        for message in messages:
+            email = EmailMessage()
+            email["Subject"] = message.subject or ""
+            email["From"] = self.sender
+            email["To"] = message.recipient
+            email.set_content(message.body)
+            try:
+                try:
+                    self._connection().send_message(email)
+                except smtplib.SMTPServerDisconnected:
+                    self._connect().send_message(email)
+                errors.append(None)
+            except Exception as e:
+                self._local.smtp = None
+                errors.append(str(e))
+        return errors
+
+class TwilioProvider:
+    """SMS/WhatsApp through one shared Twilio client"""
+
+    def __init__(self, account_sid: str, auth_token: str):
+        self.account_sid = account_sid
+        self.auth_token = auth_token
+        self._client = None
+        self._lock = threading.Lock()
+
+    def _get_client(self):
+        with self._lock:
+            if self._client is None:
+                from twilio.rest import Client
+                self._client = Client(self.account_sid, self.auth_token)
+            return self._client
+
+    def send_batch(self, channel, messages):
+        client = self._get_client()
+        errors = []
+        for message in messages:
+            try:
+                if channel == "whatsapp":
+                    client.messages.create(body=message.body, from_=TWILIO_WHATSAPP_FROM, to=f"whatsapp:{message.recipient}")
+                else:
+                    client.messages.create(body=message.body, from_=TWILIO_SMS_FROM, to=message.recipient)
+                errors.append(None)
+            except Exception as e:
+                errors.append(str(e))
+        return errors
+
+def build_notification_providers(mode: str = NOTIFICATION_PROVIDER) -> dict:
+    """Channel -> provider for the configured mode"""
+    if mode == "fake":
+        fake = FakeNotificationProvider(
+            latency_ms=float(os.getenv("NOTIFICATION_FAKE_LATENCY_MS", "0")),
+            failure_rate=float(os.getenv("NOTIFICATION_FAKE_FAILURE_RATE", "0"))
+        )
+        return {"email": fake, "sms": fake, "whatsapp": fake}
+    if mode == "live":
+        twilio = TwilioProvider(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
+        return {
+            "email": SMTPEmailProvider(SMTP_HOST, SMTP_PORT, SMTP_USER, SMTP_PASS),
+            "sms": twilio,
+            "whatsapp": twilio if USE_TWILIO_WHATSAPP else ConsoleNotificationProvider()
+        }
+    console = ConsoleNotificationProvider()
+    return {"email": console, "sms": console, "whatsapp": console}
+
+def parse_rate_limits(spec: str) -> dict:
+    """'sms=10,whatsapp=20' -> {'sms': 10.0, 'whatsapp': 20.0}"""
+    limits = {}
+    for part in spec.split(","):
+        if part.strip():
+            channel, _, rate = part.partition("=")
+            limits[channel.strip()] = float(rate)
+    return limits
+
+class RateLimiter:
+    """Fixed windows allowing `rate` messages per second for one channel (one message per
+    1/rate seconds below 1/s), counted in the channel's notification_rate_limits row so
+    that every dispatcher process draws on the same budget"""
+
+    def __init__(self, channel: str, rate: float):
+        self.channel = channel
+        self.window = max(1.0, 1.0 / rate)
+        self.per_window = max(1, int(rate * self.window))
+
+    def take(self, connection, wanted: int, now: float = None) -> int:
+        """Reserve up to `wanted` sends in the current window; returns how many were granted.
+        The row stays locked until the caller's transaction ends."""
+        table = NotificationRateLimit.__table__
+        now = dt.datetime.now().timestamp() if now is None else now
+        window_start = now - now % self.window
+        # A dispatcher whose clock lags never rewinds the window another one already opened
+        current = table.c.window_start >= window_start
+        roll = update(table).where(table.c.channel == self.channel).values(
+            used=case((current, table.c.used), else_=0),
+            window_start=case((current, table.c.window_start), else_=window_start)
+        )
+        if connection.execute(roll).rowcount == 0:
+            _insert_ignoring_conflicts(connection, table, {"channel": self.channel, "window_start": window_start, "used": 0})
+            connection.execute(roll)
+        used = connection.execute(select(table.c.used).where(table.c.channel == self.channel)).scalar()
+        granted = max(0, min(wanted, self.per_window - used))
+        if granted:
+            connection.execute(update(table).where(table.c.channel == self.channel).values(used=table.c.used + granted))
+        return granted
+
+    def give_back(self, connection, count: int):
+        table = NotificationRateLimit.__table__
+        connection.execute(update(table).where(table.c.channel == self.channel).values(used=table.c.used - count))
+
+class NotificationDispatcher:
+    """Background worker pool draining the notification outbox"""
+
+    def __init__(self, bind, providers: dict, workers: int = NOTIFICATION_WORKERS, batch_size: int = NOTIFICATION_BATCH_SIZE,
+                 rate_limits: dict = None):
+        self.bind = bind
+        self.providers = providers
+        self.workers = workers
+        self.batch_size = batch_size
+        self.rate_limiters = {channel: RateLimiter(channel, rate) for channel, rate in (rate_limits or {}).items()}
+        self._throttled = False
+        self._threads = []
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+
+    def start(self):
+        if self._threads:
+            return
+        self._stopping.clear()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"notification-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float = 5):
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def wake(self):
+        self._wakeup.set()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                delivered = self.dispatch_once()
+            except Exception as e:
+                print(f"[NOTIFICATIONS] Dispatch error: {e}")
+                delivered = 0
+            if not delivered:
+                self._wakeup.wait(NOTIFICATION_THROTTLE_POLL_SECONDS if self._throttled else NOTIFICATION_POLL_SECONDS)
+                self._wakeup.clear()
+
+    def dispatch_once(self) -> int:
+        """Claim and deliver at most one batch per channel; returns the number of messages handled"""
+        handled = 0
+        throttled = False
+        for channel, provider in self.providers.items():
+            batch = self._claim(channel)
+            if batch is None:
+                throttled = True
+                continue
+            if batch:
+                self._deliver(provider, channel, batch)
+                handled += len(batch)
+        self._throttled = throttled
+        return handled
+
+    def _claim(self, channel):
+        """Claim a batch of due messages; None when the channel's rate limit is used up"""
+        outbox = NotificationOutbox.__table__
+        token = uuid.uuid4().hex
+        now = dt.datetime.now()
+        due = and_(
+            outbox.c.channel == channel,
+            outbox.c.status.in_(["pending", "sending"]),
+            outbox.c.next_attempt_at <= now
+        )
+        columns = (outbox.c.id, outbox.c.recipient, outbox.c.subject, outbox.c.body, outbox.c.attempts)
+        limiter = self.rate_limiters.get(channel)
+        with self.bind.begin() as connection:
+            limit = limiter.take(connection, self.batch_size) if limiter else self.batch_size
+            if not limit:
+                return None
+            # SKIP LOCKED lets instances sharing a server database claim disjoint batches
+            # Booking notifications go before campaign messages
+            ids = select(outbox.c.id).where(due).order_by(
+                outbox.c.campaign_id.isnot(None), outbox.c.id
+            ).limit(limit).with_for_update(
+                skip_locked=True
+            ).scalar_subquery()
+            claim = update(outbox).where(outbox.c.id.in_(ids), due).values(
+                status="sending",
+                claim_token=token,
+                next_attempt_at=now + dt.timedelta(seconds=NOTIFICATION_LEASE_SECONDS)
+            )
+            if connection.dialect.update_returning:
+                batch = sorted(connection.execute(claim.returning(*columns)).all(), key=lambda row: row.id)
+            else:
+                connection.execute(claim)
+                batch = connection.execute(select(*columns).where(outbox.c.claim_token == token).order_by(outbox.c.id)).all()
+            if limiter and len(batch) < limit:
+                limiter.give_back(connection, limit - len(batch))
+            return batch
+
+    def _deliver(self, provider, channel, batch):
+        try:
+            errors = provider.send_batch(channel, batch)
+        except Exception as e:
+            errors = [str(e)] * len(batch)
+        outbox = NotificationOutbox.__table__
+        now = dt.datetime.now()
+        sent = [message.id for message, error in zip(batch, errors) if error is None]
+        with self.bind.begin() as connection:
+            if sent:
+                connection.execute(update(outbox).where(outbox.c.id.in_(sent)).values(
+                    status="sent", sent_at=now, attempts=outbox.c.attempts + 1, last_error=None
+                ))
+            for message, error in zip(batch, errors):
+                if error is None:
+                    continue
+                attempts = message.attempts + 1
+                if attempts >= NOTIFICATION_MAX_ATTEMPTS:
+                    values = {"status": "failed"}
+                else:
+                    backoff = min(NOTIFICATION_RETRY_BASE_SECONDS * 2 ** (attempts - 1), NOTIFICATION_RETRY_MAX_SECONDS)
+                    backoff += random.uniform(0, NOTIFICATION_RETRY_BASE_SECONDS)
+                    values = {"status": "pending", "next_attempt_at": now + dt.timedelta(seconds=backoff)}
+                connection.execute(update(outbox).where(outbox.c.id == message.id).values(
+                    attempts=attempts, last_error=error[:500], **values
+                ))
+
+notification_dispatcher = NotificationDispatcher(
+    engine, build_notification_providers(), rate_limits=parse_rate_limits(NOTIFICATION_RATE_LIMITS)
+)
+
+@event.listens_for(SessionLocal, "after_commit")
+def _wake_notification_workers(session):
+    if session.info.pop("notifications_enqueued", None):
+        notification_dispatcher.wake()
+
+@app.on_event("startup")
+def start_notification_workers():
+    if NOTIFICATION_DISPATCH_IN_WEB and NOTIFICATION_WORKERS > 0:
+        notification_dispatcher.start()
+
+@app.on_event("shutdown")
+def stop_notification_workers():
+    notification_dispatcher.stop()
+
+def notification_queue_depth(db: Session) -> dict:
+    """{channel: {status: count}} for messages not yet delivered"""
+    depth = {}
+    rows = db.query(NotificationOutbox.channel, NotificationOutbox.status, func.count(NotificationOutbox.id)).filter(
+        NotificationOutbox.status.in_(["pending", "sending", "failed"])
+    ).group_by(NotificationOutbox.channel, NotificationOutbox.status).all()
+    for channel, status, count in rows:
+        depth.setdefault(channel, {})[status] = count
+    return depth
+
+@app.get("/admin/database/pool")
+def admin_database_pool(dep=Depends(require_permission("settings"))):
+    """Connection pool state, checkout/wait metrics and SQLite settings"""
+    status = pool_status(engine)
+    if async_engine is not None:
+        status["async"] = pool_status(async_engine.sync_engine, async_pool_metrics)
+    return status
+
+@app.get("/admin/cache")
+def admin_response_cache_stats(dep=Depends(require_permission("settings"))):
+    """Response cache hit/miss counters"""
+    return response_cache.stats()
+
+@app.get("/admin/notifications/queue")
+def admin_notification_queue(dep=Depends(require_permission("settings"))):
+    """Outbox depth per channel and status"""
+    db = SessionLocal()
+    try:
+        depth = notification_queue_depth(db)
+        return {
+            "queue": depth,
+            "pending": sum(d.get("pending", 0) + d.get("sending", 0) for d in depth.values()),
+            "failed": sum(d.get("failed", 0) for d in depth.values()),
+            "workers": len(notification_dispatcher._threads),
+            "provider": NOTIFICATION_PROVIDER
+        }
+    finally:
+        db.close()
 
 @app.put("/tables/{table_id}/capacity")
 def update_table_capacity(table_id: int, update: CapacityUpdate):
@@ -497,19 +2522,12 @@ def create_reservation(reservation: ReservationCreate):
         db.add(customer)
         db.commit()
         db.refresh(customer)
-    # Assign queue number (max + 1 for today)
-    today = dt.datetime.now().date()
-    last_queue = db.query(Reservation).filter(
-        Reservation.created_at >= dt.datetime.combine(today, dt.time.min),
-        Reservation.created_at <= dt.datetime.combine(today, dt.time.max)
-    ).order_by(Reservation.queue_number.desc()).first()
-    queue_number = 1 if not last_queue else last_queue.queue_number + 1
-    # Find available table (stub: just None for now)
-    table = db.query(Table).filter(
-        Table.location == reservation.location,
-        Table.is_occupied == False,
-        Table.size >= (reservation.adults + reservation.children)
-    ).first()
+    # Assign today's next queue number
+    queue_number = queue_numbers.next(db)
+    # Suggest the best-fitting free table (not claimed until the party is seated)
+    table = table_allocator.find(
+        db, reservation.location, reservation.adults + reservation.children, reservation.child_seat_required
+    )
     table_id = table.id if table else None
     # Create reservation
     new_reservation = Reservation(
@@ -522,24 +2540,27 @@ def create_reservation(reservation: ReservationCreate):
         queue_number=queue_number,
         notes=reservation.notes,
         created_at=dt.datetime.now(),
-        reservation_type=reservation.reservation_type
+        reservation_type=reservation.reservation_type,
+        location=reservation.location
     )
     db.add(new_reservation)
+    # WhatsApp confirmation, delivered by the notification workers after commit
+    enqueue_notification(db, "whatsapp", customer.phone_number, f"Your reservation is confirmed! Your queue number is {queue_number}.")
     db.commit()
     db.refresh(new_reservation)
-    # WhatsApp notification stub
-    send_whatsapp_notification(customer.phone_number, queue_number)
     db.close()
     return {"message": "Reservation created", "queue_number": queue_number, "table_id": table_id}
 
 # Waitlist Management Endpoints
 @app.post("/admin/waitlist", response_model=WaitlistOut)
-def admin_add_to_waitlist(waitlist_entry: WaitlistCreate, dep=Depends(verify_admin_api_key)):
+def admin_add_to_waitlist(waitlist_entry: WaitlistCreate, dep=Depends(require_permission("reservations"))):
     """Add a customer to the waitlist"""
     db = SessionLocal()
     try:
         # Check if customer exists, create if not
-        customer = db.query(Customer).filter(Customer.phone_number == waitlist_entry.phone_number).first()
+        customer = db.execute(
+            select(Customer).where(Customer.phone_number == waitlist_entry.phone_number)
+        ).scalars().first()
         if not customer:
             customer = Customer(
                 name=waitlist_entry.name,
@@ -547,8 +2568,7 @@ def admin_add_to_waitlist(waitlist_entry: WaitlistCreate, dep=Depends(verify_adm
                 email=waitlist_entry.email
             )
             db.add(customer)
-            db.commit()
-            db.refresh(customer)
+            db.flush()
         
         # Create waitlist entry
         waitlist = WaitlistEntry(
@@ -562,7 +2582,6 @@ def admin_add_to_waitlist(waitlist_entry: WaitlistCreate, dep=Depends(verify_adm
         )
         db.add(waitlist)
         db.commit()
-        db.refresh(waitlist)
         
         # Return with customer info
         result = WaitlistOut(
@@ -585,43 +2604,17 @@ def admin_add_to_waitlist(waitlist_entry: WaitlistCreate, dep=Depends(verify_adm
         db.close()
 
 @app.get("/admin/waitlist", response_model=List[WaitlistOut])
-def admin_list_waitlist(dep=Depends(verify_admin_api_key)):
+async def admin_list_waitlist(dep=Depends(require_permission("reservations"))):
     """List all waitlist entries"""
-    db = SessionLocal()
-    try:
-        waitlist_entries = db.query(WaitlistEntry).filter(
+    async with async_session() as db:
+        rows = (await db.execute(waitlist_out_select().where(
             WaitlistEntry.status.in_(["Waiting", "Called"])
-        ).order_by(WaitlistEntry.created_at.asc()).all()
-        
-        result = []
-        for entry in waitlist_entries:
-            customer = db.query(Customer).filter(Customer.id == entry.customer_id).first()
-            wait_time = None
-            if entry.created_at:
-                wait_time = int((dt.datetime.now() - entry.created_at).total_seconds() / 60)
-            
-            result.append(WaitlistOut(
-                id=entry.id,
-                customer_name=customer.name if customer else None,
-                phone_number=customer.phone_number if customer else None,
-                adults=entry.adults,
-                children=entry.children,
-                child_seat_required=entry.child_seat_required,
-                location=entry.location,
-                status=entry.status,
-                created_at=entry.created_at,
-                called_at=entry.called_at,
-                seated_at=entry.seated_at,
-                estimated_wait_time=entry.estimated_wait_time,
-                notes=entry.notes,
-                wait_time_minutes=wait_time
-            ))
-        return result
-    finally:
-        db.close()
+        ).order_by(WaitlistEntry.created_at.asc()))).all()
+    now = dt.datetime.now()
+    return [waitlist_out_from_row(row, now) for row in rows]
 
 @app.put("/admin/waitlist/{waitlist_id}")
-def admin_update_waitlist_status(waitlist_id: int, update: WaitlistStatusUpdate, dep=Depends(verify_admin_api_key)):
+def admin_update_waitlist_status(waitlist_id: int, update: WaitlistStatusUpdate, dep=Depends(require_permission("reservations"))):
     """Update waitlist entry status"""
     db = SessionLocal()
     try:
@@ -640,18 +2633,23 @@ def admin_update_waitlist_status(waitlist_id: int, update: WaitlistStatusUpdate,
             waitlist.called_at = dt.datetime.now()
         elif update.status == "Seated":
             waitlist.seated_at = dt.datetime.now()
+            if waitlist.table_id is None:
+                table = table_allocator.allocate(
+                    db, waitlist.location, waitlist.adults + waitlist.children, waitlist.child_seat_required
+                )
+                waitlist.table_id = table.id if table else None
         
         db.commit()
-        return {"message": "Waitlist status updated successfully"}
+        return {"message": "Waitlist status updated successfully", "table_id": waitlist.table_id}
     finally:
         db.close()
 
 @app.delete("/admin/waitlist/{waitlist_id}")
-def admin_remove_from_waitlist(waitlist_id: int, dep=Depends(verify_admin_api_key)):
+def admin_remove_from_waitlist(waitlist_id: int, dep=Depends(require_permission("reservations"))):
     """Remove customer from waitlist"""
     db = SessionLocal()
     try:
-        waitlist = db.query(WaitlistEntry).filter(WaitlistEntry.id == waitlist_id).first()
+        waitlist = db.get(WaitlistEntry, waitlist_id)
         if not waitlist:
             raise HTTPException(status_code=404, detail="Waitlist entry not found")
         
@@ -662,8 +2660,35 @@ def admin_remove_from_waitlist(waitlist_id: int, dep=Depends(verify_admin_api_ke
         db.close()
 
 # Enhanced reservation creation with conflict detection
+@app.get("/admin/availability")
+def admin_slot_availability(
+    reservation_date: date,
+    reservation_time: str,
+    location: str,
+    party_size: int = Query(..., ge=1),
+    child_seat_required: bool = False,
+    dep=Depends(require_permission("booking"))
+):
+    """Can a party of this size be seated at this date and time for a full turn"""
+    db = SessionLocal()
+    try:
+        try:
+            table_id, free_tables = slot_book.availability(
+                db, reservation_date, reservation_time, location, party_size, child_seat_required
+            )
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail=str(exc))
+        return {
+            "available": table_id is not None,
+            "table_id": table_id,
+            "free_tables": free_tables,
+            "turn_minutes": turn_minutes(party_size)
+        }
+    finally:
+        db.close()
+
 @app.post("/admin/reservations", response_model=ReservationOut)
-def admin_create_reservation(reservation: ReservationCreate, dep=Depends(verify_admin_api_key)):
+def admin_create_reservation(reservation: ReservationCreate, dep=Depends(require_permission("booking"))):
     """Create a new reservation with enhanced features"""
     db = SessionLocal()
     try:
@@ -679,37 +2704,28 @@ def admin_create_reservation(reservation: ReservationCreate, dep=Depends(verify_
             db.commit()
             db.refresh(customer)
         
-        # For scheduled reservations, check for conflicts
-        if reservation.is_scheduled and reservation.reservation_date and reservation.reservation_time:
-            # Check for table conflicts at the same time
-            conflicting_reservations = db.query(Reservation).filter(
-                Reservation.reservation_date == reservation.reservation_date,
-                Reservation.reservation_time == reservation.reservation_time,
-                Reservation.status.in_(["Queued", "Seated"]),
-                Reservation.table_id.isnot(None)
-            ).all()
-            
-            if conflicting_reservations:
-                # Check if we have available tables
-                available_tables = db.query(Table).filter(
-                    Table.location == reservation.location,
-                    Table.size >= (reservation.adults + reservation.children),
-                    Table.is_occupied == False
-                ).all()
-                
-                if len(available_tables) <= len(conflicting_reservations):
-                    # No tables available, suggest waitlist
-                    raise HTTPException(
-                        status_code=409, 
-                        detail=f"No tables available for {reservation.reservation_time} on {reservation.reservation_date}. Consider adding to waitlist."
-                    )
-        
-        # Find available table
-        table = db.query(Table).filter(
-            Table.location == reservation.location,
-            Table.size >= (reservation.adults + reservation.children),
-            Table.is_occupied == False
-        ).first()
+        scheduled_slot = bool(reservation.is_scheduled and reservation.reservation_date and reservation.reservation_time)
+        if scheduled_slot:
+            # Hold a table for the reservation's turn on that date; tables that are
+            # busy right now do not matter for a future slot
+            try:
+                table = slot_book.book(
+                    db, reservation.reservation_date, reservation.reservation_time, reservation.location,
+                    reservation.adults + reservation.children, reservation.child_seat_required
+                )
+            except ValueError as exc:
+                raise HTTPException(status_code=400, detail=str(exc))
+            if not table:
+                # No tables available, suggest waitlist
+                raise HTTPException(
+                    status_code=409, 
+                    detail=f"No tables available for {reservation.reservation_time} on {reservation.reservation_date}. Consider adding to waitlist."
+                )
+        else:
+            # Claim the best-fitting free table
+            table = table_allocator.allocate(
+                db, reservation.location, reservation.adults + reservation.children, reservation.child_seat_required
+            )
         
         # If no table available and it's a walk-in, add to waitlist
         if not table and not reservation.is_scheduled:
@@ -745,9 +2761,8 @@ def admin_create_reservation(reservation: ReservationCreate, dep=Depends(verify_
                 "is_scheduled": reservation.is_scheduled
             }
         
-        # Get next queue number
-        max_queue = db.query(func.max(Reservation.queue_number)).scalar() or 0
-        queue_number = max_queue + 1
+        # Get today's next queue number
+        queue_number = queue_numbers.next(db)
         
         # Create reservation
         new_reservation = Reservation(
@@ -756,10 +2771,12 @@ def admin_create_reservation(reservation: ReservationCreate, dep=Depends(verify_
             adults=reservation.adults,
             children=reservation.children,
             child_seat_required=reservation.child_seat_required,
-            status="Queued" if not table else "Seated",
+            # A scheduled booking holds its table for the slot but is not seated yet
+            status="Seated" if table and not scheduled_slot else "Queued",
             queue_number=queue_number,
             notes=reservation.notes,
             reservation_type=reservation.reservation_type,
+            location=reservation.location,
             reservation_date=reservation.reservation_date,
             reservation_time=reservation.reservation_time,
             is_scheduled=reservation.is_scheduled
@@ -767,9 +2784,18 @@ def admin_create_reservation(reservation: ReservationCreate, dep=Depends(verify_
         
         db.add(new_reservation)
         
-        # Mark table as occupied if assigned
-        if table:
-            table.is_occupied = True
+        # Queue confirmations in the same transaction; workers send them after commit
+        reservation_data = {
+            "restaurant_name": "Barrana Restaurant",
+            "reservation_date": reservation.reservation_date,
+            "reservation_time": reservation.reservation_time,
+            "adults": reservation.adults,
+            "children": reservation.children,
+            "location": reservation.location,
+            "queue_number": queue_number,
+            "notes": reservation.notes
+        }
+        enqueue_reservation_notifications(db, customer, reservation_data)
         
         db.commit()
         db.refresh(new_reservation)
@@ -793,66 +2819,49 @@ def admin_create_reservation(reservation: ReservationCreate, dep=Depends(verify_
             is_scheduled=new_reservation.is_scheduled
         )
         
-        # Send notifications
-        reservation_data = {
-            "restaurant_name": "Barrana Restaurant",
-            "reservation_date": reservation.reservation_date,
-            "reservation_time": reservation.reservation_time,
-            "adults": reservation.adults,
-            "children": reservation.children,
-            "location": reservation.location,
-            "queue_number": queue_number,
-            "notes": reservation.notes
-        }
-        
-        # Send email notification
-        if customer.email:
-            send_reservation_confirmation_email(customer.name, customer.email, reservation_data)
-        
-        # Send SMS notification
-        send_reservation_confirmation_sms(customer.phone_number, reservation_data)
-        
         return result
     finally:
         db.close()
 
 @app.post("/admin/login", response_model=LoginResponse)
 async def admin_login(login_data: LoginRequest):
-    db = SessionLocal()
-    try:
+    async with async_session() as db:
         # Check database users first
-        user = db.query(AdminUser).filter(
+        user = (await db.execute(select(AdminUser).where(
             AdminUser.username == login_data.username,
             AdminUser.is_active == True
-        ).first()
+        ))).scalars().first()
         
         if user and verify_password(login_data.password, user.password_hash):
+            token, expires_at = issue_session_token(user.id, user.username, user.role)
             return LoginResponse(
                 success=True,
                 message="Login successful",
-                api_key=ADMIN_API_KEY,
+                api_key=token,
+                expires_at=datetime.fromtimestamp(expires_at),
                 user_role=user.role,
                 user_id=user.id,
                 username=user.username
             )
         
-        # Fallback to hardcoded admin for backward compatibility
-        if login_data.username == "admin" and login_data.password == "password":
-            return LoginResponse(
-                success=True,
-                message="Login successful",
-                api_key=ADMIN_API_KEY,
-                user_role="admin",
-                user_id=0,
-                username="admin"
-            )
-        
         raise HTTPException(status_code=401, detail="Invalid username or password")
-    finally:
-        db.close()
+
+RESERVATION_PAGE_SIZE = 100
+RESERVATION_MAX_PAGE_SIZE = 500
+
+def encode_cursor(created_at: dt.datetime, row_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{created_at.isoformat()}|{row_id}".encode()).decode()
+
+def decode_cursor(cursor: str):
+    try:
+        created_at, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return dt.datetime.fromisoformat(created_at), int(row_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
 
 @app.get("/admin/reservations", response_model=List[ReservationOut])
-def admin_list_reservations(
+async def admin_list_reservations(
+    response: Response,
     search: Optional[str] = Query(None),
     status: Optional[str] = Query(None),
     min_queue_minutes: Optional[int] = Query(None),
@@ -860,62 +2869,71 @@ def admin_list_reservations(
     end_date: Optional[date] = Query(None),
     table_size: Optional[int] = Query(None),
     location: Optional[str] = Query(None),
-    customer_type: Optional[str] = Query(None),
+    customer_type: Optional[str] = Query(None),  # new, repeat, vip
     show_no_shows: Optional[bool] = Query(False),
-    dep=Depends(verify_admin_api_key)
+    limit: int = Query(RESERVATION_PAGE_SIZE, ge=1, le=RESERVATION_MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None),
+    include_total: bool = Query(False),
+    dep=Depends(require_permission("reservations"))
 ):
-    db = SessionLocal()
-    query = db.query(Reservation).join(Customer).outerjoin(Table)
+    """Newest first, one page at a time. The next page's cursor is returned in the
+    X-Next-Cursor header; X-Total-Count is set when include_total=true."""
+    query = reservation_out_select()
 
     if search:
-        query = query.filter(
-            (Customer.name.ilike(f"%{search}%")) |
-            (Customer.phone_number.ilike(f"%{search}%"))
-        )
+        query = query.where(Reservation.customer_id.in_(customer_search_ids(search)))
     if status:
-        query = query.filter(Reservation.status == status)
+        query = query.where(Reservation.status == status)
     if min_queue_minutes and status == "queued":
         queue_time_threshold = dt.datetime.now() - timedelta(minutes=min_queue_minutes)
-        query = query.filter(Reservation.created_at <= queue_time_threshold)
+        query = query.where(Reservation.created_at <= queue_time_threshold)
     if start_date:
         start_datetime = dt.datetime.combine(start_date, dt.time.min)
-        query = query.filter(Reservation.created_at >= start_datetime)
+        query = query.where(Reservation.created_at >= start_datetime)
     if end_date:
         end_datetime = dt.datetime.combine(end_date, dt.time.max)
-        query = query.filter(Reservation.created_at <= end_datetime)
+        query = query.where(Reservation.created_at <= end_datetime)
+    if table_size or location:
+        query = query.outerjoin(Table, Reservation.table_id == Table.id)
     if table_size:
-        query = query.filter(Table.size == table_size)
+        query = query.where(Table.size == table_size)
     if location:
-        query = query.filter(Table.location == location)
+        query = query.where(Table.location == location)
     if customer_type:
-        # This requires a subquery or a more complex join to count reservations per customer
-        # For now, we'll skip this server-side and it can be handled client-side if needed
-        pass
+        visits = customer_visit_counts()
+        query = query.join(visits, Reservation.customer_id == visits.c.customer_id)
+        kind = customer_type.lower()
+        if kind == "new":
+            query = query.where(visits.c.visit_count == 1)
+        elif kind == "repeat":
+            query = query.where(visits.c.visit_count > 1)
+        elif kind == "vip":
+            query = query.where(visits.c.visit_count >= VIP_MIN_VISITS)
+        else:
+            raise HTTPException(status_code=400, detail="customer_type must be new, repeat or vip")
     if show_no_shows:
-        query = query.filter(Reservation.status.in_(['cancelled', 'no-show']))
-
-    reservations = query.order_by(Reservation.created_at.desc()).all()
+        query = query.where(Reservation.status.in_(['cancelled', 'no-show']))
 
-    result = []
-    for r in reservations:
-        customer_name = r.customer.name if r.customer else None
-        phone_number = r.customer.phone_number if r.customer else None
-        result.append(ReservationOut(
-            id=r.id,
-            customer_name=customer_name,
-            phone_number=phone_number,
-            adults=r.adults,
-            children=r.children,
-            child_seat_required=r.child_seat_required,
-            status=r.status,
-            queue_number=r.queue_number,
-            created_at=r.created_at,
-            notes=r.notes,
-            table_id=r.table_id,
-            reservation_type=r.reservation_type
+    if cursor:
+        after_created_at, after_id = decode_cursor(cursor)
+        page = query.where(or_(
+            Reservation.created_at < after_created_at,
+            and_(Reservation.created_at == after_created_at, Reservation.id < after_id)
         ))
-    db.close()
-    return result
+    else:
+        page = query
+    async with async_session() as db:
+        if include_total:
+            total = (await db.execute(select(func.count()).select_from(query.subquery()))).scalar()
+            response.headers["X-Total-Count"] = str(total)
+        rows = (await db.execute(
+            page.order_by(Reservation.created_at.desc(), Reservation.id.desc()).limit(limit + 1)
+        )).all()
+
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-Cursor"] = encode_cursor(rows[-1].created_at, rows[-1].id)
+    return [reservation_out_from_row(row) for row in rows]
 
 class ReservationStatusUpdate(BaseModel):
     status: str = None
@@ -923,7 +2941,7 @@ class ReservationStatusUpdate(BaseModel):
     notes: str = None
 
 @app.put("/admin/reservations/{reservation_id}")
-def admin_update_reservation(reservation_id: int, update: ReservationStatusUpdate, dep=Depends(verify_admin_api_key)):
+def admin_update_reservation(reservation_id: int, update: ReservationStatusUpdate, dep=Depends(require_permission("reservations"))):
     db = SessionLocal()
     reservation = db.query(Reservation).filter(Reservation.id == reservation_id).first()
     if not reservation:
@@ -931,6 +2949,8 @@ def admin_update_reservation(reservation_id: int, update: ReservationStatusUpdat
         raise HTTPException(status_code=404, detail="Reservation not found")
     if update.status:
         reservation.status = update.status
+        if update.status == "Seated" and not reservation.seated_at:
+            reservation.seated_at = dt.datetime.now()
     if update.queue_number is not None:
         reservation.queue_number = update.queue_number
     if update.notes is not None:
@@ -941,35 +2961,18 @@ def admin_update_reservation(reservation_id: int, update: ReservationStatusUpdat
     return {"message": "Reservation updated"}
 
 @app.get("/admin/queue", response_model=List[ReservationOut])
-def admin_list_queue(dep=Depends(verify_admin_api_key)):
-    db = SessionLocal()
-    queue = db.query(Reservation).filter(Reservation.status == "Queued").order_by(Reservation.queue_number).all()
-    result = []
-    for r in queue:
-        customer_name = r.customer.name if r.customer else None
-        phone_number = r.customer.phone_number if r.customer else None
-        result.append(ReservationOut(
-            id=r.id,
-            customer_name=customer_name,
-            phone_number=phone_number,
-            adults=r.adults,
-            children=r.children,
-            child_seat_required=r.child_seat_required,
-            status=r.status,
-            queue_number=r.queue_number,
-            created_at=r.created_at,
-            notes=r.notes,
-            table_id=r.table_id,
-            reservation_type=r.reservation_type
-        ))
-    db.close()
-    return result
+async def admin_list_queue(dep=Depends(require_permission("reservations"))):
+    async with async_session() as db:
+        rows = (await db.execute(
+            reservation_out_select().where(Reservation.status == "Queued").order_by(Reservation.queue_number)
+        )).all()
+    return [reservation_out_from_row(row) for row in rows]
 
 class TableStatusUpdate(BaseModel):
     is_occupied: bool
 
 @app.put("/admin/tables/{table_id}/status")
-def admin_update_table_status(table_id: int, update: TableStatusUpdate, dep=Depends(verify_admin_api_key)):
+def admin_update_table_status(table_id: int, update: TableStatusUpdate, dep=Depends(require_permission("tables"))):
     db = SessionLocal()
     table = db.query(Table).filter(Table.id == table_id).first()
     if not table:
@@ -992,7 +2995,7 @@ class TableUpdate(BaseModel):
     size: int = None
 
 @app.post("/admin/tables")
-def admin_create_table(table: TableCreate, dep=Depends(verify_admin_api_key)):
+def admin_create_table(table: TableCreate, dep=Depends(require_permission("tables"))):
     db = SessionLocal()
     new_table = Table(
         table_number=table.table_number,
@@ -1007,7 +3010,7 @@ def admin_create_table(table: TableCreate, dep=Depends(verify_admin_api_key)):
     return {"message": "Table created", "table_id": new_table.id}
 
 @app.get("/admin/tables")
-def admin_list_tables(dep=Depends(verify_admin_api_key)):
+def admin_list_tables(dep=Depends(require_permission("tables"))):
     db = SessionLocal()
     tables = db.query(Table).all()
     result = []
@@ -1023,7 +3026,7 @@ def admin_list_tables(dep=Depends(verify_admin_api_key)):
     return result
 
 @app.put("/admin/tables/{table_id}")
-def admin_update_table(table_id: int, update: TableUpdate, dep=Depends(verify_admin_api_key)):
+def admin_update_table(table_id: int, update: TableUpdate, dep=Depends(require_permission("tables"))):
     db = SessionLocal()
     table = db.query(Table).filter(Table.id == table_id).first()
     if not table:
@@ -1041,7 +3044,7 @@ def admin_update_table(table_id: int, update: TableUpdate, dep=Depends(verify_ad
     return {"message": "Table updated"}
 
 @app.delete("/admin/tables/{table_id}")
-def admin_delete_table(table_id: int, dep=Depends(verify_admin_api_key)):
+def admin_delete_table(table_id: int, dep=Depends(require_permission("tables"))):
     db = SessionLocal()
     table = db.query(Table).filter(Table.id == table_id).first()
     if not table:
@@ -1053,58 +3056,625 @@ def admin_delete_table(table_id: int, dep=Depends(verify_admin_api_key)):
     return {"message": "Table deleted"}
 
 @app.get("/admin/reports/daily")
-def admin_daily_report(dep=Depends(verify_admin_api_key)):
+def admin_daily_report(dep=Depends(require_permission("reports"))):
     db = SessionLocal()
-    results = db.query(
-        func.date(Reservation.created_at).label("date"),
-        func.count(Reservation.id).label("reservation_count")
-    ).group_by(func.date(Reservation.created_at)).order_by(func.date(Reservation.created_at)).all()
+    results = daily_reservation_counts(db)
     db.close()
-    return [{"date": str(row.date), "reservation_count": row.reservation_count} for row in results]
+    return [{"date": str(day), "reservation_count": count} for day, count in results]
 
 @app.get("/admin/reports/monthly")
-def admin_monthly_report(dep=Depends(verify_admin_api_key)):
+def admin_monthly_report(dep=Depends(require_permission("reports"))):
     db = SessionLocal()
-    results = db.query(
-        func.strftime('%Y-%m', Reservation.created_at).label("month"),
-        func.count(Reservation.id).label("reservation_count")
-    ).group_by(func.strftime('%Y-%m', Reservation.created_at)).order_by(func.strftime('%Y-%m', Reservation.created_at)).all()
+    results = monthly_reservation_counts(db)
     db.close()
-    return [{"month": row.month, "reservation_count": row.reservation_count} for row in results]
+    return [{"month": month, "reservation_count": count} for month, count in results]
 
-@app.get("/admin/reports/daily/csv")
-def admin_daily_report_csv(dep=Depends(verify_admin_api_key)):
+@app.get("/admin/reports/{report_type}/summaries")
+def admin_report_summaries(
+    report_type: str,
+    start_date: Optional[date] = Query(None),
+    end_date: Optional[date] = Query(None),
+    dep=Depends(require_permission("reports"))
+):
+    """Full per-day ('daily') or per-month ('monthly') summaries, served from the report snapshots"""
+    report_type = report_type.capitalize()
+    if report_type not in REPORT_TYPES:
+        raise HTTPException(status_code=404, detail="Unknown report type. Available: daily, monthly")
     db = SessionLocal()
-    results = db.query(
-        func.date(Reservation.created_at).label("date"),
-        func.count(Reservation.id).label("reservation_count")
-    ).group_by(func.date(Reservation.created_at)).order_by(func.date(Reservation.created_at)).all()
-    db.close()
-    output = StringIO()
-    writer = csv.writer(output)
-    writer.writerow(["date", "reservation_count"])
-    for row in results:
-        writer.writerow([row.date, row.reservation_count])
-    output.seek(0)
-    return StreamingResponse(output, media_type="text/csv", headers={"Content-Disposition": "attachment; filename=daily_report.csv"})
+    try:
+        return [{"date": str(period), **summary} for period, summary in report_summaries(db, report_type, start_date, end_date)]
+    finally:
+        db.close()
 
-@app.get("/admin/reports/monthly/csv")
-def admin_monthly_report_csv(dep=Depends(verify_admin_api_key)):
+def run_report_scheduler_once() -> dict:
     db = SessionLocal()
-    results = db.query(
-        func.strftime('%Y-%m', Reservation.created_at).label("month"),
-        func.count(Reservation.id).label("reservation_count")
-    ).group_by(func.strftime('%Y-%m', Reservation.created_at)).order_by(func.strftime('%Y-%m', Reservation.created_at)).all()
-    db.close()
-    output = StringIO()
-    writer = csv.writer(output)
-    writer.writerow(["month", "reservation_count"])
-    for row in results:
-        writer.writerow([row.month, row.reservation_count])
-    output.seek(0)
-    return StreamingResponse(output, media_type="text/csv", headers={"Content-Disposition": "attachment; filename=monthly_report.csv"})
-
-GMAIL_USER = "singhgarcia5@gmail.com"  # <-- Your Gmail address
+    try:
+        return materialize_reports(db)
+    finally:
+        db.close()
+
+async def run_report_scheduler():
+    while True:
+        try:
+            written = await run_in_threadpool(run_report_scheduler_once)
+            if any(written.values()):
+                print(f"[REPORTS] Materialized {written}")
+        except Exception as e:
+            print(f"[REPORTS] Materialization failed: {e}")
+        await asyncio.sleep(REPORT_SCHEDULER_SECONDS)
+
+@app.on_event("startup")
+async def start_report_scheduler():
+    if REPORT_SCHEDULER_SECONDS > 0:
+        asyncio.get_running_loop().create_task(run_report_scheduler())
+
+@app.post("/admin/reports/materialize")
+def admin_materialize_reports(dep=Depends(require_permission("settings"))):
+    """Write snapshots for closed days and months now instead of waiting for the scheduler"""
+    return run_report_scheduler_once()
+
+# CSV exports
+# Exports are generated while they are sent: rows come off a server-side cursor
+# on a dedicated connection and are written out in chunks, so memory stays flat
+# regardless of how many rows the range covers.
+EXPORT_CHUNK_ROWS = 1000
+
+def stream_csv(header, rows, chunk_rows: int = EXPORT_CHUNK_ROWS):
+    """Yield CSV text in chunks of `chunk_rows` rows"""
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    for i, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if i % chunk_rows == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+    yield buffer.getvalue()
+
+def stream_rows(statement):
+    """Yield result rows from a server-side cursor, holding a connection only while streaming"""
+    with engine.connect() as connection:
+        result = connection.execution_options(stream_results=True, yield_per=EXPORT_CHUNK_ROWS).execute(statement)
+        for row in result:
+            yield row
+
+def _created_between(column, start_date, end_date):
+    conditions = []
+    if start_date:
+        conditions.append(column >= dt.datetime.combine(start_date, dt.time.min))
+    if end_date:
+        conditions.append(column <= dt.datetime.combine(end_date, dt.time.max))
+    return conditions
+
+def reservation_export_rows(start_date: date = None, end_date: date = None):
+    r = Reservation.__table__.c
+    c = Customer.__table__.c
+    columns = [
+        r.id, r.queue_number, r.created_at, r.status, r.reservation_type, r.location,
+        r.adults, r.children, r.child_seat_required, r.table_id, r.seated_at,
+        r.reservation_date, r.reservation_time, r.is_scheduled,
+        r.customer_id, c.name.label("customer_name"), c.phone_number, r.notes
+    ]
+    statement = select(*columns).select_from(Reservation.__table__.outerjoin(Customer.__table__, r.customer_id == c.id))
+    statement = statement.where(*_created_between(r.created_at, start_date, end_date)).order_by(r.created_at, r.id)
+    return [column.name for column in columns], stream_rows(statement)
+
+def waitlist_export_rows(start_date: date = None, end_date: date = None):
+    w = WaitlistEntry.__table__.c
+    c = Customer.__table__.c
+    columns = [
+        w.id, w.created_at, w.status, w.location, w.adults, w.children, w.child_seat_required,
+        w.estimated_wait_time, w.called_at, w.seated_at, w.table_id,
+        w.customer_id, c.name.label("customer_name"), c.phone_number, w.notes
+    ]
+    statement = select(*columns).select_from(WaitlistEntry.__table__.outerjoin(Customer.__table__, w.customer_id == c.id))
+    statement = statement.where(*_created_between(w.created_at, start_date, end_date)).order_by(w.created_at, w.id)
+    return [column.name for column in columns], stream_rows(statement)
+
+def customer_export_rows(start_date: date = None, end_date: date = None):
+    c = Customer.__table__.c
+    columns = [c.id, c.name, c.phone_number, c.email, c.created_at, c.notes]
+    statement = select(*columns).where(*_created_between(c.created_at, start_date, end_date)).order_by(c.id)
+    return [column.name for column in columns], stream_rows(statement)
+
+def daily_export_rows(start_date: date = None, end_date: date = None):
+    db = SessionLocal()
+    try:
+        return ["date", "reservation_count"], daily_reservation_counts(db, start_date, end_date)
+    finally:
+        db.close()
+
+def monthly_export_rows(start_date: date = None, end_date: date = None):
+    db = SessionLocal()
+    try:
+        return ["month", "reservation_count"], monthly_reservation_counts(db, start_date, end_date)
+    finally:
+        db.close()
+
+EXPORTS = {
+    "reservations": reservation_export_rows,
+    "waitlist": waitlist_export_rows,
+    "customers": customer_export_rows,
+    "daily": daily_export_rows,
+    "monthly": monthly_export_rows,
+}
+
+def csv_response(header, rows, filename: str):
+    return StreamingResponse(
+        stream_csv(header, rows),
+        media_type="text/csv",
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
+
+@app.get("/admin/exports/{dataset}")
+def admin_export_csv(
+    dataset: str,
+    start_date: Optional[date] = Query(None),
+    end_date: Optional[date] = Query(None),
+    dep=Depends(require_permission("reports"))
+):
+    """Stream reservations, waitlist, customers, daily or monthly counts as CSV"""
+    if dataset not in EXPORTS:
+        raise HTTPException(status_code=404, detail=f"Unknown export '{dataset}'. Available: {', '.join(EXPORTS)}")
+    header, rows = EXPORTS[dataset](start_date, end_date)
+    period = f"_{start_date or 'start'}_{end_date or 'now'}" if start_date or end_date else ""
+    return csv_response(header, rows, f"{dataset}{period}.csv")
+
+@app.get("/admin/reports/daily/csv")
+def admin_daily_report_csv(dep=Depends(require_permission("reports"))):
+    header, rows = daily_export_rows()
+    return csv_response(header, rows, "daily_report.csv")
+
+@app.get("/admin/reports/monthly/csv")
+def admin_monthly_report_csv(dep=Depends(require_permission("reports"))):
+    header, rows = monthly_export_rows()
+    return csv_response(header, rows, "monthly_report.csv")
+
+# Analytics snapshots
+# Reservations and waitlist entries from closed days are exported into memory-mapped
+# column files (see snapshots.py), so long-range analytics work on arrays instead
+# of scanning the tables. A day is exported once it is SNAPSHOT_LAG_DAYS old; rows
+# after the watermark are read live, so a frame always covers the whole requested
+# range. Writes to rows of a closed day (a late status change, a bulk import)
+# record the day in snapshot_invalidations in the same transaction: frames read
+# from that day on live, and the next refresh rewinds the snapshot to it and
+# re-exports. The files and the invalidations are shared by every worker.
+SNAPSHOTS_ENABLED = os.getenv("ANALYTICS_SNAPSHOTS", "1") != "0"
+SNAPSHOT_LAG_DAYS = int(os.getenv("SNAPSHOT_LAG_DAYS", "2"))
+SNAPSHOT_REFRESH_SECONDS = int(os.getenv("SNAPSHOT_REFRESH_SECONDS", "3600"))
+SNAPSHOT_APPEND_DAYS = 31  # days written per append, bounds memory during the first export
+
+SNAPSHOT_DATASETS = {
+    "reservations": (Reservation, {
+        "id": "int64", "created_at": "datetime", "seated_at": "datetime", "status": "category",
+        "reservation_type": "category", "location": "category", "adults": "int16", "children": "int16",
+        "table_id": "int32", "customer_id": "int32",
+    }),
+    "waitlist": (WaitlistEntry, {
+        "id": "int64", "created_at": "datetime", "called_at": "datetime", "seated_at": "datetime",
+        "status": "category", "location": "category", "adults": "int16", "children": "int16",
+        "table_id": "int32", "customer_id": "int32",
+    }),
+}
+SNAPSHOT_DATASET_NAMES = {model: name for name, (model, schema) in SNAPSHOT_DATASETS.items()}
+snapshot_stores = {name: ColumnStore(name, schema) for name, (model, schema) in SNAPSHOT_DATASETS.items()}
+_snapshot_refresh_lock = threading.Lock()
+
+def invalidate_snapshots(connection, dataset: str, days):
+    """Record that rows of closed `days` changed, so the snapshot re-exports them"""
+    if days:
+        connection.execute(insert(SnapshotInvalidation.__table__), [{"dataset": dataset, "day": day} for day in sorted(days)])
+
+@event.listens_for(SessionLocal, "after_flush")
+def _track_snapshot_changes(session, flush_context):
+    today = dt.date.today()
+    changed = {}
+    dirty = session.dirty
+    for obj in session.new.union(dirty).union(session.deleted):
+        dataset = SNAPSHOT_DATASET_NAMES.get(type(obj))
+        if dataset is None:
+            continue
+        if obj in dirty and not any(attributes.get_history(obj, column).has_changes() for column in SNAPSHOT_DATASETS[dataset][1]):
+            continue
+        for created_at in (obj.created_at, *attributes.get_history(obj, "created_at").deleted):
+            if created_at and created_at.date() < today:
+                changed.setdefault(dataset, set()).add(created_at.date())
+    for dataset, days in changed.items():
+        invalidate_snapshots(session.connection(), dataset, days)
+
+def _snapshot_select(name: str):
+    model, schema = SNAPSHOT_DATASETS[name]
+    table = model.__table__
+    return select(*[table.c[column] for column in schema]).order_by(table.c.created_at, table.c.id), table.c.created_at
+
+def refresh_snapshot(name: str, rebuild: bool = False) -> dict:
+    """Re-export the days changed since they were exported, append the closed days after the
+    watermark (all of them with rebuild=True) and return the store status"""
+    store = snapshot_stores[name]
+    statement, created_at = _snapshot_select(name)
+    invalidations = SnapshotInvalidation.__table__
+    with _snapshot_refresh_lock:
+        with engine.connect() as connection:
+            changed = connection.execute(
+                select(invalidations.c.id, invalidations.c.day).where(invalidations.c.dataset == name)
+            ).all()
+        if rebuild:
+            store.reset()
+        elif changed:
+            store.rewind(min(day for _, day in changed))
+        cutoff = dt.date.today() - timedelta(days=SNAPSHOT_LAG_DAYS)
+        previous = day = store.watermark
+        if day is None:
+            with engine.connect() as connection:
+                first = connection.execute(select(func.min(created_at))).scalar()
+            day = first.date() if first is not None else cutoff
+        while day < cutoff:
+            until = min(day + timedelta(days=SNAPSHOT_APPEND_DAYS), cutoff)
+            rows = list(stream_rows(statement.where(
+                created_at >= dt.datetime.combine(day, dt.time.min),
+                created_at < dt.datetime.combine(until, dt.time.min)
+            )))
+            if not store.append(rows, until, previous):
+                break  # Another worker is exporting
+            previous = day = until
+        # Only the invalidations read above: rows changed since then are re-exported next time
+        ids = [invalidation_id for invalidation_id, _ in changed]
+        for i in range(0, len(ids), 500):
+            with engine.begin() as connection:
+                connection.execute(delete(invalidations).where(invalidations.c.id.in_(ids[i:i + 500])))
+        return store.status()
+
+def refresh_snapshots(rebuild: bool = False) -> dict:
+    return {name: refresh_snapshot(name, rebuild) for name in SNAPSHOT_DATASETS}
+
+def snapshot_frame(name: str, start_date: dt.datetime = None, end_date: dt.datetime = None):
+    """({column: array}, {column: dictionary}) for rows created within [start, end]: a slice
+    of the memory-mapped snapshot plus the rows after its watermark (or after the first
+    invalidated day) read from the database; category columns are codes into the dictionaries"""
+    import numpy as np
+
+    store = snapshot_stores[name]
+    statement, created_at = _snapshot_select(name)
+    invalidations = SnapshotInvalidation.__table__
+    parts = []
+    live_from = start_date
+    if SNAPSHOTS_ENABLED:
+        watermark, columns, dictionaries = store.view()
+    else:
+        watermark, columns = None, None
+        dictionaries = {column: [None] for column, kind in store.schema.items() if kind == "category"}
+    with engine.connect() as connection:
+        if watermark:
+            changed = connection.execute(
+                select(func.min(invalidations.c.day)).where(invalidations.c.dataset == name)
+            ).scalar()
+            boundary = dt.datetime.combine(min(watermark, changed) if changed else watermark, dt.time.min)
+            # Rows are appended in created_at order, so the range is a contiguous slice
+            stamps = columns["created_at"]
+            hi = stamps.searchsorted(np.datetime64(boundary, "s"), "left")
+            if end_date:
+                hi = min(hi, stamps.searchsorted(np.datetime64(end_date, "s"), "right"))
+            lo = min(hi, stamps.searchsorted(np.datetime64(start_date, "s"), "left")) if start_date else 0
+            parts.append({column: values[lo:hi] for column, values in columns.items()})
+            live_from = max(start_date, boundary) if start_date else boundary
+        if not (live_from and end_date and live_from > end_date):
+            conditions = []
+            if live_from:
+                conditions.append(created_at >= live_from)
+            if end_date:
+                conditions.append(created_at <= end_date)
+            rows = connection.execute(statement.where(*conditions)).all()
+            parts.append(store.encode(rows, dictionaries))
+    if len(parts) == 1:
+        return parts[0], dictionaries
+    return {column: np.concatenate([part[column] for part in parts]) for column in store.schema}, dictionaries
+
+async def run_snapshot_refresh_loop():
+    while True:
+        try:
+            await run_in_threadpool(refresh_snapshots)
+        except Exception as e:
+            print(f"[SNAPSHOT] Refresh failed: {e}")
+        await asyncio.sleep(SNAPSHOT_REFRESH_SECONDS)
+
+@app.on_event("startup")
+async def start_snapshot_refresh():
+    if SNAPSHOTS_ENABLED and SNAPSHOT_REFRESH_SECONDS > 0:
+        asyncio.get_running_loop().create_task(run_snapshot_refresh_loop())
+
+@app.get("/admin/snapshots")
+def admin_snapshot_status(dep=Depends(require_permission("reports"))):
+    """Rows, watermark and size of each analytics snapshot"""
+    return {
+        "enabled": SNAPSHOTS_ENABLED,
+        "lag_days": SNAPSHOT_LAG_DAYS,
+        "datasets": {name: store.status() for name, store in snapshot_stores.items()}
+    }
+
+@app.post("/admin/snapshots/refresh")
+def admin_refresh_snapshots(rebuild: bool = Query(False), dep=Depends(require_permission("settings"))):
+    """Export closed days now; rebuild=true re-exports everything (after correcting old rows)"""
+    return refresh_snapshots(rebuild)
+
+# Bulk import
+# Customers, reservations and waitlist entries from another system are loaded
+# from CSV or NDJSON in chunks of IMPORT_CHUNK_ROWS, one transaction per chunk:
+# customers are upserted by phone number and rows inserted with executemany,
+# bypassing the ORM (and so the per-write notifications). Rollups and report
+# snapshots are maintained per chunk; the in-memory caches are reset at the end.
+# Rows that fail validation or the database are reported and skipped.
+IMPORT_CHUNK_ROWS = int(os.getenv("IMPORT_CHUNK_ROWS", "500"))
+IMPORT_MAX_ERRORS = 1000  # errors listed in the summary; all are counted
+
+class ImportRow(BaseModel):
+    class Config:
+        coerce_numbers_to_str = True  # phone and table numbers arrive as numbers in NDJSON
+
+class CustomerImport(ImportRow):
+    phone_number: str
+    name: Optional[str] = None
+    email: Optional[str] = None
+    notes: Optional[str] = None
+    created_at: Optional[dt.datetime] = None
+
+class ReservationImport(ImportRow):
+    phone_number: str
+    name: Optional[str] = None
+    email: Optional[str] = None
+    adults: int
+    children: int = 0
+    child_seat_required: bool = False
+    status: str = "Queued"
+    reservation_type: str = "phone"
+    location: Optional[str] = None
+    table_number: Optional[str] = None
+    queue_number: Optional[int] = None
+    created_at: Optional[dt.datetime] = None
+    seated_at: Optional[dt.datetime] = None
+    reservation_date: Optional[date] = None
+    reservation_time: Optional[str] = None
+    is_scheduled: bool = False
+    notes: Optional[str] = None
+
+class WaitlistImport(ImportRow):
+    phone_number: str
+    name: Optional[str] = None
+    email: Optional[str] = None
+    adults: int
+    children: int = 0
+    child_seat_required: bool = False
+    location: str
+    status: str = "Waiting"
+    table_number: Optional[str] = None
+    estimated_wait_time: Optional[int] = None
+    created_at: Optional[dt.datetime] = None
+    called_at: Optional[dt.datetime] = None
+    seated_at: Optional[dt.datetime] = None
+    notes: Optional[str] = None
+
+IMPORT_DATASETS = {
+    "customers": (CustomerImport, None),
+    "reservations": (ReservationImport, Reservation),
+    "waitlist": (WaitlistImport, WaitlistEntry),
+}
+IMPORT_FORMATS = {".csv": "csv", ".ndjson": "ndjson", ".jsonl": "ndjson", ".json": "ndjson"}
+
+def import_format(filename: str = None, format: str = None) -> str:
+    """'csv' or 'ndjson' from an explicit format or the file extension; raises ValueError"""
+    if format:
+        if format not in ("csv", "ndjson"):
+            raise ValueError("format must be 'csv' or 'ndjson'")
+        return format
+    extension = os.path.splitext(filename or "")[1].lower()
+    if extension not in IMPORT_FORMATS:
+        raise ValueError("Cannot tell the format from the file name; pass format=csv or format=ndjson")
+    return IMPORT_FORMATS[extension]
+
+def read_import_records(stream, format: str):
+    """Yield (record, error) for each row of a binary CSV or NDJSON stream"""
+    text = TextIOWrapper(stream, encoding="utf-8-sig", newline="" if format == "csv" else None)
+    if format == "csv":
+        for record in csv.DictReader(text):
+            yield record, None
+        return
+    for line in text:
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as exc:
+            yield None, f"Invalid JSON: {exc}"
+            continue
+        if isinstance(record, dict):
+            yield record, None
+        else:
+            yield None, "Each line must be a JSON object"
+
+class BulkImporter:
+    """Loads one dataset from (record, error) pairs and returns a summary"""
+
+    def __init__(self, dataset: str):
+        self.dataset = dataset
+        self.schema, self.model = IMPORT_DATASETS[dataset]
+        self.tables = None
+        self.days = set()
+        self.scheduled_days = set()
+        self.summary = {
+            "dataset": dataset, "processed": 0, "inserted": 0,
+            "customers_created": 0, "customers_updated": 0, "failed": 0, "errors": []
+        }
+
+    def run(self, records) -> dict:
+        chunk = []
+        for number, (record, error) in enumerate(records, 1):
+            self.summary["processed"] += 1
+            row = None
+            if error is None:
+                try:
+                    row = self.schema(**{k: v for k, v in record.items() if k is not None and v not in ("", None)})
+                except ValidationError as exc:
+                    error = "; ".join(f"{'.'.join(map(str, e['loc']))}: {e['msg']}" for e in exc.errors())
+            if error:
+                self._fail(number, error)
+                continue
+            chunk.append((number, row))
+            if len(chunk) >= IMPORT_CHUNK_ROWS:
+                self._load(chunk)
+                chunk = []
+        if chunk:
+            self._load(chunk)
+        self._finish()
+        return self.summary
+
+    def _fail(self, number: int, error: str):
+        self.summary["failed"] += 1
+        if len(self.summary["errors"]) < IMPORT_MAX_ERRORS:
+            self.summary["errors"].append({"row": number, "error": error})
+
+    def _load(self, chunk):
+        try:
+            with engine.begin() as connection:
+                counts, errors, days, scheduled_days = self._write(connection, chunk)
+        except SQLAlchemyError as exc:
+            if len(chunk) == 1:
+                self._fail(chunk[0][0], str(getattr(exc, "orig", None) or exc))
+                return
+            # Find the offending rows; the rest of the chunk still loads
+            for item in chunk:
+                self._load([item])
+            return
+        for name, count in counts.items():
+            self.summary[name] += count
+        for number, error in errors:
+            self._fail(number, error)
+        self.days.update(days)
+        self.scheduled_days.update(scheduled_days)
+
+    def _upsert_customers(self, connection, chunk):
+        """Insert missing customers (and update existing ones for the customers dataset);
+        returns ({phone: id}, accepted rows, errors, counts)"""
+        c = Customer.__table__.c
+        phones = {row.phone_number for _, row in chunk}
+        ids = dict(connection.execute(select(c.phone_number, c.id).where(c.phone_number.in_(phones))).all())
+        created, updated, accepted, errors = {}, {}, [], []
+        for number, row in chunk:
+            if row.phone_number in ids:
+                if self.dataset == "customers":
+                    updated[row.phone_number] = {
+                        "b_phone": row.phone_number, "b_name": row.name, "b_email": row.email, "b_notes": row.notes
+                    }
+            elif row.phone_number in created:
+                if self.dataset == "customers":
+                    # Later rows for the same phone win, as they would against an existing customer
+                    created[row.phone_number].update(
+                        (name, value) for name, value in (("name", row.name), ("email", row.email), ("notes", row.notes))
+                        if value is not None
+                    )
+            else:
+                if not row.name:
+                    errors.append((number, "name is required for a new customer"))
+                    continue
+                created[row.phone_number] = {
+                    "name": row.name, "phone_number": row.phone_number, "email": row.email,
+                    "notes": row.notes if self.dataset == "customers" else None,
+                    "created_at": getattr(row, "created_at", None) or dt.datetime.now()
+                }
+            accepted.append((number, row))
+        if created:
+            connection.execute(insert(Customer.__table__), list(created.values()))
+            ids.update(connection.execute(select(c.phone_number, c.id).where(c.phone_number.in_(created))).all())
+        if updated:
+            connection.execute(
+                update(Customer.__table__).where(c.phone_number == bindparam("b_phone")).values(
+                    name=func.coalesce(bindparam("b_name"), c.name),
+                    email=func.coalesce(bindparam("b_email"), c.email),
+                    notes=func.coalesce(bindparam("b_notes"), c.notes)
+                ),
+                list(updated.values())
+            )
+        return ids, accepted, errors, {"customers_created": len(created), "customers_updated": len(updated)}
+
+    def _table_ids(self, connection) -> dict:
+        if self.tables is None:
+            t = Table.__table__.c
+            self.tables = {
+                number: (table_id, location)
+                for number, table_id, location in connection.execute(select(t.table_number, t.id, t.location))
+            }
+        return self.tables
+
+    def _write(self, connection, chunk):
+        ids, accepted, errors, counts = self._upsert_customers(connection, chunk)
+        counts["inserted"] = counts["customers_created"] if self.model is None else 0
+        if self.model is None:
+            return counts, errors, set(), set()
+        tables = self._table_ids(connection)
+        now = dt.datetime.now()
+        values, facts = [], {}
+        for number, row in accepted:
+            table_id, table_location = None, None
+            if row.table_number is not None:
+                if row.table_number not in tables:
+                    errors.append((number, f"Unknown table_number '{row.table_number}'"))
+                    continue
+                table_id, table_location = tables[row.table_number]
+            item = row.model_dump(exclude={"phone_number", "name", "email", "table_number"})
+            item.update(customer_id=ids[row.phone_number], table_id=table_id, created_at=row.created_at or now)
+            if self.model is Reservation:
+                item["location"] = row.location or table_location
+            values.append(item)
+            fact = _rollup_fact(
+                self.model is WaitlistEntry, item["created_at"], item["location"], item["status"],
+                item.get("reservation_type"), item["adults"], item["children"], item["seated_at"]
+            )
+            bucket = facts.setdefault(fact[0], dict.fromkeys(ROLLUP_MEASURES, 0))
+            for name in ROLLUP_MEASURES:
+                bucket[name] += fact[1][name]
+        if values:
+            connection.execute(insert(self.model.__table__), values)
+        for key, measures in facts.items():
+            _bump_rollup(connection, key, measures, 1)
+        days = {key[0] for key in facts}
+        closed_days = {day for day in days if day < dt.date.today()}
+        if closed_days:
+            invalidate_reports(connection, closed_days)
+            invalidate_snapshots(connection, self.dataset, closed_days)
+        counts["inserted"] = len(values)
+        scheduled_days = {item["reservation_date"] for item in values if item.get("reservation_date")}
+        return counts, errors, days, scheduled_days
+
+    def _finish(self):
+        if not self.summary["inserted"] and not self.summary["customers_updated"]:
+            return
+        response_cache.invalidate()
+        for day in self.scheduled_days | self.days:
+            slot_book.invalidate(day)
+        table_allocator.invalidate()
+        floor_status.resync()
+
+def import_records(dataset: str, stream, format: str) -> dict:
+    return BulkImporter(dataset).run(read_import_records(stream, format))
+
+@app.post("/admin/import/{dataset}")
+async def admin_bulk_import(
+    dataset: str,
+    file: UploadFile = File(...),
+    format: Optional[str] = Query(None),
+    dep=Depends(require_permission("settings"))
+):
+    """Load customers, reservations or waitlist entries from a CSV or NDJSON upload.
+    Customers are matched by phone_number; invalid rows are listed in the result."""
+    if dataset not in IMPORT_DATASETS:
+        raise HTTPException(status_code=404, detail=f"Unknown dataset '{dataset}'. Available: {', '.join(IMPORT_DATASETS)}")
+    try:
+        file_format = import_format(file.filename, format)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    # The upload is spooled to disk past 1 MB and read row by row
+    return await run_in_threadpool(import_records, dataset, file.file, file_format)
+
+GMAIL_USER = "singhgarcia5@gmail.com"  # <-- Your Gmail address
 GMAIL_APP_PASSWORD = "www.&.com"  # <-- Your Gmail app password
 ADMIN_EMAIL = "ikram.rana1507@gmail.com"
 
@@ -1120,29 +3690,235 @@ def send_email_with_attachment(subject, body, to_email, attachment_content, atta
         smtp.send_message(msg)
 
 @app.post("/admin/reports/send-email")
-def send_daily_report_email(dep=Depends(verify_admin_api_key)):
+def send_daily_report_email(dep=Depends(require_permission("reports"))):
+    yesterday = dt.date.today() - timedelta(days=1)
     db = SessionLocal()
-    results = db.query(
-        func.date(Reservation.created_at).label("date"),
-        func.count(Reservation.id).label("reservation_count")
-    ).group_by(func.date(Reservation.created_at)).order_by(func.date(Reservation.created_at)).all()
-    db.close()
+    try:
+        results = report_summaries(db, "Daily", end_date=yesterday)
+    finally:
+        db.close()
+    fields = list(results[0][1]) if results else ["reservation_count"]
     output = StringIO()
     writer = csv.writer(output)
-    writer.writerow(["date", "reservation_count"])
-    for row in results:
-        writer.writerow([row.date, row.reservation_count])
+    writer.writerow(["date"] + fields)
+    for day, summary in results:
+        writer.writerow([day] + [summary[field] for field in fields])
     output.seek(0)
     csv_content = output.read().encode()
+    body = "Please find attached the daily reservation report."
+    if results and results[-1][0] == yesterday:
+        summary = results[-1][1]
+        body += (
+            f"\n\n{yesterday}: {summary['reservation_count']} reservations, {summary['guests']} guests, "
+            f"{summary['no_shows']} no-shows, average wait {summary['avg_wait']} min."
+        )
     send_email_with_attachment(
         subject="Daily Reservation Report",
-        body="Please find attached the daily reservation report.",
+        body=body,
         to_email=ADMIN_EMAIL,
         attachment_content=csv_content,
         attachment_filename="daily_report.csv"
     )
     return {"message": f"Daily report sent to {ADMIN_EMAIL}"}
 
+# Customer visit aggregates
+# Per-customer visit counts are computed with a single GROUP BY over
+# reservations instead of one COUNT(*) per customer.
+VIP_MIN_VISITS = 5
+
+def customer_visit_counts(start_date=None, end_date=None):
+    """Subquery of (customer_id, visit_count, last_visit), optionally limited to a date range"""
+    query = select(
+        Reservation.customer_id.label("customer_id"),
+        func.count(Reservation.id).label("visit_count"),
+        func.max(Reservation.created_at).label("last_visit")
+    )
+    if start_date:
+        query = query.where(Reservation.created_at >= start_date)
+    if end_date:
+        query = query.where(Reservation.created_at <= end_date)
+    return query.group_by(Reservation.customer_id).subquery()
+
+def customer_frequency_buckets(start_date=None, end_date=None) -> dict:
+    """Count new (1 visit), repeat (2+) and VIP (VIP_MIN_VISITS+) customers from the reservations snapshot"""
+    import numpy as np
+
+    frame, _ = snapshot_frame("reservations", start_date, end_date)
+    customer_ids = frame["customer_id"]
+    visits = np.bincount(customer_ids[customer_ids >= 0])
+    visits = visits[visits > 0]
+    return {
+        "active": int(visits.size),
+        "new": int((visits == 1).sum()),
+        "repeat": int((visits > 1).sum()),
+        "vip": int((visits >= VIP_MIN_VISITS).sum()),
+        "last_visit": frame["created_at"].max().astype(dt.datetime) if frame["created_at"].size else None
+    }
+
+# Customer search
+# Host type-ahead and the search filter of the reservation list match customers
+# in the database, so every worker sees every committed write (ORM, bulk import
+# or another process) at once. Each word of the query must occur somewhere in the
+# customer's name or email, and a number anywhere in the phone digits. On SQLite
+# the customer_search FTS5 trigram table (kept in step by triggers, migration 8)
+# answers words of CUSTOMER_SEARCH_MIN_TRIGRAM characters or more without a
+# scan; on PostgreSQL pg_trgm indexes serve the same LIKE '%...%' expressions.
+# Matches are ranked in the same statement, before the limit: whole words first,
+# then word and phone prefixes (or phone endings), then other substrings; on
+# PostgreSQL pg_trgm similarity to the whole query breaks ties.
+CUSTOMER_SEARCH_LIMIT = 10
+CUSTOMER_SEARCH_MAX_LIMIT = 100
+CUSTOMER_SEARCH_MIN_TRIGRAM = 3  # Shorter words are checked row by row
+PHONE_PUNCTUATION = re.compile(r"[\s()+.-]")
+SEARCH_WORD_PUNCTUATION = ".,-'"  # Word boundaries besides spaces when ranking names and emails
+
+customer_search_table = table_clause(
+    "customer_search", column_clause("rowid"), column_clause("name"), column_clause("email"), column_clause("phone")
+)
+
+def _customer_search_backend(bind) -> str:
+    with bind.connect() as connection:
+        if connection.dialect.name == "sqlite":
+            found = connection.exec_driver_sql("SELECT 1 FROM sqlite_master WHERE name = 'customer_search'").first()
+            return "fts5" if found else "like"
+        if connection.dialect.name == "postgresql":
+            found = connection.exec_driver_sql("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'").first()
+            return "pg_trgm" if found else "like"
+    return "like"
+
+CUSTOMER_SEARCH_BACKEND = _customer_search_backend(engine)
+
+def _search_words(text: Optional[str]) -> list:
+    return re.findall(r"\w+", (text or "").lower())
+
+def customer_search_tokens(query: str) -> list:
+    """[(kind, text)]: one phone token when the query is a number, otherwise emails and words"""
+    digits = PHONE_PUNCTUATION.sub("", query)
+    if digits.isdigit():
+        return [("phone", digits)]
+    tokens = []
+    for part in query.lower().split():
+        if "@" in part:
+            tokens.append(("email", part))
+        else:
+            tokens.extend(("word", word) for word in _search_words(part))
+    return tokens
+
+def phone_digits(column):
+    """SQL for `column` without PHONE_PUNCTUATION_CHARS, matching the search index expressions"""
+    expression = column
+    for char in PHONE_PUNCTUATION_CHARS:
+        expression = func.replace(expression, literal_column(f"'{char}'"), literal_column("''"))
+    return expression
+
+def _like_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def _token_condition(kind: str, text: str, name, email, phone):
+    pattern = "%" + _like_escape(text) + "%"
+    if kind == "phone":
+        return phone.like(pattern, escape="\\")
+    return or_(name.like(pattern, escape="\\"), email.like(pattern, escape="\\"))
+
+def customer_search_ids(query: str):
+    """SELECT of the ids of customers matching every token of `query`, unranked"""
+    tokens = customer_search_tokens(query)
+    c = Customer.__table__.c
+    if not tokens:
+        return select(c.id).where(false())
+    if CUSTOMER_SEARCH_BACKEND == "fts5":
+        fts = customer_search_table.c
+        ids = select(fts.rowid).select_from(customer_search_table)
+        phrases = []
+        for kind, text in tokens:
+            if len(text) >= CUSTOMER_SEARCH_MIN_TRIGRAM:
+                columns = "phone" if kind == "phone" else "{name email}"
+                phrases.append(f'{columns} : "{text.replace(chr(34), chr(34) * 2)}"')
+            else:
+                ids = ids.where(_token_condition(kind, text, fts.name, fts.email, fts.phone))
+        if phrases:
+            ids = ids.where(literal_column("customer_search").op("MATCH")(" AND ".join(phrases)))
+        return ids
+    name = func.lower(c.name)
+    email = func.lower(func.coalesce(c.email, literal_column("''")))
+    phone = phone_digits(c.phone_number)
+    return select(c.id).where(*(_token_condition(kind, text, name, email, phone) for kind, text in tokens))
+
+def _search_words_text(column):
+    """SQL for ' word word ': lower-cased, SEARCH_WORD_PUNCTUATION as spaces, padded"""
+    expression = func.lower(func.coalesce(column, literal_column("''")))
+    for char in SEARCH_WORD_PUNCTUATION:
+        expression = func.replace(expression, char, " ")
+    return literal(" ").concat(expression).concat(" ")
+
+def _email_local_part(column):
+    if engine.dialect.name == "postgresql":
+        return func.split_part(column, "@", 1)
+    return func.substr(column, 1, func.instr(column.concat("@"), "@") - 1)
+
+def customer_search_score(tokens: list):
+    """SQL rank of a matching customer: per token 2 for a whole word (email, number),
+    1 for a prefix (or a phone ending), 0 for a substring"""
+    c = Customer.__table__.c
+    words = _search_words_text(c.name).concat(_search_words_text(_email_local_part(c.email)))
+    email = func.lower(func.coalesce(c.email, literal_column("''")))
+    phone = phone_digits(c.phone_number)
+    score = literal(0)
+    for kind, text in tokens:
+        escaped = _like_escape(text)
+        if kind == "phone":
+            whole, partial = phone == text, or_(phone.like(text + "%"), phone.like("%" + text))
+        elif kind == "email":
+            whole, partial = email == text, email.like(escaped + "%", escape="\\")
+        else:
+            whole = words.like("% " + escaped + " %", escape="\\")
+            partial = words.like("% " + escaped + "%", escape="\\")
+        score = score + case((whole, 2), (partial, 1), else_=0)
+    return score
+
+def search_customers(query: str, limit: int = CUSTOMER_SEARCH_LIMIT) -> list:
+    """Customers matching every token of `query`, best first"""
+    tokens = customer_search_tokens(query)
+    if not tokens:
+        return []
+    c = Customer.__table__.c
+    score = customer_search_score(tokens).label("score")
+    order = [score.desc()]
+    if CUSTOMER_SEARCH_BACKEND == "pg_trgm":
+        order.append(func.similarity(func.lower(c.name), query.lower()).desc())
+    with engine.connect() as connection:
+        rows = connection.execute(
+            select(c.id, c.name, c.phone_number, c.email, score)
+            .where(c.id.in_(customer_search_ids(query)))
+            .order_by(*order, func.lower(c.name), c.id)
+            .limit(limit)
+        ).all()
+    return [
+        {"id": row.id, "name": row.name, "phone_number": row.phone_number, "email": row.email, "score": row.score}
+        for row in rows
+    ]
+
+class CustomerSearchResult(BaseModel):
+    id: int
+    name: Optional[str] = None
+    phone_number: Optional[str] = None
+    email: Optional[str] = None
+    score: int
+
+@app.get("/admin/customers/search", response_model=List[CustomerSearchResult])
+def admin_search_customers(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(CUSTOMER_SEARCH_LIMIT, ge=1, le=CUSTOMER_SEARCH_MAX_LIMIT),
+    dep=Depends(require_permission("customers"))
+):
+    """Type-ahead: customers whose name or email contains each word of q, or whose phone
+    number contains its digits; whole words rank first, then prefixes"""
+    return search_customers(q, limit)
+
+@app.get("/admin/customers/search/status")
+def admin_customer_search_status(dep=Depends(require_permission("settings"))):
+    return {"backend": CUSTOMER_SEARCH_BACKEND}
+
 class CustomerOut(BaseModel):
     id: int
     name: Optional[str] = None
@@ -1154,7 +3930,7 @@ class CustomerOut(BaseModel):
         from_attributes = True
 
 @app.get("/admin/customers", response_model=List[CustomerOut])
-def admin_list_customers(dep=Depends(verify_admin_api_key)):
+def admin_list_customers(dep=Depends(require_permission("customers"))):
     db = SessionLocal()
     customers = db.query(Customer).order_by(Customer.created_at.desc()).all()
     result = [CustomerOut.from_orm(c) for c in customers]
@@ -1162,48 +3938,29 @@ def admin_list_customers(dep=Depends(verify_admin_api_key)):
     return result
 
 @app.get("/admin/customers/{customer_id}/reservations", response_model=List[ReservationOut])
-def admin_customer_reservations(customer_id: int, dep=Depends(verify_admin_api_key)):
+def admin_customer_reservations(customer_id: int, dep=Depends(require_permission("customers"))):
     db = SessionLocal()
-    reservations = db.query(Reservation).filter(Reservation.customer_id == customer_id).order_by(Reservation.created_at.desc()).all()
-    result = []
-    for r in reservations:
-        customer_name = r.customer.name if r.customer else None
-        phone_number = r.customer.phone_number if r.customer else None
-        result.append(ReservationOut(
-            id=r.id,
-            customer_name=customer_name,
-            phone_number=phone_number,
-            adults=r.adults,
-            children=r.children,
-            child_seat_required=r.child_seat_required,
-            status=r.status,
-            queue_number=r.queue_number,
-            created_at=r.created_at,
-            notes=r.notes,
-            table_id=r.table_id,
-            reservation_type=r.reservation_type
-        ))
-    db.close()
-    return result
+    try:
+        rows = db.execute(reservation_out_select().where(
+            Reservation.customer_id == customer_id
+        ).order_by(Reservation.created_at.desc(), Reservation.id.desc())).all()
+        return [reservation_out_from_row(row) for row in rows]
+    finally:
+        db.close()
 
 class CustomerFilter(BaseModel):
     min_reservations: int = 1
     last_visit_after: Optional[dt.date] = None
 
 @app.post("/admin/customers/filter", response_model=List[CustomerOut])
-def admin_filter_customers(filter: CustomerFilter, dep=Depends(verify_admin_api_key)):
+def admin_filter_customers(filter: CustomerFilter, dep=Depends(require_permission("customers"))):
     db = SessionLocal()
-    query = db.query(Customer)
+    visits = customer_visit_counts()
+    query = db.query(Customer).outerjoin(visits, Customer.id == visits.c.customer_id)
+    query = query.filter(func.coalesce(visits.c.visit_count, 0) >= filter.min_reservations)
     if filter.last_visit_after:
-        subq = db.query(Reservation.customer_id, func.max(Reservation.created_at).label("last_visit")).group_by(Reservation.customer_id).subquery()
-        query = query.join(subq, Customer.id == subq.c.customer_id).filter(subq.c.last_visit >= filter.last_visit_after)
-    customers = query.all()
-    # Filter by min_reservations in Python for flexibility
-    result = []
-    for c in customers:
-        res_count = db.query(Reservation).filter(Reservation.customer_id == c.id).count()
-        if res_count >= filter.min_reservations:
-            result.append(CustomerOut.from_orm(c))
+        query = query.filter(visits.c.last_visit >= filter.last_visit_after)
+    result = [CustomerOut.from_orm(c) for c in query.all()]
     db.close()
     return result
 
@@ -1243,169 +4000,699 @@ class UserOut(BaseModel):
 
 # Moved to earlier in file to fix import order
 
-@app.post("/admin/marketing/send-whatsapp")
-def admin_send_marketing_whatsapp(msg: MarketingMessage, dep=Depends(verify_admin_api_key)):
+# Marketing campaigns
+# A campaign walks the customers table in id order, CAMPAIGN_BATCH_SIZE customers
+# at a time, keeps the ones matching its segment and writes their messages to the
+# notification outbox, where the dispatcher workers deliver them under the
+# per-channel rate limits. Each batch moves the campaign's cursor in the same
+# transaction as its outbox rows, so after a restart the runner carries on from
+# the cursor without sending anyone a message twice. At most
+# CAMPAIGN_MAX_IN_FLIGHT messages per campaign wait in the outbox at a time.
+CAMPAIGN_RUNNER = os.getenv("CAMPAIGN_RUNNER", "1") != "0"
+CAMPAIGN_BATCH_SIZE = int(os.getenv("CAMPAIGN_BATCH_SIZE", "500"))
+CAMPAIGN_MAX_IN_FLIGHT = int(os.getenv("CAMPAIGN_MAX_IN_FLIGHT", "1000"))
+CAMPAIGN_POLL_SECONDS = 1
+CAMPAIGN_CHANNELS = ("whatsapp", "sms", "email")
+CAMPAIGN_VISIT_FILTERS = ("min_visits", "max_visits", "last_visit_after", "last_visit_before", "location")
+
+class CampaignSegment(BaseModel):
+    customer_ids: Optional[List[int]] = None
+    min_visits: Optional[int] = None
+    max_visits: Optional[int] = None
+    last_visit_after: Optional[date] = None   # last visit on or after
+    last_visit_before: Optional[date] = None  # last visit on or before
+    location: Optional[str] = None            # at least half of their visits were there
+
+class CampaignCreate(BaseModel):
+    name: str
+    channel: str = "whatsapp"
+    subject: Optional[str] = None
+    message: str
+    segment: CampaignSegment = CampaignSegment()
+
+def render_campaign_message(body: str, name: Optional[str]) -> str:
+    return body.replace("{name}", name or "")
+
+def segment_matches(segment: dict, stats) -> bool:
+    """Whether a customer's (visit_count, last_visit, visits_at_location) satisfy the segment"""
+    visit_count, last_visit, at_location = stats or (0, None, 0)
+    if segment.get("min_visits") is not None and visit_count < segment["min_visits"]:
+        return False
+    if segment.get("max_visits") is not None and visit_count > segment["max_visits"]:
+        return False
+    if segment.get("last_visit_after") and (not last_visit or last_visit.date() < date.fromisoformat(segment["last_visit_after"])):
+        return False
+    if segment.get("last_visit_before") and (not last_visit or last_visit.date() > date.fromisoformat(segment["last_visit_before"])):
+        return False
+    if segment.get("location") and (not visit_count or (at_location or 0) * 2 < visit_count):
+        return False
+    return True
+
+def enqueue_campaign_batch(campaign_id: int) -> Optional[int]:
+    """Queue messages for the next batch of customers; returns the number of customers
+    examined, 0 once the audience is exhausted, or None if the campaign is not running"""
+    campaigns = Campaign.__table__
+    with engine.begin() as connection:
+        campaign = connection.execute(select(campaigns).where(campaigns.c.id == campaign_id)).one_or_none()
+        if campaign is None or campaign.status != "running":
+            return None
+        segment = json.loads(campaign.segment)
+        c = Customer.__table__.c
+        recipient = c.email if campaign.channel == "email" else c.phone_number
+        query = select(c.id, c.name, recipient.label("recipient")).where(c.id > campaign.cursor)
+        if segment.get("customer_ids") is not None:
+            query = query.where(c.id.in_(segment["customer_ids"]))
+        customers = connection.execute(query.order_by(c.id).limit(CAMPAIGN_BATCH_SIZE)).all()
+        if not customers:
+            return 0
+        audience = customers
+        if any(segment.get(name) is not None for name in CAMPAIGN_VISIT_FILTERS):
+            # Visit statistics for just this id range, one GROUP BY
+            r = Reservation.__table__.c
+            stats = {
+                row[0]: row[1:] for row in connection.execute(select(
+                    r.customer_id,
+                    func.count(r.id),
+                    func.max(r.created_at),
+                    func.sum(case((r.location == segment.get("location"), 1), else_=0))
+                ).where(r.customer_id.between(customers[0].id, customers[-1].id)).group_by(r.customer_id))
+            }
+            audience = [customer for customer in customers if segment_matches(segment, stats.get(customer.id))]
+        audience = [customer for customer in audience if customer.recipient]
+        now = dt.datetime.now()
+        # Move the cursor first: if another instance already took this batch, nothing is queued twice
+        advanced = connection.execute(update(campaigns).where(
+            campaigns.c.id == campaign_id, campaigns.c.cursor == campaign.cursor, campaigns.c.status == "running"
+        ).values(
+            cursor=customers[-1].id,
+            scanned=campaigns.c.scanned + len(customers),
+            enqueued=campaigns.c.enqueued + len(audience),
+            updated_at=now
+        )).rowcount
+        if not advanced:
+            return None
+        if audience:
+            connection.execute(insert(NotificationOutbox.__table__), [
+                {
+                    "channel": campaign.channel, "recipient": customer.recipient, "subject": campaign.subject,
+                    "body": render_campaign_message(campaign.body, customer.name), "campaign_id": campaign_id,
+                    "status": "pending", "attempts": 0, "next_attempt_at": now, "created_at": now
+                }
+                for customer in audience
+            ])
+    if audience:
+        notification_dispatcher.wake()
+    return len(customers)
+
+def campaign_in_flight(connection, campaign_id: int) -> int:
+    outbox = NotificationOutbox.__table__
+    return connection.execute(select(func.count()).select_from(outbox).where(
+        outbox.c.campaign_id == campaign_id, outbox.c.status.in_(["pending", "sending"])
+    )).scalar()
+
+class CampaignRunner:
+    """Background thread feeding running campaigns into the notification outbox"""
+
+    def __init__(self, bind):
+        self.bind = bind
+        self._thread = None
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+
+    def start(self):
+        if self._thread:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="campaign-runner", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5):
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout)
+        self._thread = None
+
+    def wake(self):
+        self._wakeup.set()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                busy = self.run_once()
+            except Exception as e:
+                print(f"[CAMPAIGNS] Runner error: {e}")
+                busy = False
+            if not busy:
+                self._wakeup.wait(CAMPAIGN_POLL_SECONDS)
+                self._wakeup.clear()
+
+    def run_once(self) -> bool:
+        """Advance each running campaign by at most one batch; True if any customers were examined"""
+        campaigns = Campaign.__table__
+        with self.bind.connect() as connection:
+            running = connection.execute(select(campaigns.c.id).where(campaigns.c.status == "running")).scalars().all()
+            in_flight = {campaign_id: campaign_in_flight(connection, campaign_id) for campaign_id in running}
+        busy = False
+        for campaign_id in running:
+            if in_flight[campaign_id] >= CAMPAIGN_MAX_IN_FLIGHT:
+                continue
+            scanned = enqueue_campaign_batch(campaign_id)
+            if scanned:
+                busy = True
+            elif scanned == 0 and in_flight[campaign_id] == 0:
+                with self.bind.begin() as connection:
+                    connection.execute(update(campaigns).where(
+                        campaigns.c.id == campaign_id, campaigns.c.status == "running"
+                    ).values(status="completed", completed_at=dt.datetime.now(), updated_at=dt.datetime.now()))
+        return busy
+
+campaign_runner = CampaignRunner(engine)
+
+@app.on_event("startup")
+def start_campaign_runner():
+    if CAMPAIGN_RUNNER:
+        campaign_runner.start()
+
+@app.on_event("shutdown")
+def stop_campaign_runner():
+    campaign_runner.stop()
+
+def campaign_progress(campaign: Campaign, counts: dict) -> dict:
+    return {
+        "id": campaign.id,
+        "name": campaign.name,
+        "channel": campaign.channel,
+        "status": campaign.status,
+        "segment": json.loads(campaign.segment),
+        "total_customers": campaign.total_customers,
+        "scanned": campaign.scanned,
+        "progress": round(campaign.scanned / campaign.total_customers, 4) if campaign.total_customers else 1.0,
+        "enqueued": campaign.enqueued,
+        "sent": counts.get("sent", 0),
+        "failed": counts.get("failed", 0),
+        "pending": counts.get("pending", 0) + counts.get("sending", 0),
+        "cancelled": counts.get("cancelled", 0),
+        "created_at": campaign.created_at,
+        "updated_at": campaign.updated_at,
+        "completed_at": campaign.completed_at
+    }
+
+def campaign_outbox_counts(db: Session, campaign_ids) -> dict:
+    """{campaign_id: {status: count}} in one GROUP BY"""
+    counts = {}
+    for campaign_id, status, count in db.query(
+        NotificationOutbox.campaign_id, NotificationOutbox.status, func.count(NotificationOutbox.id)
+    ).filter(NotificationOutbox.campaign_id.in_(campaign_ids)).group_by(
+        NotificationOutbox.campaign_id, NotificationOutbox.status
+    ):
+        counts.setdefault(campaign_id, {})[status] = count
+    return counts
+
+def create_campaign(db: Session, data: CampaignCreate) -> Campaign:
+    if data.channel not in CAMPAIGN_CHANNELS:
+        raise HTTPException(status_code=400, detail=f"channel must be one of {', '.join(CAMPAIGN_CHANNELS)}")
+    segment = data.segment.model_dump(mode="json", exclude_none=True)
+    if data.segment.customer_ids is not None:
+        total = len(set(data.segment.customer_ids))
+    else:
+        total = db.query(func.count(Customer.id)).scalar()
+    campaign = Campaign(
+        name=data.name, channel=data.channel, subject=data.subject or data.name, body=data.message,
+        segment=json.dumps(segment), total_customers=total
+    )
+    db.add(campaign)
+    db.commit()
+    db.refresh(campaign)
+    campaign_runner.wake()
+    return campaign
+
+@app.post("/admin/campaigns")
+def admin_create_campaign(data: CampaignCreate, dep=Depends(require_permission("customers"))):
+    """Start a campaign; {name} in the message is replaced with each customer's name"""
     db = SessionLocal()
-    customers = db.query(Customer).filter(Customer.id.in_(msg.customer_ids)).all()
-    for c in customers:
-        # Mocked WhatsApp send
-        print(f"[MOCK MARKETING] WhatsApp to {c.phone_number}: {msg.message}")
-    db.close()
-    return {"message": f"WhatsApp marketing message sent to {len(customers)} customers (mocked)"}
+    try:
+        return campaign_progress(create_campaign(db, data), {})
+    finally:
+        db.close()
 
-@app.get("/admin/analytics/peak-hours")
-def analytics_peak_hours(dep=Depends(verify_admin_api_key)):
+@app.get("/admin/campaigns")
+def admin_list_campaigns(dep=Depends(require_permission("customers"))):
     db = SessionLocal()
-    results = db.query(Reservation).all()
-    arrivals = [[0 for _ in range(24)] for _ in range(7)]  # [day][hour]
-    waits = [[[] for _ in range(24)] for _ in range(7)]
-    for r in results:
-        if r.created_at:
-            dt = r.created_at
-            day = dt.weekday()  # 0=Mon
-            hour = dt.hour
-            arrivals[day][hour] += 1
-            if r.seated_at:
-                wait = (r.seated_at - r.created_at).total_seconds() / 60
-                waits[day][hour].append(wait)
-    avg_waits = [[(sum(waits[d][h])/len(waits[d][h]) if waits[d][h] else 0) for h in range(24)] for d in range(7)]
-    db.close()
-    return {"arrivals": arrivals, "avg_waits": avg_waits}
+    try:
+        campaigns = db.query(Campaign).order_by(Campaign.created_at.desc()).all()
+        counts = campaign_outbox_counts(db, [campaign.id for campaign in campaigns])
+        return [campaign_progress(campaign, counts.get(campaign.id, {})) for campaign in campaigns]
+    finally:
+        db.close()
 
-@app.get("/admin/analytics/table-utilization")
-def analytics_table_utilization(dep=Depends(verify_admin_api_key)):
+@app.get("/admin/campaigns/{campaign_id}")
+def admin_get_campaign(campaign_id: int, dep=Depends(require_permission("customers"))):
+    """Campaign progress: customers examined, messages queued, sent, failed and pending"""
     db = SessionLocal()
-    tables = db.query(Table).all()
-    utilization = []
-    for t in tables:
-        total = db.query(Reservation).filter(Reservation.table_id == t.id).count()
-        occupied = db.query(Reservation).filter(Reservation.table_id == t.id, Reservation.status.in_(["seated", "completed"])).count()
-        utilization.append({"table_number": t.table_number, "total": total, "occupied": occupied})
-    db.close()
-    return utilization
+    try:
+        campaign = db.get(Campaign, campaign_id)
+        if not campaign:
+            raise HTTPException(status_code=404, detail="Campaign not found")
+        return campaign_progress(campaign, campaign_outbox_counts(db, [campaign_id]).get(campaign_id, {}))
+    finally:
+        db.close()
 
-@app.get("/admin/analytics/no-show-rate")
-def analytics_no_show_rate(dep=Depends(verify_admin_api_key)):
+CAMPAIGN_TRANSITIONS = {
+    # action: (allowed from, new status)
+    "pause": (("running",), "paused"),
+    "resume": (("paused",), "running"),
+    "cancel": (("running", "paused"), "cancelled"),
+}
+
+@app.post("/admin/campaigns/{campaign_id}/{action}")
+def admin_update_campaign(campaign_id: int, action: str, dep=Depends(require_permission("customers"))):
+    """pause, resume or cancel a campaign; cancelling also drops its unsent messages"""
+    if action not in CAMPAIGN_TRANSITIONS:
+        raise HTTPException(status_code=404, detail=f"Unknown action '{action}'. Available: {', '.join(CAMPAIGN_TRANSITIONS)}")
+    allowed, status = CAMPAIGN_TRANSITIONS[action]
     db = SessionLocal()
-    total = db.query(Reservation).count()
-    cancelled = db.query(Reservation).filter(Reservation.status == "cancelled").count()
-    db.close()
-    rate = (cancelled / total * 100) if total else 0
-    return {"total": total, "cancelled": cancelled, "rate": rate}
+    try:
+        campaign = db.get(Campaign, campaign_id)
+        if not campaign:
+            raise HTTPException(status_code=404, detail="Campaign not found")
+        if campaign.status not in allowed:
+            raise HTTPException(status_code=409, detail=f"Cannot {action} a {campaign.status} campaign")
+        campaign.status = status
+        campaign.updated_at = dt.datetime.now()
+        if status == "cancelled":
+            db.query(NotificationOutbox).filter(
+                NotificationOutbox.campaign_id == campaign_id, NotificationOutbox.status == "pending"
+            ).update({"status": "cancelled"}, synchronize_session=False)
+        db.commit()
+        campaign_runner.wake()
+        return campaign_progress(campaign, campaign_outbox_counts(db, [campaign_id]).get(campaign_id, {}))
+    finally:
+        db.close()
 
-@app.get("/admin/analytics/customer-frequency")
-def analytics_customer_frequency(dep=Depends(verify_admin_api_key)):
+@app.post("/admin/marketing/send-whatsapp")
+def admin_send_marketing_whatsapp(msg: MarketingMessage, dep=Depends(require_permission("customers"))):
     db = SessionLocal()
-    customers = db.query(Customer).all()
-    new_count = 0
-    repeat_count = 0
-    for c in customers:
-        res_count = db.query(Reservation).filter(Reservation.customer_id == c.id).count()
-        if res_count > 1:
-            repeat_count += 1
-        elif res_count == 1:
-            new_count += 1
-    db.close()
-    return {"new": new_count, "repeat": repeat_count}
+    try:
+        campaign = create_campaign(db, CampaignCreate(
+            name=f"WhatsApp message {dt.datetime.now():%Y-%m-%d %H:%M}",
+            channel="whatsapp",
+            message=msg.message,
+            segment=CampaignSegment(customer_ids=msg.customer_ids)
+        ))
+    finally:
+        db.close()
+    return {
+        "message": f"WhatsApp marketing message queued for {campaign.total_customers} customers",
+        "campaign_id": campaign.id
+    }
 
-@app.get("/admin/analytics/group-size-over-time")
-def analytics_group_size_over_time(dep=Depends(verify_admin_api_key)):
+def table_reservation_counts(tables, occupied_statuses, start_date=None, end_date=None):
+    """Per table id: reservations, and reservations in `occupied_statuses`, created within [start, end]"""
+    import numpy as np
+
+    frame, dictionaries = snapshot_frame("reservations", start_date, end_date)
+    size = max((t.id for t in tables), default=0) + 1
+    table_ids = frame["table_id"]
+    known = (table_ids >= 0) & (table_ids < size)
+    status_codes = [code for code, status in enumerate(dictionaries["status"]) if status in occupied_statuses]
+    occupied = known & np.isin(frame["status"], status_codes)
+    return (
+        np.bincount(table_ids[known], minlength=size),
+        np.bincount(table_ids[occupied], minlength=size)
+    )
+
+@app.get("/admin/analytics/no-show-rate")
+@cached_response
+def analytics_no_show_rate(dep=Depends(require_permission("dashboard"))):
     db = SessionLocal()
-    from datetime import datetime, timedelta
-    today = dt.datetime.now().date()
-    data = []
-    for i in range(30):
-        day = today - timedelta(days=i)
-        res = db.query(Reservation).filter(
-            extract('year', Reservation.created_at) == day.year,
-            extract('month', Reservation.created_at) == day.month,
-            extract('day', Reservation.created_at) == day.day
-        ).all()
-        if res:
-            avg_size = sum(r.adults + (r.children or 0) for r in res) / len(res)
-        else:
-            avg_size = 0
-        data.append({"date": str(day), "avg_group_size": avg_size})
+    total, cancelled = rollup_filter(db.query(
+        func.sum(AnalyticsRollup.reservation_count),
+        func.sum(case((AnalyticsRollup.status == "Cancelled", AnalyticsRollup.reservation_count), else_=0))
+    )).one()
     db.close()
-    return list(reversed(data))
+    total = total or 0
+    cancelled = cancelled or 0
+    rate = (cancelled / total * 100) if total else 0
+    return {"total": total, "cancelled": cancelled, "rate": rate}
 
-@app.get("/admin/status")
-def get_current_status(dep=Depends(verify_admin_api_key)):
-    """Get current operational status for the status header"""
+@app.get("/admin/analytics/group-size-over-time")
+@cached_response
+def analytics_group_size_over_time(dep=Depends(require_permission("dashboard"))):
     db = SessionLocal()
+    now = dt.datetime.now()
+    first_day = dt.datetime.combine(now.date() - timedelta(days=29), dt.time.min)
+    try:
+        result = metric_series(db, ["avg_group_size"], "day", first_day, now)
+    finally:
+        db.close()
+    return [{"date": str(point["start"].date()), "avg_group_size": point["avg_group_size"]} for point in result["series"]]
+
+# Floor status push
+# Host screens subscribe to /ws/floor (or the /admin/floor/stream SSE fallback)
+# instead of polling status, queue and waitlist. Occupancy, queue and waitlist
+# counters live in memory and are adjusted from each flush's attribute history;
+# committed changes are pushed to every subscriber as small JSON events. The
+# database is only read to seed the counters, after bulk updates the history
+# cannot describe (table claims), and every FLOOR_STATUS_RESYNC_SECONDS to pick
+# up writes made by other processes.
+FLOOR_STATUS_RESYNC_SECONDS = float(os.getenv("FLOOR_STATUS_RESYNC_SECONDS", "30"))
+FLOOR_SUBSCRIBER_QUEUE_SIZE = 256
+FLOOR_KEEPALIVE_SECONDS = 15
+WAITLIST_ACTIVE_STATUSES = ("Waiting", "Called")
+
+def _history_values(obj, name):
+    """(old, new) values of an attribute in the current flush"""
+    history = attributes.get_history(obj, name)
+    new = getattr(obj, name)
+    old = history.deleted[0] if history.deleted else (None if history.added else new)
+    return old, new
+
+def _reservation_event(obj, op):
+    return {
+        "type": "queue", "op": op, "id": obj.id, "status": obj.status, "queue_number": obj.queue_number,
+        "customer_id": obj.customer_id, "adults": obj.adults, "children": obj.children,
+        "table_id": obj.table_id, "location": obj.location,
+        "created_at": obj.created_at.isoformat() if obj.created_at else None,
+    }
 
-    # Get occupied tables count
-    occupied_count = db.query(Table).filter(Table.is_occupied == True).count()
+def _waitlist_event(obj, op):
+    return {
+        "type": "waitlist", "op": op, "id": obj.id, "status": obj.status, "customer_id": obj.customer_id,
+        "adults": obj.adults, "children": obj.children, "table_id": obj.table_id, "location": obj.location,
+        "created_at": obj.created_at.isoformat() if obj.created_at else None,
+    }
 
-    # Get waiting customers count (queued reservations)
-    waiting_count = db.query(Reservation).filter(Reservation.status == "Queued").count()
+def _table_event(obj, op):
+    return {"type": "table", "op": op, "id": obj.id, "table_number": obj.table_number,
+            "location": obj.location, "size": obj.size, "is_occupied": bool(obj.is_occupied)}
+
+class FloorStatusHub:
+    """In-memory floor counters plus the set of subscribed push connections"""
+
+    COUNTERS = ("occupied", "total_tables", "waiting", "waitlist")
+
+    def __init__(self):
+        self._counts = None
+        self._synced_at = None
+        self._stale = False
+        self.version = 0
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def _load_counts(self) -> dict:
+        db = SessionLocal()
+        try:
+            row = db.execute(select(
+                select(func.count(Table.id)).scalar_subquery(),
+                select(func.count(Table.id)).where(Table.is_occupied == True).scalar_subquery(),
+                select(func.count(Reservation.id)).where(Reservation.status == "Queued").scalar_subquery(),
+                select(func.count(WaitlistEntry.id)).where(WaitlistEntry.status.in_(WAITLIST_ACTIVE_STATUSES)).scalar_subquery()
+            )).one()
+        finally:
+            db.close()
+        return {"total_tables": row[0], "occupied": row[1], "waiting": row[2], "waitlist": row[3]}
+
+    def resync(self):
+        """Reload the counters from the database and push them if they moved"""
+        counts = self._load_counts()
+        with self._lock:
+            changed = counts != self._counts
+            self._counts = counts
+            self._synced_at = monotonic()
+            self._stale = False
+            if changed:
+                self.version += 1
+                event = self._status_event()
+        if changed:
+            self._broadcast([event])
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            fresh = self._counts is not None and not self._stale and monotonic() - self._synced_at < FLOOR_STATUS_RESYNC_SECONDS
+        if not fresh:
+            self.resync()
+        with self._lock:
+            return self._status_event()
+
+    def _status_event(self) -> dict:
+        return dict(self._counts, type="status", version=self.version, timestamp=dt.datetime.now().isoformat())
+
+    def mark_stale(self):
+        with self._lock:
+            self._stale = True
+
+    def apply(self, deltas: dict, events: list):
+        """Record one committed transaction's counter deltas and push its events"""
+        with self._lock:
+            if self._counts is None:
+                counters_moved = False
+            else:
+                for name, delta in deltas.items():
+                    self._counts[name] += delta
+                counters_moved = any(deltas.values())
+            if counters_moved:
+                self.version += 1
+                events = events + [self._status_event()]
+            stale = self._stale
+        if stale:
+            # The transaction did bulk updates; resync off the committing thread
+            threading.Thread(target=self.resync, daemon=True).start()
+        if events:
+            self._broadcast(events)
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=FLOOR_SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            self._subscribers[queue] = asyncio.get_running_loop()
+        return queue
+
+    def unsubscribe(self, queue):
+        with self._lock:
+            self._subscribers.pop(queue, None)
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return len(self._subscribers)
+
+    def _broadcast(self, events):
+        with self._lock:
+            subscribers = list(self._subscribers.items())
+        for queue, loop in subscribers:
+            try:
+                loop.call_soon_threadsafe(self._offer, queue, events)
+            except RuntimeError:
+                self.unsubscribe(queue)  # Its event loop is gone
+
+    @staticmethod
+    def _offer(queue, events):
+        for event in events:
+            if queue.full():
+                # A slow client: drop its backlog and tell it to refetch
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait({"type": "resync"})
+                return
+            queue.put_nowait(event)
+
+    async def run_resync_loop(self):
+        while True:
+            await asyncio.sleep(FLOOR_STATUS_RESYNC_SECONDS)
+            try:
+                await run_in_threadpool(self.resync)
+            except Exception as e:
+                print(f"[FLOOR] Resync failed: {e}")
+
+floor_status = FloorStatusHub()
+
+@event.listens_for(SessionLocal, "after_flush")
+def _track_floor_changes(session, flush_context):
+    deltas = session.info.setdefault("floor_deltas", dict.fromkeys(FloorStatusHub.COUNTERS, 0))
+    events = session.info.setdefault("floor_events", [])
+    for obj in session.new:
+        if isinstance(obj, Table):
+            deltas["total_tables"] += 1
+            deltas["occupied"] += int(bool(obj.is_occupied))
+            events.append(_table_event(obj, "upsert"))
+        elif isinstance(obj, Reservation):
+            deltas["waiting"] += int(obj.status == "Queued")
+            events.append(_reservation_event(obj, "upsert"))
+        elif isinstance(obj, WaitlistEntry):
+            deltas["waitlist"] += int(obj.status in WAITLIST_ACTIVE_STATUSES)
+            events.append(_waitlist_event(obj, "upsert"))
+    for obj in session.dirty:
+        if isinstance(obj, Table) and session.is_modified(obj):
+            old, new = _history_values(obj, "is_occupied")
+            deltas["occupied"] += int(bool(new)) - int(bool(old))
+            events.append(_table_event(obj, "upsert"))
+        elif isinstance(obj, Reservation) and session.is_modified(obj):
+            old, new = _history_values(obj, "status")
+            deltas["waiting"] += int(new == "Queued") - int(old == "Queued")
+            events.append(_reservation_event(obj, "upsert"))
+        elif isinstance(obj, WaitlistEntry) and session.is_modified(obj):
+            old, new = _history_values(obj, "status")
+            deltas["waitlist"] += int(new in WAITLIST_ACTIVE_STATUSES) - int(old in WAITLIST_ACTIVE_STATUSES)
+            events.append(_waitlist_event(obj, "upsert"))
+    for obj in session.deleted:
+        if isinstance(obj, Table):
+            deltas["total_tables"] -= 1
+            deltas["occupied"] -= int(bool(obj.is_occupied))
+            events.append({"type": "table", "op": "remove", "id": obj.id})
+        elif isinstance(obj, Reservation):
+            deltas["waiting"] -= int(obj.status == "Queued")
+            events.append({"type": "queue", "op": "remove", "id": obj.id})
+        elif isinstance(obj, WaitlistEntry):
+            deltas["waitlist"] -= int(obj.status in WAITLIST_ACTIVE_STATUSES)
+            events.append({"type": "waitlist", "op": "remove", "id": obj.id})
+
+@event.listens_for(SessionLocal, "do_orm_execute")
+def _track_bulk_floor_changes(orm_execute_state):
+    if (orm_execute_state.is_update or orm_execute_state.is_delete) and orm_execute_state.bind_mapper is not None \
+            and issubclass(orm_execute_state.bind_mapper.class_, (Table, Reservation, WaitlistEntry)):
+        orm_execute_state.session.info["floor_bulk_change"] = True
+
+@event.listens_for(SessionLocal, "after_commit")
+def _publish_floor_changes(session):
+    deltas = session.info.pop("floor_deltas", None)
+    events = session.info.pop("floor_events", [])
+    if session.info.pop("floor_bulk_change", None):
+        floor_status.mark_stale()
+    if deltas is not None or events:
+        floor_status.apply(deltas or {}, events)
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _discard_floor_changes(session):
+    for key in ("floor_deltas", "floor_events", "floor_bulk_change"):
+        session.info.pop(key, None)
+
+@app.on_event("startup")
+async def start_floor_status_resync():
+    asyncio.get_running_loop().create_task(floor_status.run_resync_loop())
+
+def authorize_credential(credential: Optional[str], permission: str) -> SessionPrincipal:
+    """Authenticate a token passed outside the headers (WebSocket / EventSource query string)"""
+    principal = authenticate(x_api_key=credential)
+    if not principal.permissions & PERMISSION_BITS[permission]:
+        raise HTTPException(status_code=403, detail=f"Missing permission: {permission}")
+    return principal
+
+@app.websocket("/ws/floor")
+async def floor_status_socket(websocket: WebSocket, token: Optional[str] = Query(None)):
+    """Push floor status: a snapshot on connect, then queue/waitlist/table/status events"""
+    try:
+        await run_in_threadpool(authorize_credential, token, "tables")
+    except HTTPException:
+        await websocket.close(code=4401)
+        return
+    await websocket.accept()
+    queue = floor_status.subscribe()
+    try:
+        snapshot = await run_in_threadpool(floor_status.snapshot)
+        await websocket.send_json(dict(snapshot, type="snapshot"))
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout=FLOOR_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                event = {"type": "ping"}
+            await websocket.send_json(event)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        floor_status.unsubscribe(queue)
 
-    # Get total tables count
-    total_tables = db.query(Table).count()
+@app.get("/admin/floor/stream")
+async def floor_status_stream(
+    request: Request,
+    token: Optional[str] = Query(None),
+    x_api_key: Optional[str] = Header(None)
+):
+    """Server-sent events fallback for /ws/floor (EventSource cannot set headers, so ?token= works too)"""
+    await run_in_threadpool(authorize_credential, token or x_api_key, "tables")
+
+    async def events():
+        queue = floor_status.subscribe()
+        try:
+            snapshot = await run_in_threadpool(floor_status.snapshot)
+            yield f"event: snapshot\ndata: {json.dumps(dict(snapshot, type='snapshot'))}\n\n"
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=FLOOR_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            floor_status.unsubscribe(queue)
 
-    db.close()
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
+@app.get("/admin/status")
+def get_current_status(dep=Depends(require_permission("tables"))):
+    """Get current operational status for the status header"""
+    status = floor_status.snapshot()
     return {
-        "occupied": occupied_count,
-        "waiting": waiting_count,
-        "total_tables": total_tables,
-        "timestamp": dt.datetime.now().isoformat()
+        "occupied": status["occupied"],
+        "waiting": status["waiting"],
+        "total_tables": status["total_tables"],
+        "timestamp": status["timestamp"]
     }
 
-@app.get("/admin/dashboard/analytics")
-def get_dashboard_analytics(dep=Depends(verify_admin_api_key)):
-    """Get comprehensive dashboard analytics"""
-    db = SessionLocal()
-
-    # Calculate average wait time
-    reservations_with_wait = db.query(Reservation).filter(
-        Reservation.status.in_(["Seated", "Completed"]),
-        Reservation.seated_at.isnot(None)
+# Dashboard bundle
+# Everything the dashboard page shows, in one response: one grouped read of the
+# analytics rollups feeds wait, turnover and abandonment, peak_hour_profile()
+# the heatmap;
+# one aggregate over reservations per customer gives new vs repeat; occupancy
+# and next-hour arrivals come from the in-memory floor counters and slot book.
+def dashboard_bundle(db: Session, start_date: dt.datetime = None, end_date: dt.datetime = None) -> dict:
+    now = dt.datetime.now()
+    today = now.date()
+    is_waitlist = (AnalyticsRollup.reservation_type == WAITLIST_ROLLUP_TYPE).label("is_waitlist")
+    rows = rollup_filter(db.query(
+        AnalyticsRollup.day,
+        AnalyticsRollup.status,
+        is_waitlist,
+        func.sum(AnalyticsRollup.reservation_count),
+        func.sum(AnalyticsRollup.seated_wait_sum),
+        func.sum(AnalyticsRollup.seated_wait_count)
+    ), start_date, end_date, waitlist=None).group_by(
+        AnalyticsRollup.day, AnalyticsRollup.status, is_waitlist
     ).all()
 
-    total_wait_time = 0
-    for res in reservations_with_wait:
-        if res.seated_at and res.created_at:
-            wait_time = (res.seated_at - res.created_at).total_seconds() / 60
-            total_wait_time += wait_time
-
-    avg_wait_time = round(total_wait_time / len(reservations_with_wait), 1) if reservations_with_wait else 0
-
-    # Calculate next hour reservations
-    now = dt.datetime.now()
-    next_hour = now + timedelta(hours=1)
-    next_hour_reservations = db.query(Reservation).filter(
-        Reservation.created_at >= now,
-        Reservation.created_at <= next_hour
-    ).count()
-
-    # Calculate turnover pace (simplified)
-    completed_today = db.query(Reservation).filter(
-        Reservation.status == "Completed",
-        Reservation.created_at >= dt.datetime.combine(now.date(), dt.time.min)
-    ).count()
-
-    turnover_pace = round(completed_today / 10, 1) if completed_today > 0 else 0  # Assuming 10 hour day
-
-    # Get abandonment rate
-    total_reservations = db.query(Reservation).count()
-    cancelled_reservations = db.query(Reservation).filter(Reservation.status == "Cancelled").count()
-    abandonment_rate = round((cancelled_reservations / total_reservations * 100), 1) if total_reservations > 0 else 0
-
-    # Get customer frequency
-    total_customers = db.query(Customer).count()
-    repeat_customers = db.query(Customer).join(Reservation).group_by(Customer.id).having(
-        func.count(Reservation.id) > 1
-    ).count()
+    status_counts = {}
+    seated_wait_sum = seated_wait_count = completed_today = 0
+    for day, status, waitlist_row, count, wait_sum, wait_count in rows:
+        if waitlist_row:
+            continue
+        count, wait_sum, wait_count = count or 0, wait_sum or 0, wait_count or 0
+        status_counts[status] = status_counts.get(status, 0) + count
+        if status in ("Seated", "Completed"):
+            seated_wait_sum += wait_sum
+            seated_wait_count += wait_count
+        if status == "Completed" and day == today:
+            completed_today += count
+
+    total_reservations = sum(status_counts.values())
+    cancelled = status_counts.get("Cancelled", 0)
+    abandonment_rate = round((cancelled / total_reservations * 100), 1) if total_reservations > 0 else 0
+
+    visits = customer_visit_counts(start_date, end_date)
+    total_customers, repeat_customers = db.execute(select(
+        select(func.count(Customer.id)).scalar_subquery(),
+        select(func.count()).select_from(visits).where(visits.c.visit_count > 1).scalar_subquery()
+    )).one()
+    repeat_customers = repeat_customers or 0
     new_customers = total_customers - repeat_customers
 
-    db.close()
+    minute = now.hour * 60 + now.minute
+    next_hour_reservations = slot_book.starts_between(db, today, minute, minute + 60)
+    floor = floor_status.snapshot()
+    profile = peak_hour_profile(db, start_date, end_date)
 
     return {
         "kpis": {
-            "avg_wait_time": avg_wait_time,
+            "avg_wait_time": round(seated_wait_sum / seated_wait_count, 1) if seated_wait_count else 0,
             "next_hour_reservations": next_hour_reservations,
-            "turnover_pace": turnover_pace,
+            "turnover_pace": round(completed_today / 10, 1) if completed_today > 0 else 0,  # Assuming 10 hour day
             "abandonment_rate": abandonment_rate
         },
         "customer_frequency": {
@@ -1415,16 +4702,50 @@ def get_dashboard_analytics(dep=Depends(verify_admin_api_key)):
         "no_show_rate": {
             "completed": 100 - abandonment_rate,
             "cancelled": abandonment_rate
-        }
+        },
+        "occupancy": {
+            "occupied": floor["occupied"],
+            "total_tables": floor["total_tables"],
+            "waiting": floor["waiting"],
+            "waitlist": floor["waitlist"],
+            "rate": round(floor["occupied"] / floor["total_tables"] * 100, 1) if floor["total_tables"] else 0
+        },
+        "peak_hours": {
+            "arrivals": profile["arrivals"],
+            "avg_waits": profile["avg_waits"]
+        },
+        "generated_at": now.isoformat()
     }
 
+@app.get("/admin/dashboard/bundle")
+@cached_response
+def get_dashboard_bundle(range: Optional[str] = Query(None), dep=Depends(require_permission("dashboard"))):
+    """All dashboard KPIs in one response; range (1d, 7d, 30d, 90d, 1y) limits the historical figures"""
+    db = SessionLocal()
+    try:
+        start_date, end_date = analytics_date_range(range) if range else (None, None)
+        return dashboard_bundle(db, start_date, end_date)
+    finally:
+        db.close()
+
+@app.get("/admin/dashboard/analytics")
+@cached_response
+def get_dashboard_analytics(dep=Depends(require_permission("dashboard"))):
+    """Get comprehensive dashboard analytics"""
+    db = SessionLocal()
+    try:
+        bundle = dashboard_bundle(db)
+    finally:
+        db.close()
+    return {key: bundle[key] for key in ("kpis", "customer_frequency", "no_show_rate")}
+
 # User Management Endpoints
 @app.post("/admin/users", response_model=UserOut)
-async def create_user(user_data: UserCreate, x_api_key: str = Depends(verify_admin_api_key)):
+def create_user(user_data: UserCreate, principal: SessionPrincipal = Depends(require_permission("user_management"))):
     db = SessionLocal()
     try:
         # Check if username already exists
-        existing_user = db.query(AdminUser).filter(AdminUser.username == user_data.username).first()
+        existing_user = db.execute(select(AdminUser).where(AdminUser.username == user_data.username)).scalars().first()
         if existing_user:
             raise HTTPException(status_code=400, detail="Username already exists")
         
@@ -1458,10 +4779,9 @@ async def create_user(user_data: UserCreate, x_api_key: str = Depends(verify_adm
         db.close()
 
 @app.get("/admin/users", response_model=List[UserOut])
-async def list_users(x_api_key: str = Depends(verify_admin_api_key)):
-    db = SessionLocal()
-    try:
-        users = db.query(AdminUser).all()
+async def list_users(principal: SessionPrincipal = Depends(require_permission("user_management"))):
+    async with async_session() as db:
+        users = (await db.execute(select(AdminUser))).scalars().all()
         return [UserOut(
             id=user.id,
             username=user.username,
@@ -1472,24 +4792,22 @@ async def list_users(x_api_key: str = Depends(verify_admin_api_key)):
             created_at=user.created_at,
             created_by_admin_id=user.created_by_admin_id
         ) for user in users]
-    finally:
-        db.close()
 
 @app.put("/admin/users/{user_id}", response_model=UserOut)
-async def update_user(user_id: int, user_data: UserUpdate, x_api_key: str = Depends(verify_admin_api_key)):
+def update_user(user_id: int, user_data: UserUpdate, principal: SessionPrincipal = Depends(require_permission("user_management"))):
     db = SessionLocal()
     try:
-        user = db.query(AdminUser).filter(AdminUser.id == user_id).first()
+        user = db.execute(select(AdminUser).where(AdminUser.id == user_id)).scalars().first()
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
         
         # Update fields if provided
         if user_data.username is not None:
             # Check if new username already exists (but not for the same user)
-            existing = db.query(AdminUser).filter(
+            existing = db.execute(select(AdminUser).where(
                 AdminUser.username == user_data.username,
                 AdminUser.id != user_id
-            ).first()
+            )).scalars().first()
             if existing:
                 raise HTTPException(status_code=400, detail="Username already exists")
             user.username = user_data.username
@@ -1504,6 +4822,9 @@ async def update_user(user_id: int, user_data: UserUpdate, x_api_key: str = Depe
             user.full_name = user_data.full_name
         if user_data.is_active is not None:
             user.is_active = user_data.is_active
+        if user_data.password is not None or user_data.role is not None or user_data.is_active is not None:
+            # Existing sessions carry the old role/permissions; make the user log in again
+            user.tokens_valid_after = dt.datetime.now()
         
         db.commit()
         db.refresh(user)
@@ -1522,10 +4843,10 @@ async def update_user(user_id: int, user_data: UserUpdate, x_api_key: str = Depe
         db.close()
 
 @app.delete("/admin/users/{user_id}")
-async def delete_user(user_id: int, x_api_key: str = Depends(verify_admin_api_key)):
+def delete_user(user_id: int, principal: SessionPrincipal = Depends(require_permission("user_management"))):
     db = SessionLocal()
     try:
-        user = db.query(AdminUser).filter(AdminUser.id == user_id).first()
+        user = db.execute(select(AdminUser).where(AdminUser.id == user_id)).scalars().first()
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
         
@@ -1540,10 +4861,28 @@ async def delete_user(user_id: int, x_api_key: str = Depends(verify_admin_api_ke
 LOGO_UPLOAD_DIR = Path("uploads/logos")
 LOGO_UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 
+def _store_logo_file(source, file_path: Path):
+    with open(file_path, "wb") as buffer:
+        shutil.copyfileobj(source, buffer)
+    
+    # Remove old logo files (keep only the latest)
+    for old_file in LOGO_UPLOAD_DIR.glob("restaurant_logo_*"):
+        if old_file.name != file_path.name:
+            try:
+                old_file.unlink()
+            except:
+                pass  # Ignore errors when deleting old files
+
+def _latest_logo_file():
+    logo_files = list(LOGO_UPLOAD_DIR.glob("restaurant_logo_*"))
+    if not logo_files:
+        return None
+    return max(logo_files, key=lambda x: x.stat().st_mtime)
+
 @app.post("/admin/upload-logo")
 async def upload_restaurant_logo(
     logo: UploadFile = File(...),
-    x_api_key: str = Depends(verify_admin_api_key)
+    principal: SessionPrincipal = Depends(require_permission("settings"))
 ):
     """Upload restaurant logo - Admin only"""
     try:
@@ -1573,17 +4912,8 @@ async def upload_restaurant_logo(
         filename = f"restaurant_logo_{timestamp}.{file_extension}"
         file_path = LOGO_UPLOAD_DIR / filename
         
-        # Save the file
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(logo.file, buffer)
-        
-        # Remove old logo files (keep only the latest)
-        for old_file in LOGO_UPLOAD_DIR.glob("restaurant_logo_*"):
-            if old_file.name != filename:
-                try:
-                    old_file.unlink()
-                except:
-                    pass  # Ignore errors when deleting old files
+        # Disk I/O runs in the threadpool, not on the event loop
+        await run_in_threadpool(_store_logo_file, logo.file, file_path)
         
         return {
             "message": "Logo uploaded successfully",
@@ -1613,13 +4943,10 @@ async def get_current_logo():
     """Get the current restaurant logo URL"""
     try:
         # Find the most recent logo file
-        logo_files = list(LOGO_UPLOAD_DIR.glob("restaurant_logo_*"))
-        if not logo_files:
+        latest_logo = await run_in_threadpool(_latest_logo_file)
+        if latest_logo is None:
             return {"logo_url": None, "has_logo": False}
         
-        # Get the most recent file
-        latest_logo = max(logo_files, key=lambda x: x.stat().st_mtime)
-        
         return {
             "logo_url": f"/admin/logo/{latest_logo.name}",
             "filename": latest_logo.name,
@@ -1630,7 +4957,7 @@ async def get_current_logo():
 
 # Operating Hours Management
 @app.get("/admin/operating-hours", response_model=List[OperatingHoursOut])
-def admin_get_operating_hours(dep=Depends(verify_admin_api_key)):
+def admin_get_operating_hours(dep=Depends(require_permission("booking"))):
     """Get all operating hours"""
     db = SessionLocal()
     try:
@@ -1652,7 +4979,7 @@ def admin_get_operating_hours(dep=Depends(verify_admin_api_key)):
         db.close()
 
 @app.post("/admin/operating-hours", response_model=OperatingHoursOut)
-def admin_create_operating_hours(hours: OperatingHoursCreate, dep=Depends(verify_admin_only_api_key)):
+def admin_create_operating_hours(hours: OperatingHoursCreate, dep=Depends(require_permission("settings"))):
     """Create or update operating hours for a day"""
     db = SessionLocal()
     try:
@@ -1692,7 +5019,7 @@ def admin_create_operating_hours(hours: OperatingHoursCreate, dep=Depends(verify
         db.close()
 
 @app.put("/admin/operating-hours/{day_of_week}")
-def admin_update_operating_hours(day_of_week: int, update: OperatingHoursUpdate, dep=Depends(verify_admin_only_api_key)):
+def admin_update_operating_hours(day_of_week: int, update: OperatingHoursUpdate, dep=Depends(require_permission("settings"))):
     """Update operating hours for a specific day"""
     db = SessionLocal()
     try:
@@ -1714,7 +5041,7 @@ def admin_update_operating_hours(day_of_week: int, update: OperatingHoursUpdate,
 
 # Holiday Management
 @app.get("/admin/holidays", response_model=List[HolidayOut])
-def admin_get_holidays(dep=Depends(verify_admin_api_key)):
+def admin_get_holidays(dep=Depends(require_permission("booking"))):
     """Get all holidays"""
     db = SessionLocal()
     try:
@@ -1724,7 +5051,7 @@ def admin_get_holidays(dep=Depends(verify_admin_api_key)):
         db.close()
 
 @app.post("/admin/holidays", response_model=HolidayOut)
-def admin_create_holiday(holiday: HolidayCreate, dep=Depends(verify_admin_only_api_key)):
+def admin_create_holiday(holiday: HolidayCreate, dep=Depends(require_permission("settings"))):
     """Create a new holiday"""
     db = SessionLocal()
     try:
@@ -1742,7 +5069,7 @@ def admin_create_holiday(holiday: HolidayCreate, dep=Depends(verify_admin_only_a
         db.close()
 
 @app.put("/admin/holidays/{holiday_id}")
-def admin_update_holiday(holiday_id: int, update: HolidayUpdate, dep=Depends(verify_admin_only_api_key)):
+def admin_update_holiday(holiday_id: int, update: HolidayUpdate, dep=Depends(require_permission("settings"))):
     """Update a holiday"""
     db = SessionLocal()
     try:
@@ -1763,7 +5090,7 @@ def admin_update_holiday(holiday_id: int, update: HolidayUpdate, dep=Depends(ver
         db.close()
 
 @app.delete("/admin/holidays/{holiday_id}")
-def admin_delete_holiday(holiday_id: int, dep=Depends(verify_admin_only_api_key)):
+def admin_delete_holiday(holiday_id: int, dep=Depends(require_permission("settings"))):
     """Delete a holiday"""
     db = SessionLocal()
     try:
@@ -1779,7 +5106,7 @@ def admin_delete_holiday(holiday_id: int, dep=Depends(verify_admin_only_api_key)
 
 # Check if restaurant is open
 @app.get("/admin/is-open")
-def admin_check_if_open(dep=Depends(verify_admin_api_key)):
+def admin_check_if_open(dep=Depends(require_permission("booking"))):
     """Check if restaurant is currently open"""
     db = SessionLocal()
     try:
@@ -1828,48 +5155,79 @@ def admin_check_if_open(dep=Depends(verify_admin_api_key)):
         db.close()
 
 # Enhanced Analytics Endpoints for Intelligent Reports
+def analytics_date_range(range: str):
+    """Translate a range code (1d, 7d, 30d, 90d, 1y) into (start, end) datetimes"""
+    end_date = dt.datetime.now()
+    if range == "1d":
+        start_date = end_date.replace(hour=0, minute=0, second=0, microsecond=0)
+    elif range == "7d":
+        start_date = end_date - dt.timedelta(days=7)
+    elif range == "30d":
+        start_date = end_date - dt.timedelta(days=30)
+    elif range == "90d":
+        start_date = end_date - dt.timedelta(days=90)
+    elif range == "1y":
+        start_date = end_date - dt.timedelta(days=365)
+    else:
+        start_date = end_date - dt.timedelta(days=7)
+    return start_date, end_date
+
+@app.get("/admin/analytics/metrics")
+@cached_response
+def analytics_metrics(
+    metric: str = Query("count"),
+    bucket: str = Query("day"),
+    start: Optional[dt.datetime] = Query(None),
+    end: Optional[dt.datetime] = Query(None),
+    source: str = Query("reservations"),
+    dep=Depends(require_permission("dashboard"))
+):
+    """Time series of comma-separated metrics (count, guests, avg_group_size, wait, served, no_shows,
+    revenue) per hour, day, week or month; defaults to the last 7 days"""
+    if source not in ("reservations", "waitlist"):
+        raise HTTPException(status_code=400, detail="source must be 'reservations' or 'waitlist'")
+    metrics = [name.strip() for name in metric.split(",") if name.strip()]
+    if not metrics:
+        raise HTTPException(status_code=400, detail="metric must name at least one metric")
+    # Rollups are bucketed by naive local time; an offset in the query is converted to it
+    start, end = (
+        moment.astimezone().replace(tzinfo=None) if moment and moment.tzinfo else moment
+        for moment in (start, end)
+    )
+    end = end or dt.datetime.now()
+    start = start or end - dt.timedelta(days=7)
+    db = SessionLocal()
+    try:
+        result = metric_series(db, metrics, bucket, start, end, waitlist=source == "waitlist")
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    finally:
+        db.close()
+    return {"metrics": metrics, "bucket": bucket, "start": start, "end": end, "source": source, **result}
+
 @app.get("/admin/analytics/reservations")
-def analytics_reservations(range: str = Query("7d"), dep=Depends(verify_admin_api_key)):
+@cached_response
+def analytics_reservations(range: str = Query("7d"), dep=Depends(require_permission("dashboard"))):
     """Get comprehensive reservation analytics"""
     db = SessionLocal()
     try:
         # Calculate date range
-        end_date = dt.datetime.now()
-        if range == "1d":
-            start_date = end_date.replace(hour=0, minute=0, second=0, microsecond=0)
-        elif range == "7d":
-            start_date = end_date - dt.timedelta(days=7)
-        elif range == "30d":
-            start_date = end_date - dt.timedelta(days=30)
-        elif range == "90d":
-            start_date = end_date - dt.timedelta(days=90)
-        elif range == "1y":
-            start_date = end_date - dt.timedelta(days=365)
-        else:
-            start_date = end_date - dt.timedelta(days=7)
+        start_date, end_date = analytics_date_range(range)
         
-        # Get reservations in date range
-        reservations = db.query(Reservation).filter(
-            Reservation.created_at >= start_date,
-            Reservation.created_at <= end_date
-        ).all()
+        # Per-day totals from the hourly rollups
+        result = metric_series(db, ["count", "guests", "no_shows"], "day", start_date, end_date)
+        totals = result["totals"]
         
         # Calculate metrics
-        total_reservations = len(reservations)
-        total_guests = sum(r.adults + r.children for r in reservations)
-        no_shows = len([r for r in reservations if r.status == "No-show"])
-        no_show_rate = no_shows / total_reservations if total_reservations > 0 else 0
+        total_reservations = totals["count"]
+        total_guests = totals["guests"]
+        no_show_rate = totals["no_shows"] / total_reservations if total_reservations > 0 else 0
         
         # Daily data
-        daily_data = []
-        current_date = start_date.date()
-        while current_date <= end_date.date():
-            day_reservations = [r for r in reservations if r.created_at.date() == current_date]
-            daily_data.append({
-                "date": current_date.strftime("%Y-%m-%d"),
-                "count": len(day_reservations)
-            })
-            current_date += dt.timedelta(days=1)
+        daily_data = [
+            {"date": point["start"].strftime("%Y-%m-%d"), "count": point["count"]}
+            for point in result["series"]
+        ]
         
         return {
             "total_reservations": total_reservations,
@@ -1881,171 +5239,48 @@ def analytics_reservations(range: str = Query("7d"), dep=Depends(verify_admin_ap
         db.close()
 
 @app.get("/admin/analytics/customer-frequency")
-def analytics_customer_frequency(range: str = Query("7d"), dep=Depends(verify_admin_api_key)):
-    """Get customer analytics"""
-    db = SessionLocal()
-    try:
-        # Calculate date range
-        end_date = dt.datetime.now()
-        if range == "1d":
-            start_date = end_date.replace(hour=0, minute=0, second=0, microsecond=0)
-        elif range == "7d":
-            start_date = end_date - dt.timedelta(days=7)
-        elif range == "30d":
-            start_date = end_date - dt.timedelta(days=30)
-        elif range == "90d":
-            start_date = end_date - dt.timedelta(days=90)
-        elif range == "1y":
-            start_date = end_date - dt.timedelta(days=365)
-        else:
-            start_date = end_date - dt.timedelta(days=7)
-        
-        # Get all customers
-        all_customers = db.query(Customer).all()
-        total_customers = len(all_customers)
-        
-        # Count repeat customers (more than 1 reservation)
-        repeat_customers = 0
-        new_customers = 0
-        
-        for customer in all_customers:
-            reservation_count = db.query(Reservation).filter(
-                Reservation.customer_id == customer.id
-            ).count()
-            
-            if reservation_count > 1:
-                repeat_customers += 1
-            elif reservation_count == 1:
-                new_customers += 1
-        
-        # Customer types distribution
-        customer_types = [
-            {"type": "New Customers", "count": new_customers},
-            {"type": "Repeat Customers", "count": repeat_customers},
-            {"type": "VIP Customers", "count": repeat_customers // 3}  # Mock VIP calculation
-        ]
-        
-        return {
-            "total_customers": total_customers,
-            "new_customers": new_customers,
-            "repeat_customers": repeat_customers,
-            "customer_types": customer_types
-        }
-    finally:
-        db.close()
+@cached_response
+def analytics_customer_frequency(range: Optional[str] = Query(None), dep=Depends(require_permission("dashboard"))):
+    """New vs repeat customers, over all time unless range (1d, 7d, 30d, 90d, 1y) is given"""
+    start_date, end_date = analytics_date_range(range) if range else (None, None)
+    buckets = customer_frequency_buckets(start_date, end_date)
+    return {"new": buckets["new"], "repeat": buckets["repeat"]}
 
 @app.get("/admin/analytics/table-utilization")
-def analytics_table_utilization(range: str = Query("7d"), dep=Depends(verify_admin_api_key)):
-    """Get table utilization analytics"""
+@cached_response
+def analytics_table_utilization(range: Optional[str] = Query(None), dep=Depends(require_permission("dashboard"))):
+    """Per table: reservations and seated or completed ones, over all time unless range (1d, 7d, 30d, 90d, 1y) is given"""
+    start_date, end_date = analytics_date_range(range) if range else (None, None)
     db = SessionLocal()
     try:
-        # Calculate date range
-        end_date = dt.datetime.now()
-        if range == "1d":
-            start_date = end_date.replace(hour=0, minute=0, second=0, microsecond=0)
-        elif range == "7d":
-            start_date = end_date - dt.timedelta(days=7)
-        elif range == "30d":
-            start_date = end_date - dt.timedelta(days=30)
-        elif range == "90d":
-            start_date = end_date - dt.timedelta(days=90)
-        elif range == "1y":
-            start_date = end_date - dt.timedelta(days=365)
-        else:
-            start_date = end_date - dt.timedelta(days=7)
-        
-        # Get all tables
         tables = db.query(Table).all()
-        total_tables = len(tables)
-        
-        table_data = []
-        total_utilization = 0
-        
-        for table in tables:
-            # Count total reservations for this table
-            total_reservations = db.query(Reservation).filter(
-                Reservation.table_id == table.id,
-                Reservation.created_at >= start_date,
-                Reservation.created_at <= end_date
-            ).count()
-            
-            # Count occupied time (seated or completed reservations)
-            occupied_reservations = db.query(Reservation).filter(
-                Reservation.table_id == table.id,
-                Reservation.status.in_(["Seated", "Completed"]),
-                Reservation.created_at >= start_date,
-                Reservation.created_at <= end_date
-            ).count()
-            
-            # Calculate utilization rate
-            utilization = occupied_reservations / max(total_reservations, 1)
-            total_utilization += utilization
-            
-            table_data.append({
-                "table_number": table.table_number,
-                "utilization": utilization,
-                "total_reservations": total_reservations,
-                "occupied_reservations": occupied_reservations
-            })
-        
-        average_utilization = total_utilization / total_tables if total_tables > 0 else 0
-        peak_utilization = max([t["utilization"] for t in table_data]) if table_data else 0
-        lowest_utilization = min([t["utilization"] for t in table_data]) if table_data else 0
-        
-        return {
-            "total_tables": total_tables,
-            "average_utilization": average_utilization,
-            "peak_utilization": peak_utilization,
-            "lowest_utilization": lowest_utilization,
-            "table_data": table_data
-        }
     finally:
         db.close()
+    totals, occupied = table_reservation_counts(tables, ["Seated", "Completed"], start_date, end_date)
+    return [
+        {"table_number": t.table_number, "total": int(totals[t.id]), "occupied": int(occupied[t.id])}
+        for t in tables
+    ]
 
 @app.get("/admin/analytics/revenue")
-def analytics_revenue(range: str = Query("7d"), dep=Depends(verify_admin_api_key)):
+@cached_response
+def analytics_revenue(range: str = Query("7d"), dep=Depends(require_permission("dashboard"))):
     """Get revenue analytics (simulated)"""
     db = SessionLocal()
     try:
         # Calculate date range
-        end_date = dt.datetime.now()
-        if range == "1d":
-            start_date = end_date.replace(hour=0, minute=0, second=0, microsecond=0)
-        elif range == "7d":
-            start_date = end_date - dt.timedelta(days=7)
-        elif range == "30d":
-            start_date = end_date - dt.timedelta(days=30)
-        elif range == "90d":
-            start_date = end_date - dt.timedelta(days=90)
-        elif range == "1y":
-            start_date = end_date - dt.timedelta(days=365)
-        else:
-            start_date = end_date - dt.timedelta(days=7)
-        
-        # Get reservations in date range
-        reservations = db.query(Reservation).filter(
-            Reservation.created_at >= start_date,
-            Reservation.created_at <= end_date,
-            Reservation.status.in_(["Completed", "Seated"])
-        ).all()
+        start_date, end_date = analytics_date_range(range)
         
-        # Simulate revenue based on party size and average check
-        daily_revenue = []
-        total_revenue = 0
-        current_date = start_date.date()
-        
-        while current_date <= end_date.date():
-            day_reservations = [r for r in reservations if r.created_at.date() == current_date]
-            day_revenue = sum((r.adults + r.children) * 25 for r in day_reservations)  # $25 per person average
-            total_revenue += day_revenue
-            
-            daily_revenue.append({
-                "date": current_date.strftime("%Y-%m-%d"),
-                "amount": day_revenue
-            })
-            current_date += dt.timedelta(days=1)
+        # Seated/completed parties per day, revenue at AVERAGE_CHECK_PER_GUEST per guest
+        result = metric_series(db, ["revenue", "served"], "day", start_date, end_date)
+        total_parties = result["totals"]["served"]
+        total_revenue = result["totals"]["revenue"]
+        daily_revenue = [
+            {"date": point["start"].strftime("%Y-%m-%d"), "amount": point["revenue"]}
+            for point in result["series"]
+        ]
         
-        average_check = total_revenue / len(reservations) if reservations else 0
+        average_check = total_revenue / total_parties if total_parties else 0
         revenue_growth = 0.15  # Mock 15% growth
         
         # Find best day
@@ -2063,121 +5298,43 @@ def analytics_revenue(range: str = Query("7d"), dep=Depends(verify_admin_api_key
         db.close()
 
 @app.get("/admin/analytics/peak-hours")
-def analytics_peak_hours(range: str = Query("7d"), dep=Depends(verify_admin_api_key)):
-    """Get peak hours analytics"""
+@cached_response
+def analytics_peak_hours(range: Optional[str] = Query(None), dep=Depends(require_permission("dashboard"))):
+    """Weekday x hour heatmaps and peak figures, over all time unless range (1d, 7d, 30d, 90d, 1y) is given"""
+    start_date, end_date = analytics_date_range(range) if range else (None, None)
     db = SessionLocal()
     try:
-        # Calculate date range
-        end_date = dt.datetime.now()
-        if range == "1d":
-            start_date = end_date.replace(hour=0, minute=0, second=0, microsecond=0)
-        elif range == "7d":
-            start_date = end_date - dt.timedelta(days=7)
-        elif range == "30d":
-            start_date = end_date - dt.timedelta(days=30)
-        elif range == "90d":
-            start_date = end_date - dt.timedelta(days=90)
-        elif range == "1y":
-            start_date = end_date - dt.timedelta(days=365)
-        else:
-            start_date = end_date - dt.timedelta(days=7)
-        
-        # Get reservations in date range
-        reservations = db.query(Reservation).filter(
-            Reservation.created_at >= start_date,
-            Reservation.created_at <= end_date
-        ).all()
-        
-        # Count reservations by hour
-        hour_counts = [0] * 24
-        for reservation in reservations:
-            if reservation.created_at:
-                hour = reservation.created_at.hour
-                hour_counts[hour] += 1
-        
-        # Create peak hours data
-        peak_hours = []
-        for hour in range(24):
-            if hour_counts[hour] > 0:
-                peak_hours.append({
-                    "hour": f"{hour:02d}",
-                    "count": hour_counts[hour]
-                })
-        
-        # Sort by count descending
-        peak_hours.sort(key=lambda x: x["count"], reverse=True)
-        
-        # Calculate average wait time (simulated)
-        average_wait_time = 15  # Mock 15 minutes
-        
-        # Find peak hour and day
-        peak_hour = peak_hours[0]["hour"] if peak_hours else "N/A"
-        peak_day = "Friday"  # Mock data
-        
-        return {
-            "peak_hours": peak_hours,
-            "average_wait_time": average_wait_time,
-            "peak_hour": peak_hour,
-            "peak_day": peak_day,
-            "busiest_period": "6:00 PM - 8:00 PM"  # Mock data
-        }
+        profile = peak_hour_profile(db, start_date, end_date)
     finally:
         db.close()
+    return {key: profile[key] for key in ("arrivals", "avg_waits", "peak_day", "peak_hour", "busiest_period", "average_wait_time")}
 
 @app.get("/admin/analytics/waitlist")
-def analytics_waitlist(range: str = Query("7d"), dep=Depends(verify_admin_api_key)):
+@cached_response
+def analytics_waitlist(range: str = Query("7d"), dep=Depends(require_permission("dashboard"))):
     """Get waitlist analytics"""
     db = SessionLocal()
     try:
         # Calculate date range
-        end_date = dt.datetime.now()
-        if range == "1d":
-            start_date = end_date.replace(hour=0, minute=0, second=0, microsecond=0)
-        elif range == "7d":
-            start_date = end_date - dt.timedelta(days=7)
-        elif range == "30d":
-            start_date = end_date - dt.timedelta(days=30)
-        elif range == "90d":
-            start_date = end_date - dt.timedelta(days=90)
-        elif range == "1y":
-            start_date = end_date - dt.timedelta(days=365)
-        else:
-            start_date = end_date - dt.timedelta(days=7)
+        start_date, end_date = analytics_date_range(range)
         
-        # Get waitlist entries in date range
-        waitlist_entries = db.query(WaitlistEntry).filter(
-            WaitlistEntry.created_at >= start_date,
-            WaitlistEntry.created_at <= end_date
-        ).all()
-        
-        total_entries = len(waitlist_entries)
+        # Per-day waitlist totals from the hourly rollups
+        result = metric_series(db, ["count", "served", "wait"], "day", start_date, end_date, waitlist=True)
+        totals = result["totals"]
+        total_entries = totals["count"]
         
         # Calculate conversion rate (seated entries)
-        seated_entries = len([w for w in waitlist_entries if w.status == "Seated"])
-        conversion_rate = seated_entries / total_entries if total_entries > 0 else 0
+        conversion_rate = totals["served"] / total_entries if total_entries > 0 else 0
         
         # Calculate average wait time
-        total_wait_time = 0
-        wait_time_count = 0
-        for entry in waitlist_entries:
-            if entry.seated_at and entry.created_at:
-                wait_time = (entry.seated_at - entry.created_at).total_seconds() / 60
-                total_wait_time += wait_time
-                wait_time_count += 1
-        
-        average_wait_time = total_wait_time / wait_time_count if wait_time_count > 0 else 0
+        average_wait_time = totals["wait"]
         peak_wait_time = 45  # Mock data
         
         # Daily waitlist trend
-        waitlist_trend = []
-        current_date = start_date.date()
-        while current_date <= end_date.date():
-            day_entries = [w for w in waitlist_entries if w.created_at.date() == current_date]
-            waitlist_trend.append({
-                "date": current_date.strftime("%Y-%m-%d"),
-                "count": len(day_entries)
-            })
-            current_date += dt.timedelta(days=1)
+        waitlist_trend = [
+            {"date": point["start"].strftime("%Y-%m-%d"), "count": point["count"]}
+            for point in result["series"]
+        ]
         
         return {
             "total_entries": total_entries,
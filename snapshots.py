@@ -0,0 +1,284 @@
+"""
+Columnar snapshot files for historical analytics.
+
+A dataset is a directory holding one raw column file per field plus meta.json:
+
+    <SNAPSHOT_DIR>/<dataset>/<column>.<generation>.col
+                                            fixed-width values, one per row, in row order
+    <SNAPSHOT_DIR>/<dataset>/meta.json      row count, generation, column types, string
+                                            dictionaries and the watermark (first day not
+                                            yet exported)
+
+Rows are appended a whole day at a time and in created_at order, and readers
+memory-map the column files read-only without copying or parsing. Column types:
+
+    datetime    datetime64[s], NaT for NULL
+    int16/int32/int64
+                signed integers, -1 for NULL
+    bool        NULL is False
+    category    uint16 codes into a per-column dictionary of strings (NULL is code 0)
+
+Several processes share a dataset. Writers hold an exclusive lock on
+<dataset>/lock (readers a shared one while mapping) and re-read meta.json first,
+so an append never works from another process's stale row count. meta.json is
+replaced atomically after the column files are written; bytes past the recorded
+row count (an append that crashed half way) are truncated away by the next
+append, and nobody maps them. Dropping rows (rewind, reset) never shrinks a
+file in place, which would fault other processes' maps: the kept rows are copied
+into the next generation's files and the old ones unlinked. fcntl locking is
+POSIX only; elsewhere only threads are serialized. NumPy is imported on first
+use (pip install numpy).
+
+    SNAPSHOT_DIR          where datasets live (default ./snapshots)
+"""
+import json
+import os
+import shutil
+import threading
+from contextlib import contextmanager
+from datetime import date
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", "./snapshots")
+
+NUMPY_TYPES = {
+    "datetime": "datetime64[s]",
+    "int16": "<i2",
+    "int32": "<i4",
+    "int64": "<i8",
+    "bool": "?",
+    "category": "<u2",
+}
+
+class ColumnStore:
+    """Append-only, memory-mapped column files for one dataset"""
+
+    def __init__(self, name: str, schema: dict, root: str = SNAPSHOT_DIR):
+        unknown = set(schema.values()) - set(NUMPY_TYPES)
+        if unknown:
+            raise ValueError(f"Unknown column types: {', '.join(sorted(unknown))}")
+        self.name = name
+        self.schema = dict(schema)
+        self.path = os.path.join(root, name)
+        self._lock = threading.Lock()
+        self._maps = None  # ((generation, rows), {column: array}) for the current meta
+        self._meta_stamp = None
+        self._meta = self._empty_meta()
+        self._reload()
+
+    def _empty_meta(self, generation: int = 0) -> dict:
+        return {
+            "rows": 0,
+            "generation": generation,
+            "watermark": None,
+            "schema": self.schema,
+            "dictionaries": {column: [None] for column, kind in self.schema.items() if kind == "category"},
+        }
+
+    def _read_meta(self) -> dict:
+        try:
+            with open(os.path.join(self.path, "meta.json")) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return self._empty_meta()
+        if meta.get("schema") != self.schema or "generation" not in meta:
+            # Written for other columns; start over rather than misread the files
+            return self._empty_meta()
+        return meta
+
+    def _reload(self):
+        """Pick up meta.json if it was replaced (by this or another process) since it was last read"""
+        try:
+            stat = os.stat(os.path.join(self.path, "meta.json"))
+            stamp = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            stamp = None
+        if stamp is None or stamp != self._meta_stamp:
+            self._meta = self._read_meta()
+            self._meta_stamp = stamp
+
+    def _write_meta(self, meta: dict):
+        tmp = os.path.join(self.path, "meta.json.tmp")
+        with open(tmp, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp, os.path.join(self.path, "meta.json"))
+        self._reload()
+
+    @contextmanager
+    def _locked(self, exclusive: bool):
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            os.makedirs(self.path, exist_ok=True)
+            with open(os.path.join(self.path, "lock"), "a") as f:
+                fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _column_file(self, column: str, generation: int) -> str:
+        return os.path.join(self.path, f"{column}.{generation}.col")
+
+    def _remove_generation(self, generation: int):
+        # Processes still mapping these files keep reading them until they reload
+        for column in self.schema:
+            try:
+                os.unlink(self._column_file(column, generation))
+            except OSError:
+                pass
+
+    @property
+    def rows(self) -> int:
+        with self._lock:
+            self._reload()
+            return self._meta["rows"]
+
+    @property
+    def watermark(self):
+        """First day whose rows are not in the snapshot, or None when nothing was exported yet"""
+        with self._lock:
+            self._reload()
+            return self._watermark(self._meta)
+
+    @staticmethod
+    def _watermark(meta: dict):
+        value = meta["watermark"]
+        return date.fromisoformat(value) if value else None
+
+    def dictionary(self, column: str) -> list:
+        return list(self._meta["dictionaries"][column])
+
+    def encode(self, rows, dictionaries: dict = None) -> dict:
+        """Column arrays for `rows` (tuples in schema order); new category values extend `dictionaries`"""
+        import numpy as np
+
+        if dictionaries is None:
+            with self._lock:
+                return self.encode(rows, self._meta["dictionaries"])
+        values = list(zip(*rows)) if rows else [()] * len(self.schema)
+        arrays = {}
+        for (column, kind), column_values in zip(self.schema.items(), values):
+            if kind == "datetime":
+                data = np.array([v if v is not None else "NaT" for v in column_values], dtype=NUMPY_TYPES[kind])
+            elif kind == "category":
+                dictionary = dictionaries[column]
+                index = {value: code for code, value in enumerate(dictionary)}
+                codes = []
+                for v in column_values:
+                    if v not in index:
+                        index[v] = len(dictionary)
+                        dictionary.append(v)
+                    codes.append(index[v])
+                data = np.array(codes, dtype=NUMPY_TYPES[kind])
+            elif kind == "bool":
+                data = np.array([bool(v) for v in column_values], dtype=NUMPY_TYPES[kind])
+            else:
+                data = np.array([v if v is not None else -1 for v in column_values], dtype=NUMPY_TYPES[kind])
+            arrays[column] = data
+        return arrays
+
+    def append(self, rows, watermark: date, previous: date = None) -> bool:
+        """Append rows (created_at order, from `previous` up to `watermark`) and advance the
+        watermark; returns False, appending nothing, if the watermark is no longer `previous`
+        (another process exported or rewound in the meantime)"""
+        import numpy as np
+
+        with self._locked(exclusive=True):
+            self._reload()
+            if self._watermark(self._meta) != previous:
+                return False
+            os.makedirs(self.path, exist_ok=True)
+            meta = json.loads(json.dumps(self._meta))
+            arrays = self.encode(rows, meta["dictionaries"])
+            for column, kind in self.schema.items():
+                with open(self._column_file(column, meta["generation"]), "ab") as f:
+                    f.truncate(meta["rows"] * np.dtype(NUMPY_TYPES[kind]).itemsize)
+                    f.write(arrays[column].tobytes())
+            meta["rows"] += len(rows)
+            meta["watermark"] = watermark.isoformat()
+            self._write_meta(meta)
+            return True
+
+    def rewind(self, day: date, column: str = "created_at") -> bool:
+        """Drop the rows whose `column` (the append order) is on or after `day` and move the
+        watermark back to `day`, so those days are exported again; False if nothing was dropped"""
+        import numpy as np
+
+        with self._locked(exclusive=True):
+            self._reload()
+            watermark = self._watermark(self._meta)
+            if watermark is None or day >= watermark:
+                return False
+            meta = json.loads(json.dumps(self._meta))
+            old = meta["generation"]
+            kept = 0
+            if meta["rows"]:
+                stamps = np.memmap(self._column_file(column, old), dtype=NUMPY_TYPES[self.schema[column]],
+                                   mode="r", shape=(meta["rows"],))
+                kept = int(stamps.searchsorted(np.datetime64(day, "s"), "left"))
+                del stamps
+            meta["generation"] = old + 1
+            for name, kind in self.schema.items():
+                with open(self._column_file(name, meta["generation"]), "wb") as target:
+                    if kept:
+                        with open(self._column_file(name, old), "rb") as source:
+                            shutil.copyfileobj(source, target)
+                        target.truncate(kept * np.dtype(NUMPY_TYPES[kind]).itemsize)
+            meta["rows"] = kept
+            meta["watermark"] = day.isoformat()
+            self._write_meta(meta)
+            self._remove_generation(old)
+            return True
+
+    def view(self):
+        """(watermark, {column: read-only array}, {column: dictionary}) over every exported row,
+        memory-mapped; the dictionaries are a copy matching the arrays, for encoding more rows"""
+        import numpy as np
+
+        with self._locked(exclusive=False):
+            self._reload()
+            key = (self._meta["generation"], self._meta["rows"])
+            if self._maps is None or self._maps[0] != key:
+                generation, rows = key
+                arrays = {}
+                for column, kind in self.schema.items():
+                    dtype = NUMPY_TYPES[kind]
+                    if rows:
+                        arrays[column] = np.memmap(self._column_file(column, generation), dtype=dtype, mode="r", shape=(rows,))
+                    else:
+                        arrays[column] = np.empty(0, dtype=dtype)
+                self._maps = (key, arrays)
+            dictionaries = {column: list(values) for column, values in self._meta["dictionaries"].items()}
+            return self._watermark(self._meta), self._maps[1], dictionaries
+
+    def reset(self):
+        """Drop every exported row (in every process sharing the dataset)"""
+        with self._locked(exclusive=True):
+            self._reload()
+            old = self._meta["generation"]
+            os.makedirs(self.path, exist_ok=True)
+            self._write_meta(self._empty_meta(old + 1))
+            self._remove_generation(old)
+
+    def status(self) -> dict:
+        with self._lock:
+            self._reload()
+            meta = self._meta
+        size = 0
+        for column in self.schema:
+            try:
+                size += os.path.getsize(self._column_file(column, meta["generation"]))
+            except OSError:
+                pass
+        return {
+            "rows": meta["rows"],
+            "watermark": meta["watermark"],
+            "columns": list(self.schema),
+            "bytes": size,
+        }
@@ -0,0 +1,27 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# models.py builds its engine and runs migrations at import time, so the
+# environment has to point at a scratch database before it is imported
+_scratch = tempfile.mkdtemp(prefix="restaurant-tests-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_scratch, 'restaurant.db')}")
+os.environ.setdefault("SNAPSHOT_DIR", os.path.join(_scratch, "snapshots"))
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+os.environ.setdefault("ALLOW_STATIC_API_KEYS", "1")
+os.environ.setdefault("CAMPAIGN_RUNNER", "0")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import models  # noqa: E402
+
+@pytest.fixture
+def client():
+    from fastapi.testclient import TestClient
+    # Not entered as a context manager: startup tasks (scheduler, resync loops) stay off
+    return TestClient(models.app)
+
+@pytest.fixture
+def admin_headers():
+    return {"x-api-key": models.ADMIN_API_KEY}
@@ -0,0 +1,58 @@
+"""Analytics endpoints keep their response shapes and cover all time unless a range is given"""
+import datetime as dt
+import itertools
+
+import models
+
+_phones = itertools.count(5560000)
+
+def seed_old_visit(days_ago: int = 60):
+    """A new customer whose only reservation was `days_ago` days ago"""
+    created_at = dt.datetime.now() - dt.timedelta(days=days_ago)
+    db = models.SessionLocal()
+    try:
+        customer = models.Customer(name="Old Visit", phone_number=str(next(_phones)))
+        db.add(models.Reservation(customer=customer, adults=2, children=0, status="Completed", queue_number=0,
+                                  location="Indoor", created_at=created_at))
+        db.commit()
+    finally:
+        db.close()
+
+def get(client, admin_headers, path: str):
+    response = client.get(path, headers=admin_headers)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+def test_customer_frequency(client, admin_headers):
+    before = get(client, admin_headers, "/admin/analytics/customer-frequency")
+    assert set(before) == {"new", "repeat"}
+    recent = get(client, admin_headers, "/admin/analytics/customer-frequency?range=7d")
+    seed_old_visit()
+    assert get(client, admin_headers, "/admin/analytics/customer-frequency")["new"] == before["new"] + 1
+    assert get(client, admin_headers, "/admin/analytics/customer-frequency?range=7d") == recent
+
+def test_peak_hours(client, admin_headers):
+    before = get(client, admin_headers, "/admin/analytics/peak-hours")
+    assert set(before) == {"arrivals", "avg_waits", "peak_day", "peak_hour", "busiest_period", "average_wait_time"}
+    recent = get(client, admin_headers, "/admin/analytics/peak-hours?range=7d")
+    seed_old_visit()
+    after = get(client, admin_headers, "/admin/analytics/peak-hours")
+    assert sum(map(sum, after["arrivals"])) == sum(map(sum, before["arrivals"])) + 1
+    assert get(client, admin_headers, "/admin/analytics/peak-hours?range=7d")["arrivals"] == recent["arrivals"]
+
+def test_table_utilization(client, admin_headers):
+    created_at = dt.datetime.now() - dt.timedelta(days=60)
+    db = models.SessionLocal()
+    try:
+        table = models.Table(table_number="Utilization-1", location="Utilization", size=4, is_occupied=False)
+        db.add(table)
+        for status in ("Completed", "Seated", "Cancelled"):
+            db.add(models.Reservation(table=table, adults=2, children=0, status=status, queue_number=0,
+                                      location="Utilization", created_at=created_at))
+        db.commit()
+    finally:
+        db.close()
+    rows = {row["table_number"]: row for row in get(client, admin_headers, "/admin/analytics/table-utilization")}
+    assert rows["Utilization-1"] == {"table_number": "Utilization-1", "total": 3, "occupied": 2}
+    rows = {row["table_number"]: row for row in get(client, admin_headers, "/admin/analytics/table-utilization?range=7d")}
+    assert rows["Utilization-1"] == {"table_number": "Utilization-1", "total": 0, "occupied": 0}
@@ -0,0 +1,45 @@
+"""Bulk import: a row the database rejects does not take its chunk down with it"""
+import pytest
+from sqlalchemy import func, select
+
+import models
+
+@pytest.fixture
+def reject_marked_reservations():
+    """Make the database itself refuse reservations whose notes say 'reject me'"""
+    with models.engine.begin() as connection:
+        connection.exec_driver_sql(
+            "CREATE TRIGGER reject_marked_reservations BEFORE INSERT ON reservations "
+            "WHEN NEW.notes = 'reject me' BEGIN SELECT RAISE(ABORT, 'rejected by the database'); END"
+        )
+    yield
+    with models.engine.begin() as connection:
+        connection.exec_driver_sql("DROP TRIGGER reject_marked_reservations")
+
+def count_customers(phones) -> int:
+    with models.engine.connect() as connection:
+        c = models.Customer.__table__.c
+        return connection.execute(select(func.count()).where(c.phone_number.in_(phones))).scalar()
+
+def test_rows_around_a_rejected_row_are_still_imported(client, admin_headers, reject_marked_reservations):
+    rows = [
+        "phone_number,name,adults,status,location,notes",
+        "5570001,Ana,2,Completed,Indoor,",
+        "5570002,Ben,4,Completed,Indoor,reject me",
+        "5570003,Cleo,,Completed,Indoor,",
+        "5570004,Dev,3,Cancelled,Outdoor,",
+    ]
+    response = client.post(
+        "/admin/import/reservations", headers=admin_headers,
+        files={"file": ("export.csv", "\n".join(rows).encode(), "text/csv")}
+    )
+    assert response.status_code == 200, response.text
+    summary = response.json()
+    assert (summary["processed"], summary["inserted"], summary["failed"]) == (4, 2, 2)
+    errors = {error["row"]: error["error"] for error in summary["errors"]}
+    assert set(errors) == {2, 3}
+    assert "rejected by the database" in errors[2]
+    assert "adults" in errors[3]
+    # The rejected row's new customer went with it
+    assert summary["customers_created"] == 2
+    assert count_customers(["5570001", "5570002", "5570004"]) == 2
@@ -0,0 +1,47 @@
+"""Customer search ranks every match in the database before the limit"""
+import itertools
+
+import models
+
+_phones = itertools.count(5590000)
+
+def seed_customers(*names, email=None) -> list:
+    db = models.SessionLocal()
+    try:
+        customers = [models.Customer(name=name, phone_number=str(next(_phones)), email=email) for name in names]
+        db.add_all(customers)
+        db.commit()
+        return [(customer.id, customer.phone_number) for customer in customers]
+    finally:
+        db.close()
+
+def names(results) -> list:
+    return [result["name"] for result in results]
+
+def test_whole_words_then_prefixes_rank_ahead_of_many_substring_matches():
+    seed_customers(*(f"Aqzvb {i:02d}" for i in range(40)))
+    # Inserted last, so any cap on unranked candidates would miss them
+    seed_customers("Qzvlin Moss", "Ada Qzv")
+    results = models.search_customers("qzv", limit=5)
+    assert names(results)[:2] == ["Ada Qzv", "Qzvlin Moss"]
+    assert [result["score"] for result in results] == [2, 1, 0, 0, 0]
+    assert names(results)[2:] == ["Aqzvb 00", "Aqzvb 01", "Aqzvb 02"]
+
+def test_every_word_must_match_and_scores_add_up():
+    seed_customers("Vorn Peltz", "Vornaby Peltz", "Vorn Kell")
+    results = models.search_customers("vorn peltz")
+    assert [(result["name"], result["score"]) for result in results] == [("Vorn Peltz", 4), ("Vornaby Peltz", 3)]
+
+def test_name_punctuation_and_email_local_part_are_word_boundaries():
+    seed_customers("Mary-Jo Quillan", "Maryjo Quillan")
+    seed_customers("Jo Brandt", email="quillo.brandt@example.com")
+    results = models.search_customers("quill jo")
+    assert [(result["name"], result["score"]) for result in results] == [
+        ("Jo Brandt", 3), ("Mary-Jo Quillan", 3), ("Maryjo Quillan", 1)
+    ]
+
+def test_exact_phone_number_ranks_first():
+    (_, phone), = seed_customers("Phone Exact")
+    results = models.search_customers(f"({phone[:3]}) {phone[3:]}")
+    assert results[0]["phone_number"] == phone
+    assert results[0]["score"] == 2
@@ -0,0 +1,40 @@
+"""Polled read paths issue a fixed number of statements, however many rows they return"""
+import itertools
+
+import pytest
+
+import models
+
+_phones = itertools.count(5550000)
+
+def seed_customer(visits: int) -> int:
+    """A customer with `visits` queued reservations and waitlist entries; returns the customer id"""
+    db = models.SessionLocal()
+    try:
+        customer = models.Customer(name="Query Count", phone_number=str(next(_phones)))
+        db.add(customer)
+        for i in range(visits):
+            db.add(models.Reservation(customer=customer, adults=2, children=0, status="Queued",
+                                      queue_number=1000 + i, location="Indoor"))
+            db.add(models.WaitlistEntry(customer=customer, adults=2, children=0, location="Indoor", status="Waiting"))
+        db.commit()
+        return customer.id
+    finally:
+        db.close()
+
+QUERY_BUDGETS = [
+    ("/admin/queue", 1),
+    ("/admin/waitlist", 1),
+    ("/admin/reservations", 1),
+    ("/admin/customers/{customer_id}/reservations", 1),
+]
+
+@pytest.mark.parametrize("path, budget", QUERY_BUDGETS)
+def test_read_path_query_count(client, admin_headers, path, budget):
+    for visits in (1, 6):
+        customer_id = seed_customer(visits)
+        with models.count_queries() as counter:
+            response = client.get(path.format(customer_id=customer_id), headers=admin_headers)
+        assert response.status_code == 200, response.text
+        assert len(response.json()) >= visits
+        assert counter["count"] == budget, f"{path} issued {counter['count']} statements with {visits} rows"
@@ -0,0 +1,65 @@
+"""Per-day queue number counter"""
+import datetime as dt
+import itertools
+
+import models
+
+_days = itertools.count()
+
+def fresh_day() -> dt.date:
+    """A day no other test has issued numbers for"""
+    return dt.date(2100, 1, 1) + dt.timedelta(days=next(_days))
+
+def test_numbers_are_consecutive_and_restart_each_day():
+    first, second = fresh_day(), fresh_day()
+    db = models.SessionLocal()
+    try:
+        assert [models.queue_numbers.next(db, first) for _ in range(3)] == [1, 2, 3]
+        assert models.queue_numbers.next(db, second) == 1
+        assert models.queue_numbers.next(db, first) == 4
+        db.commit()
+    finally:
+        db.close()
+
+def test_rolled_back_number_is_issued_again():
+    day = fresh_day()
+    db = models.SessionLocal()
+    try:
+        assert models.queue_numbers.next(db, day) == 1
+        db.rollback()
+        assert models.queue_numbers.next(db, day) == 1
+        db.commit()
+    finally:
+        db.close()
+
+def test_first_number_of_the_day_follows_numbers_issued_before_the_counter():
+    day = fresh_day()
+    db = models.SessionLocal()
+    try:
+        db.add(models.Reservation(adults=2, children=0, status="Completed", queue_number=41, location="Indoor",
+                                  created_at=dt.datetime.combine(day, dt.time(12))))
+        db.commit()
+        assert models.queue_numbers.next(db, day) == 42
+        db.commit()
+    finally:
+        db.close()
+
+def test_block_mode_is_ignored_on_sqlite(capsys):
+    allocator = models.QueueNumberAllocator(models.engine, block_size=10)
+    assert allocator.block_size == 1
+    assert "ignored on SQLite" in capsys.readouterr().out
+
+def test_blocks_hand_out_unique_numbers_across_allocators():
+    day = fresh_day()
+    # Block mode is refused on SQLite at construction; force it to exercise the refill
+    # path, which is safe here because no caller transaction holds the write lock
+    allocators = [models.QueueNumberAllocator(models.engine), models.QueueNumberAllocator(models.engine)]
+    for allocator in allocators:
+        allocator.block_size = 3
+    db = models.SessionLocal()
+    try:
+        numbers = [allocator.next(db, day) for _ in range(4) for allocator in allocators]
+    finally:
+        db.close()
+    # Interleaved takes from blocks 1-3 and 4-6, then each refills with the next free block
+    assert numbers == [1, 4, 2, 5, 3, 6, 7, 10]
@@ -0,0 +1,50 @@
+"""Cached analytics responses: ETag revalidation and invalidation on writes"""
+from sqlalchemy import insert
+
+import models
+
+PATH = "/admin/analytics/no-show-rate"
+
+def add_cancelled_reservation():
+    db = models.SessionLocal()
+    try:
+        db.add(models.Reservation(adults=2, children=0, status="Cancelled", queue_number=0, location="Indoor"))
+        db.commit()
+    finally:
+        db.close()
+
+def test_matching_etag_is_answered_with_304(client, admin_headers):
+    first = client.get(PATH, headers=admin_headers)
+    assert first.status_code == 200
+    etag = first.headers["etag"]
+    before = models.response_cache.stats()
+    with models.count_queries() as counter:
+        response = client.get(PATH, headers={**admin_headers, "If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["etag"] == etag
+    assert counter["count"] == 0
+    assert models.response_cache.stats()["not_modified"] == before["not_modified"] + 1
+    # A different tag gets the body again
+    response = client.get(PATH, headers={**admin_headers, "If-None-Match": '"stale"'})
+    assert response.status_code == 200
+    assert response.json() == first.json()
+
+def test_committed_write_invalidates_the_cached_response(client, admin_headers):
+    first = client.get(PATH, headers=admin_headers)
+    add_cancelled_reservation()
+    response = client.get(PATH, headers={**admin_headers, "If-None-Match": first.headers["etag"]})
+    assert response.status_code == 200
+    assert response.headers["etag"] != first.headers["etag"]
+    assert response.json()["cancelled"] == first.json()["cancelled"] + 1
+
+def test_core_writes_invalidate_only_when_committed():
+    table = models.Table.__table__
+    values = {"table_number": "Cache-Core", "location": "Cache", "size": 2, "is_occupied": False}
+    generation = models.response_cache.stats()["generation"]
+    with models.engine.connect() as connection:
+        connection.execute(insert(table).values(**values))
+        connection.rollback()
+    assert models.response_cache.stats()["generation"] == generation
+    with models.engine.begin() as connection:
+        connection.execute(insert(table).values(**values))
+    assert models.response_cache.stats()["generation"] == generation + 1
@@ -0,0 +1,76 @@
+"""Signed session tokens: verification, expiry and revocation"""
+import datetime as dt
+import itertools
+import json
+
+import pytest
+
+import models
+
+_users = itertools.count()
+
+def create_user(client, admin_headers, role: str = "staff") -> tuple:
+    """A new admin user; returns (user id, username, password)"""
+    username, password = f"token-user-{next(_users)}", "correct horse"
+    response = client.post("/admin/users", headers=admin_headers,
+                           json={"username": username, "password": password, "role": role})
+    assert response.status_code == 200, response.text
+    return response.json()["id"], username, password
+
+def login(client, username: str, password: str) -> str:
+    response = client.post("/admin/login", json={"username": username, "password": password})
+    assert response.status_code == 200, response.text
+    return response.json()["api_key"]
+
+def test_token_round_trip_carries_the_role_permissions():
+    token, expires_at = models.issue_session_token(7, "alice", "staff")
+    claims = models.decode_session_token(token)
+    assert (claims["sub"], claims["usr"], claims["role"]) == (7, "alice", "staff")
+    assert claims["perm"] == models.ROLE_PERMISSIONS["staff"]
+    assert claims["exp"] == expires_at
+
+def test_tampered_token_is_rejected():
+    token, _ = models.issue_session_token(7, "alice", "staff")
+    payload, _, signature = token.partition(".")
+    claims = json.loads(models._b64decode(payload))
+    claims["role"], claims["perm"] = "admin", models.ROLE_PERMISSIONS["admin"]
+    forged = models._b64encode(json.dumps(claims).encode())
+    with pytest.raises(ValueError, match="Invalid"):
+        models.decode_session_token(f"{forged}.{signature}")
+    with pytest.raises(ValueError, match="Invalid"):
+        models.decode_session_token(payload)
+
+def test_expired_token_is_rejected():
+    issued = dt.datetime.now().timestamp() - models.SESSION_TOKEN_TTL_SECONDS - 1
+    token, _ = models.issue_session_token(7, "alice", "staff", now=issued)
+    with pytest.raises(ValueError, match="expired"):
+        models.decode_session_token(token)
+
+def test_token_authorizes_by_role(client, admin_headers):
+    _, username, password = create_user(client, admin_headers, role="staff")
+    headers = {"Authorization": f"Bearer {login(client, username, password)}"}
+    assert client.get("/admin/queue", headers=headers).status_code == 200
+    assert client.get("/admin/users", headers=headers).status_code == 403
+
+def test_changing_the_password_revokes_existing_tokens(client, admin_headers):
+    user_id, username, password = create_user(client, admin_headers)
+    token = login(client, username, password)
+    assert client.get("/admin/queue", headers={"x-api-key": token}).status_code == 200
+    response = client.put(f"/admin/users/{user_id}", headers=admin_headers, json={"password": "new password"})
+    assert response.status_code == 200, response.text
+    response = client.get("/admin/queue", headers={"x-api-key": token})
+    assert response.status_code == 401
+    assert response.json()["detail"] == "Session revoked"
+    # A fresh login is issued after tokens_valid_after
+    token = login(client, username, "new password")
+    assert client.get("/admin/queue", headers={"x-api-key": token}).status_code == 200
+
+def test_deactivated_user_is_revoked_in_other_processes(client, admin_headers):
+    user_id, username, password = create_user(client, admin_headers)
+    token = login(client, username, password)
+    # Another worker's stamp reaches this process on its next refresh
+    elsewhere = models.SessionRevocations(refresh_seconds=0)
+    claims = models.decode_session_token(token)
+    assert not elsewhere.is_revoked(user_id, claims["iat"])
+    client.put(f"/admin/users/{user_id}", headers=admin_headers, json={"is_active": False})
+    assert elsewhere.is_revoked(user_id, claims["iat"])
@@ -0,0 +1,76 @@
+"""Scheduled reservations never double-book a table's turn"""
+import datetime as dt
+import itertools
+
+from sqlalchemy import insert
+
+import models
+
+_locations = itertools.count()
+DAY = dt.date(2099, 6, 1)
+
+def seed_tables(*sizes) -> tuple:
+    """Tables of the given sizes at a location of their own; returns (location, [table ids])"""
+    location = f"Slots-{next(_locations)}"
+    db = models.SessionLocal()
+    try:
+        tables = [
+            models.Table(table_number=f"{location}-{i}", location=location, size=size, is_occupied=False)
+            for i, size in enumerate(sizes)
+        ]
+        db.add_all(tables)
+        db.commit()
+        return location, [table.id for table in tables]
+    finally:
+        db.close()
+
+def book(location: str, reservation_time: str, party_size: int = 2):
+    """Book and commit a slot as the reservation endpoint does; returns the table id or None"""
+    db = models.SessionLocal()
+    try:
+        table = models.slot_book.book(db, DAY, reservation_time, location, party_size)
+        if table is None:
+            db.rollback()
+            return None
+        db.add(models.Reservation(adults=party_size, children=0, status="Queued", location=location,
+                                  table_id=table.id, is_scheduled=True, reservation_date=DAY,
+                                  reservation_time=reservation_time))
+        db.commit()
+        return table.id
+    finally:
+        db.close()
+
+def test_overlapping_turns_do_not_share_a_table():
+    location, (table_id,) = seed_tables(2)
+    assert book(location, "19:00") == table_id
+    assert book(location, "19:30") is None
+    assert book(location, "17:31") is None
+    # Back to back with the 90 minute turn is fine
+    assert book(location, "20:30") == table_id
+    assert book(location, "17:30") == table_id
+
+def test_booking_made_by_another_process_is_seen_despite_the_cache():
+    location, (first, second) = seed_tables(2, 2)
+    db = models.SessionLocal()
+    try:
+        # Warm this process's cache while both tables are free
+        assert models.slot_book.availability(db, DAY, "12:00", location, 2) == (first, 2)
+    finally:
+        db.close()
+    with models.engine.begin() as connection:
+        connection.execute(insert(models.Reservation.__table__).values(
+            adults=2, children=0, status="Queued", location=location, table_id=first,
+            is_scheduled=True, reservation_date=DAY, reservation_time="12:00", created_at=dt.datetime.now()
+        ))
+    assert book(location, "12:30") == second
+    assert book(location, "12:45") is None
+
+def test_rolled_back_hold_frees_the_slot():
+    location, (table_id,) = seed_tables(4)
+    db = models.SessionLocal()
+    try:
+        assert models.slot_book.book(db, DAY, "08:00", location, 3).id == table_id
+        db.rollback()
+    finally:
+        db.close()
+    assert book(location, "08:00", 3) == table_id
@@ -0,0 +1,76 @@
+"""Table allocation policies and claims against stale free lists"""
+import itertools
+
+from sqlalchemy import update
+
+import models
+
+_locations = itertools.count()
+
+def seed_tables(*sizes) -> tuple:
+    """Free tables of the given sizes at a location of their own; returns (location, [table ids])"""
+    location = f"Alloc-{next(_locations)}"
+    db = models.SessionLocal()
+    try:
+        tables = [
+            models.Table(table_number=f"{location}-{i}", location=location, size=size, is_occupied=False)
+            for i, size in enumerate(sizes)
+        ]
+        db.add_all(tables)
+        db.commit()
+        return location, [table.id for table in tables]
+    finally:
+        db.close()
+
+def choose(policy, sizes, party_size, child_seat_required=False):
+    candidates = sorted((size, i) for i, size in enumerate(sizes))
+    index = models.TABLE_ALLOCATION_POLICIES[policy](candidates, party_size, child_seat_required)
+    return None if index is None else candidates[index][0]
+
+def test_best_fit_takes_the_smallest_table_that_seats_the_party():
+    assert choose("best_fit", [8, 2, 4], 2) == 2
+    assert choose("best_fit", [8, 2, 4], 3) == 4
+    assert choose("best_fit", [2, 4], 5) is None
+
+def test_preserve_large_tables_holds_the_last_large_table_back():
+    # One free 8-top is held for parties that nearly fill it
+    assert choose("preserve_large_tables", [8], 2) is None
+    assert choose("preserve_large_tables", [8], 6) == 8
+    # With more than LARGE_TABLES_HELD free, a small party may take one
+    assert choose("preserve_large_tables", [8, 8], 2) == 8
+    # Small tables are unaffected
+    assert choose("preserve_large_tables", [8, 4], 3) == 4
+
+def test_child_seat_aware_keeps_a_spare_place_for_the_seat():
+    assert choose("child_seat_aware", [4, 5], 4, child_seat_required=True) == 5
+    assert choose("child_seat_aware", [4, 5], 4) == 4
+    # No table with a spare place: the exact fit, rather than turning the party away
+    assert choose("child_seat_aware", [4], 4, child_seat_required=True) == 4
+
+def test_allocate_retries_when_another_process_took_the_table():
+    location, (small, large) = seed_tables(2, 4)
+    db = models.SessionLocal()
+    try:
+        assert models.table_allocator.find(db, location, 2).id == small
+        # Claimed elsewhere: this process's free list still shows it
+        with models.engine.begin() as connection:
+            connection.execute(update(models.Table.__table__).where(models.Table.id == small).values(is_occupied=True))
+        table = models.table_allocator.allocate(db, location, 2)
+        assert table.id == large
+        db.commit()
+        assert models.table_allocator.allocate(db, location, 2) is None
+    finally:
+        db.close()
+
+def test_claim_is_released_when_the_session_closes_without_commit():
+    location, (table_id,) = seed_tables(4)
+    db = models.SessionLocal()
+    assert models.table_allocator.allocate(db, location, 3).id == table_id
+    db.close()
+    db = models.SessionLocal()
+    try:
+        assert db.get(models.Table, table_id).is_occupied is False
+        assert models.table_allocator.allocate(db, location, 3).id == table_id
+    finally:
+        db.rollback()
+        db.close()